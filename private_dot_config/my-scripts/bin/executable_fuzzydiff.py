@@ -1,89 +1,756 @@
 #!/usr/bin/env python3
+import argparse
 import re
 import subprocess
 import sys
 import os
+import array
+import bisect
+import codecs
+import contextlib
+import hashlib
+import itertools
+import marshal
+import queue
+import shlex
+import shutil
+import struct
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+HUNK_HEADER = re.compile(rb"@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# Combined diffs (merges) have one "-" range per parent and more "@"s.
+COMBINED_HUNK_HEADER = re.compile(rb"@@@+ (?:-\d+(?:,\d+)? )+\+(\d+)(?:,\d+)? @@@+")
+# How much of a file header is kept to preview binary files and renames.
+SECTION_PREVIEW_LINES = 16
 
-def parse_diff(lines, temp_dir):
+# What --search indexes: runs of letters, digits and underscores, lowercased.
+SEARCH_TOKEN = re.compile(rb"\w+")
+
+# Background delta processes pre-rendering previews.
+PRERENDER_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+# How often the pre-renderer looks for a new cursor position, in seconds.
+CURSOR_POLL_INTERVAL = 0.05
+# Hunks pre-rendered on either side of the cursor before all the others.
+PRERENDER_WINDOW = 128
+# What the pre-renderer keeps on disk per hunk: hash, position and length.
+PREVIEW_RECORD = struct.Struct("<16sQI")
+
+
+def diff_path(raw, strip_prefix=True):
+    """
+    The file name in a ---/+++ line: unquoted, without timestamp or a/ b/
+    prefix.  None for /dev/null.
+    """
+    raw = raw.rstrip(b"\r\n")
+    if raw.startswith(b'"'):
+        # git quotes unusual names C-style, e.g. "b/t\303\251st".
+        path = codecs.escape_decode(raw[1 : raw.rindex(b'"')])[0]
+    else:
+        # diff -u appends a tab and a timestamp.
+        path = raw.split(b"\t", 1)[0]
+    if path == b"/dev/null":
+        return None
+    if strip_prefix and path.startswith((b"a/", b"b/")):
+        path = path[2:]
+    return path
+
+
+def count_changes(header, block):
+    """(added, removed) lines of a hunk; (0, 0) for other sections."""
+    if header.startswith("@@@"):
+        # One +/- column per parent in a merge's combined diff.
+        columns = len(header) - len(header.lstrip("@")) - 1
+        added = removed = 0
+        for line in block[1:]:
+            marks = line[:columns]
+            if b"+" in marks:
+                added += 1
+            elif b"-" in marks:
+                removed += 1
+        return added, removed
+    if header.startswith("@@"):
+        data = b"".join(block)
+        return data.count(b"\n+"), data.count(b"\n-")
+    return 0, 0
+
+
+def parse_diff(lines, spool=None, on_hunk=None):
     """
-    Parse diff lines to extract diff hunks.
-    For each hunk, capture the entire hunk block and write it to a temporary file.
-    Returns a list of entries in the format:
-      "ID<TAB>filepath:line_number<TAB>HUNK_HEADER<TAB>TMPFILE"
+    Parse diff lines (bytes) to extract diff hunks.
+    Yields one entry per hunk as soon as the hunk is complete, in the format:
+      "ID<TAB>filepath:line_number<TAB>HUNK_HEADER<TAB>HASH<TAB>POSITION<TAB>LENGTH"
+    where HASH identifies the hunk's content, POSITION is the 1-based byte
+    offset of the hunk (as `tail -c +POSITION` expects) and LENGTH its size
+    in bytes.  With a spool file (opened in binary mode), hunks are appended
+    to it and positions point there; without one, they point into the input.
+    Binary files and renames without content changes get an entry for their
+    file header.
+    on_hunk, if given, is called as on_hunk(entry, added, removed) with the
+    number of added and removed lines before each entry is yielded.
+    Only the current hunk is kept in memory, so lines can be a live stream.
     """
-    entries = []
+    hunk_id = 0
+    offset = 0
+
+    # The file section being read.
     current_file = None
+    old_file = None
+    section_start = 0
+    section_lines = []
+    section_has_hunks = False
+    binary_line = None
+    rename_from = None
+    rename_to = None
+
+    # The hunk being read.
     hunk_block = []
+    hunk_start = 0
     hunk_start_line = None
     hunk_header = None
-    hunk_id = 0
+    combined = False
+    old_left = new_left = 0
 
-    # Patterns for file headers and hunk headers.
-    pattern_git_file = re.compile(r"^\+\+\+\s+(.*)")
-    pattern_index_file = re.compile(r"^Index:\s+(.*)")
-    pattern_hunk = re.compile(r"^@@\s+-\d+(?:,\d+)?\s+\+(\d+)")
-
-    def flush_hunk():
-        nonlocal hunk_block, hunk_id, hunk_header, hunk_start_line
-        if hunk_block and current_file and hunk_start_line is not None and hunk_header:
-            tmp_filepath = os.path.join(temp_dir, f"{hunk_id}.txt")
-            with open(tmp_filepath, "w", encoding="utf-8") as hf:
-                hf.write("\n".join(hunk_block))
-            # Build an entry with four fields: ID, "filepath:line", hunk header, and the tmp file path.
-            entry = f"{hunk_id}\t{current_file}:{hunk_start_line}\t{hunk_header}\t{tmp_filepath}"
-            entries.append(entry)
-            hunk_block.clear()
-            hunk_header = None
-            hunk_start_line = None
-            hunk_id += 1
+    def make_entry(path, line_number, header, block, start):
+        nonlocal hunk_id
+        data = b"".join(block)
+        if data.endswith(b"\n"):
+            data = data[:-1]
+        if spool is not None:
+            start = spool.tell()
+            # Newline-separated, so a file's hunks also read as one diff.
+            spool.write(data + b"\n")
+            # The preview may read the hunk as soon as fzf gets the entry.
+            spool.flush()
+        digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+        path = path.decode("utf-8", "surrogateescape")
+        header = header.rstrip(b"\r\n").decode("utf-8", "surrogateescape")
+        # Build an entry with six fields: ID, "filepath:line", hunk header,
+        # content hash, and where the hunk is.
+        entry = f"{hunk_id}\t{path}:{line_number}\t{header}\t{digest}\t{start + 1}\t{len(data)}"
+        hunk_id += 1
+        if on_hunk is not None:
+            on_hunk(entry, *count_changes(header, block))
+        return entry
+
+    def flush_section():
+        """Entry for a file section that changed without any hunk."""
+        if section_has_hunks or not section_lines:
+            return None
+        path = rename_to or current_file
+        if path is None:
+            return None
+        if binary_line is not None:
+            header = binary_line
+        elif rename_from is not None and rename_to is not None:
+            header = b"rename " + rename_from + b" => " + rename_to
+        else:
+            return None
+        return make_entry(path, 1, header, section_lines, section_start)
 
     for line in lines:
-        line = line.rstrip("\n")
+        position = offset
+        offset += len(line)
+        first = line[:1]
 
-        # Detect file header lines.
-        if line.startswith("+++ ") or line.startswith("Index: "):
-            flush_hunk()
-            m = pattern_git_file.match(line)
-            if m:
-                current_file = m.group(1)
-                # Remove any leading "a/" or "b/"
-                if current_file.startswith("a/") or current_file.startswith("b/"):
-                    current_file = current_file[2:]
-                continue
-            m = pattern_index_file.match(line)
-            if m:
-                current_file = m.group(1)
+        if hunk_header is not None:
+            # Cheap prefix checks first: nearly every line is hunk content.
+            if combined:
+                if first in (b" ", b"+", b"-", b"\\") and line[:5] != b"diff ":
+                    hunk_block.append(line)
+                    continue
+            elif old_left or new_left:
+                if first == b" " or line in (b"\n", b"\r\n"):
+                    old_left -= 1
+                    new_left -= 1
+                    hunk_block.append(line)
+                    continue
+                if first == b"-":
+                    old_left -= 1
+                    hunk_block.append(line)
+                    continue
+                if first == b"+":
+                    new_left -= 1
+                    hunk_block.append(line)
+                    continue
+                if first == b"\\":
+                    hunk_block.append(line)
+                    continue
+            elif first == b"\\":
+                # "\ No newline at end of file" after the last line.
+                hunk_block.append(line)
                 continue
+            if current_file is not None:
+                yield make_entry(
+                    current_file, hunk_start_line, hunk_header, hunk_block, hunk_start
+                )
+            hunk_block = []
+            hunk_header = None
 
-        # Detect hunk header lines.
-        m = pattern_hunk.match(line)
-        if m:
-            flush_hunk()
-            hunk_start_line = m.group(1)
+        if first == b"@":
+            m = HUNK_HEADER.match(line)
+            if m:
+                combined = False
+                old_left = int(m.group(1) or 1)
+                new_left = int(m.group(3) or 1)
+                hunk_start_line = int(m.group(2))
+            else:
+                m = COMBINED_HUNK_HEADER.match(line)
+                if not m:
+                    continue
+                combined = True
+                hunk_start_line = int(m.group(1))
             hunk_header = line
-            hunk_block.append(line)
+            hunk_start = position
+            hunk_block = [line]
+            section_has_hunks = True
             continue
 
-        # Append lines if inside a hunk.
-        if hunk_block:
-            hunk_block.append(line)
+        if line.startswith((b"diff ", b"Index: ")):
+            entry = flush_section()
+            if entry:
+                yield entry
+            current_file = old_file = binary_line = rename_from = rename_to = None
+            section_start = position
+            section_lines = []
+            section_has_hunks = False
+            if line.startswith(b"Index: "):
+                current_file = line[7:].rstrip(b"\r\n")
+            elif line.startswith((b"diff --cc ", b"diff --combined ")):
+                current_file = diff_path(line.split(b" ", 2)[2], False)
+            elif line.startswith(b"diff --git "):
+                # Only a guess, for binary files; ---/+++ lines are exact.
+                _, _, new = line[11:].rpartition(b" b/")
+                current_file = diff_path(new) if new else None
+        elif line.startswith(b"--- "):
+            old_file = diff_path(line[4:])
+        elif line.startswith(b"+++ "):
+            current_file = diff_path(line[4:]) or old_file
+        elif line.startswith((b"Binary files ", b"GIT binary patch")):
+            binary_line = line.rstrip(b"\r\n")
+        elif line.startswith((b"rename from ", b"copy from ")):
+            rename_from = diff_path(line.split(b" ", 2)[2], False)
+        elif line.startswith((b"rename to ", b"copy to ")):
+            rename_to = diff_path(line.split(b" ", 2)[2], False)
+
+        # File headers are short, but a binary patch can go on for a while.
+        if binary_line is None or len(section_lines) < SECTION_PREVIEW_LINES:
+            section_lines.append(line)
 
-    flush_hunk()
-    return entries
+    if hunk_header is not None and current_file is not None:
+        yield make_entry(
+            current_file, hunk_start_line, hunk_header, hunk_block, hunk_start
+        )
+    entry = flush_section()
+    if entry:
+        yield entry
 
 
-def fuzzy_select(entries):
+class PreviewCache:
     """
-    Uses fzf to let the user select one entry from the list.
-    The preview window shows the contents of the temporary file (i.e. the diff hunk).
-    Returns the selected entry string.
+    Pre-renders hunks with delta in the background.
+
+    The fzf preview command records the hunk under the cursor and the preview
+    width in a cursor file and prints a cached rendering when there is one.
+    Here, worker threads render hunks at that width, nearest to the cursor
+    first up to PRERENDER_WINDOW hunks away, then all the others front to
+    back with half the workers, so a moved cursor never waits long for one.
+    Renderings are files named after the hunk's content hash and the width,
+    so identical hunks share one.
+    Hunks are recorded in a file of fixed-size records rather than in memory,
+    and not at all when delta is missing.
+    """
+
+    def __init__(self, hunks_path, cache_dir):
+        # The file that entry positions point into: the spool or the input.
+        self.hunks_path = hunks_path
+        self.cache_dir = cache_dir
+        self.cursor_path = os.path.join(cache_dir, "cursor")
+        self.renderer = shutil.which("delta")
+        self.records_fd = None
+        if self.renderer is not None:
+            self.records_fd = os.open(
+                os.path.join(cache_dir, "records"),
+                os.O_RDWR | os.O_CREAT | os.O_TRUNC,
+                0o600,
+            )
+        self.count = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=PRERENDER_WORKERS)
+        self.thread = threading.Thread(target=self.schedule, daemon=True)
+
+    def preview_command(self):
+        """Shell command for fzf's --preview, with placeholders for the entry."""
+        cache_dir = shlex.quote(self.cache_dir)
+        hunks_path = shlex.quote(self.hunks_path)
+        # Fields are counted from the end since a hunk header may contain tabs.
+        return (
+            "w=${FZF_PREVIEW_COLUMNS:-$COLUMNS}; "
+            f"printf '%s %s\\n' {{1}} \"$w\" > {cache_dir}/cursor; "
+            f"f={cache_dir}/{{-3}}-$w; "
+            'if [ -s "$f" ]; then cat "$f"; '
+            f"else tail -c +{{-2}} {hunks_path} | head -c {{-1}} | delta --width=$w; fi"
+        )
+
+    def add(self, entry):
+        """Register an entry produced by parse_diff; returns it unchanged."""
+        if self.records_fd is None:
+            return entry
+        digest, position, length = entry.rsplit("\t", 3)[1:]
+        record = PREVIEW_RECORD.pack(digest.encode(), int(position) - 1, int(length))
+        with self.lock:
+            os.write(self.records_fd, record)
+            self.count += 1
+        return entry
+
+    def records(self, first, end):
+        """(digest, position, length) of the hunks recorded from first to end."""
+        with self.lock:
+            end = min(end, self.count)
+        if first >= end:
+            return []
+        size = PREVIEW_RECORD.size
+        data = os.pread(self.records_fd, (end - first) * size, first * size)
+        return [
+            (digest.decode(), position, length)
+            for digest, position, length in PREVIEW_RECORD.iter_unpack(data)
+        ]
+
+    def window(self, index):
+        """
+        The index of the first hunk within PRERENDER_WINDOW of index, and
+        (digest, position, length) of each of them.
+        """
+        first = max(0, index - PRERENDER_WINDOW)
+        return first, self.records(first, index + PRERENDER_WINDOW + 1)
+
+    def start(self):
+        if self.renderer is not None:
+            self.thread.start()
+
+    def stop(self):
+        """Stop scheduling and wait for renders in flight."""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.records_fd is not None:
+            os.close(self.records_fd)
+            self.records_fd = None
+
+    def read_cursor(self):
+        """(hunk index, width) from the last preview, or None before any."""
+        try:
+            with open(self.cursor_path, encoding="utf-8") as f:
+                index, width = f.read().split()
+            return int(index), int(width)
+        except (OSError, ValueError):
+            return None
+
+    def schedule(self):
+        running = {}
+        cursor = None
+        distance = 0
+        # The next hunk of the sweep over all hunks, and records read ahead
+        # for it in reverse order.
+        sweep = 0
+        swept = []
+        while not self.stopped.wait(CURSOR_POLL_INTERVAL):
+            latest = self.read_cursor()
+            if latest is None:
+                continue
+            if latest != cursor:
+                if cursor is not None and latest[1] != cursor[1]:
+                    # Renderings at the old width do not count.
+                    sweep = 0
+                    swept = []
+                cursor = latest
+                distance = 0
+            index, width = cursor
+            for key in [key for key, future in running.items() if future.done()]:
+                del running[key]
+            first, hunks = self.window(index)
+            # Walk outwards from the cursor: index, index + 1, index - 1, ...
+            while (
+                len(running) < 2 * PRERENDER_WORKERS
+                and distance <= 2 * PRERENDER_WINDOW
+            ):
+                offset = (distance + 1) // 2 * (1 if distance % 2 else -1)
+                distance += 1
+                if not 0 <= index + offset - first < len(hunks):
+                    continue
+                digest, position, length = hunks[index + offset - first]
+                key = (digest, width)
+                if key in running or self.is_rendered(digest, width):
+                    continue
+                running[key] = self.executor.submit(
+                    self.render, digest, position, length, width
+                )
+            # With fewer renders in flight than the window, the window of a
+            # moved cursor gets workers again soon.
+            while distance > 2 * PRERENDER_WINDOW and len(running) < PRERENDER_WORKERS:
+                if not swept:
+                    swept = self.records(sweep, sweep + PRERENDER_WINDOW)[::-1]
+                    if not swept:
+                        break
+                digest, position, length = swept.pop()
+                sweep += 1
+                key = (digest, width)
+                if key in running or self.is_rendered(digest, width):
+                    continue
+                running[key] = self.executor.submit(
+                    self.render, digest, position, length, width
+                )
+
+    def is_rendered(self, digest, width):
+        # Asking the cache directory keeps memory flat however many hunks
+        # the sweep gets through.
+        return os.path.exists(os.path.join(self.cache_dir, f"{digest}-{width}"))
+
+    def render(self, digest, position, length, width):
+        """Run delta on one hunk and store its output atomically."""
+        target = os.path.join(self.cache_dir, f"{digest}-{width}")
+        try:
+            with open(self.hunks_path, "rb") as f:
+                f.seek(position)
+                data = f.read(length)
+            result = subprocess.run(
+                ["delta", f"--width={width}"],
+                input=data,
+                capture_output=True,
+            )
+            if result.returncode != 0:
+                return
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(result.stdout)
+            os.replace(tmp_path, target)
+        except OSError:
+            pass
+
+
+def entry_tokens(entry, hunks_fd):
+    """
+    The searchable tokens of an entry: its path and header, plus the added
+    and removed lines of a hunk, read back from the file it points into.
+    """
+    fields = entry.split("\t")
+    path = fields[1].rsplit(":", 1)[0]
+    header = "\t".join(fields[2:-3])
+    text = f"{path}\n{header}".encode("utf-8", "surrogateescape")
+    tokens = set(SEARCH_TOKEN.findall(text.lower()))
+    if header.startswith("@@"):
+        position, length = int(fields[-2]) - 1, int(fields[-1])
+        data = os.pread(hunks_fd, length, position)
+        # One +/- column per side: two for a merge's "@@@" header.
+        columns = len(header) - len(header.lstrip("@")) - 1
+        changed = [
+            line
+            for line in data.split(b"\n")[1:]
+            if b"+" in line[:columns] or b"-" in line[:columns]
+        ]
+        tokens.update(SEARCH_TOKEN.findall(b"\n".join(changed).lower()))
+    return tokens
+
+
+class SearchIndex:
+    """
+    An inverted index from tokens to hunk IDs, for --search.
+
+    Entries are appended to an entries file as they are added; once the diff
+    is read, finish() writes the index next to it: the sorted tokens joined
+    into one string, where a query term is found with plain substring search,
+    and for each token the IDs of the hunks that contain it.  search() reads
+    both in a separate process that fzf runs on every keystroke.
+    """
+
+    def __init__(self, hunks_path, index_dir):
+        self.hunks_path = hunks_path
+        self.entries_path = os.path.join(index_dir, "entries")
+        self.index_path = os.path.join(index_dir, "index")
+        # Created up front: fzf may run a search before the first hunk.
+        self.entries_file = open(self.entries_path, "wb")
+        self.hunks_fd = os.open(hunks_path, os.O_RDONLY)
+        self.offsets = array.array("Q")
+        self.postings = {}
+
+    def add(self, entry):
+        """Index an entry produced by parse_diff; returns it unchanged."""
+        hunk_id = len(self.offsets)
+        self.offsets.append(self.entries_file.tell())
+        self.entries_file.write(entry.encode("utf-8", "surrogateescape") + b"\n")
+        # Queries made before finish() scan the entries written so far.
+        self.entries_file.flush()
+        for token in entry_tokens(entry, self.hunks_fd):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = array.array("I")
+            ids.append(hunk_id)
+        return entry
+
+    def finish(self):
+        """Write the index; queries use it from then on."""
+        self.offsets.append(self.entries_file.tell())
+        self.entries_file.close()
+        os.close(self.hunks_fd)
+
+        tokens = sorted(self.postings)
+        token_starts = array.array("Q")
+        posting_starts = array.array("Q", [0])
+        postings = array.array("I")
+        position = 0
+        for token in tokens:
+            token_starts.append(position)
+            position += len(token) + 1
+            postings.extend(self.postings[token])
+            posting_starts.append(len(postings))
+        self.postings = {}
+
+        index = (
+            b"\n".join(tokens),
+            token_starts.tobytes(),
+            posting_starts.tobytes(),
+            postings.tobytes(),
+            self.offsets.tobytes(),
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path))
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def search_command(self):
+        """Shell command for fzf's reload binding, with the query placeholder."""
+        script = os.path.abspath(__file__)
+        index_dir = os.path.dirname(self.index_path)
+        return (
+            f"{shlex.quote(sys.executable)} {shlex.quote(script)} "
+            f"--index {shlex.quote(index_dir)} --query={{q}} "
+            f"{shlex.quote(self.hunks_path)}"
+        )
+
+
+class FileGroups:
+    """
+    Groups hunk entries into one row per file, for --group.
+
+    Hunk entries are written to an entries file, a file's rows next to each
+    other, and the file's row records where they are, so fzf can expand it
+    with tail and head.  Its last three fields span all of the file's hunks
+    in the input or spool file, so its preview is the file's whole diff.
+    A row is produced as soon as the next file starts.
+    """
+
+    def __init__(self, index_dir):
+        self.entries_path = os.path.join(index_dir, "entries")
+        self.files_path = os.path.join(index_dir, "files")
+        self.line_counts = {}
+
+    def count(self, entry, added, removed):
+        """The on_hunk callback for parse_diff."""
+        self.line_counts[entry.split("\t", 1)[0]] = (added, removed)
+
+    def group(self, entries):
+        """Yield a row per run of entries for the same file."""
+        with open(self.entries_path, "wb") as entries_file, open(
+            self.files_path, "w", encoding="utf-8", errors="surrogateescape"
+        ) as files_file:
+            rows = self.rows(entries, entries_file)
+            for row in rows:
+                files_file.write(row + "\n")
+                files_file.flush()
+                yield row
+
+    def rows(self, entries, entries_file):
+        run = None
+        for entry in entries:
+            fields = entry.split("\t")
+            path = fields[1].rsplit(":", 1)[0]
+            if run is None or run["path"] != path:
+                if run is not None:
+                    yield self.row(run, entries_file)
+                run = {
+                    "id": fields[0],
+                    "path": path,
+                    "hunks": 0,
+                    "added": 0,
+                    "removed": 0,
+                    "entries_start": entries_file.tell(),
+                    "digests": hashlib.blake2b(digest_size=8),
+                    "start": int(fields[-2]),
+                }
+            added, removed = self.line_counts.pop(fields[0], (0, 0))
+            run["hunks"] += 1
+            run["added"] += added
+            run["removed"] += removed
+            run["digests"].update(fields[-3].encode())
+            run["end"] = int(fields[-2]) + int(fields[-1])
+            entries_file.write(entry.encode("utf-8", "surrogateescape") + b"\n")
+        if run is not None:
+            yield self.row(run, entries_file)
+
+    def row(self, run, entries_file):
+        # The file's entries are complete before fzf can ask for them.
+        entries_file.flush()
+        stats = f"[{run['hunks']} hunks +{run['added']} -{run['removed']}]"
+        entries_length = entries_file.tell() - run["entries_start"]
+        return (
+            f"{run['id']}\t{run['path']}\t{stats}"
+            f"\t{run['entries_start'] + 1}\t{entries_length}"
+            f"\t{run['digests'].hexdigest()}\t{run['start']}"
+            f"\t{run['end'] - run['start']}"
+        )
+
+    def bindings(self):
+        """fzf --bind values: Enter expands a file row, ctrl-b goes back."""
+        entries_path = shlex.quote(self.entries_path)
+        files_path = shlex.quote(self.files_path)
+        # A file row's third field is its "[N hunks ...]" summary.
+        expand = (
+            f"case {{3}} in '['*) "
+            f'echo "reload(tail -c +"{{-5}}" {entries_path} | head -c "{{-4}}")'
+            f'+clear-query+first" ;; '
+            "*) echo accept ;; esac"
+        )
+        return [
+            f"enter:transform:{expand}",
+            f"ctrl-b:reload(cat {files_path})+clear-query",
+        ]
+
+
+def search(index_dir, hunks_path, query, out):
+    """
+    Write the entries whose tokens contain every word of query, in ID order.
+    A query without words matches everything.
     """
-    if not entries:
+    terms = SEARCH_TOKEN.findall(query.encode("utf-8", "surrogateescape").lower())
+    with open(os.path.join(index_dir, "entries"), "rb") as f:
+        entries = f.read()
+    if not terms:
+        out.write(entries)
+        return
+
+    try:
+        with open(os.path.join(index_dir, "index"), "rb") as f:
+            index = marshal.load(f)
+    except FileNotFoundError:
+        # Still indexing: scan what has been parsed so far.
+        hunks_fd = os.open(hunks_path, os.O_RDONLY)
+        try:
+            for line in entries.splitlines(keepends=True):
+                entry = line.rstrip(b"\n").decode("utf-8", "surrogateescape")
+                tokens = entry_tokens(entry, hunks_fd)
+                if all(any(term in token for token in tokens) for term in terms):
+                    out.write(line)
+        finally:
+            os.close(hunks_fd)
+        return
+
+    blob = index[0]
+    token_starts = array.array("Q")
+    token_starts.frombytes(index[1])
+    posting_starts = array.array("Q")
+    posting_starts.frombytes(index[2])
+    postings = array.array("I")
+    postings.frombytes(index[3])
+    offsets = array.array("Q")
+    offsets.frombytes(index[4])
+
+    matches = None
+    for term in terms:
+        ids = set()
+        position = blob.find(term)
+        while position != -1:
+            token = bisect.bisect_right(token_starts, position) - 1
+            ids.update(postings[posting_starts[token] : posting_starts[token + 1]])
+            if token + 1 == len(token_starts):
+                break
+            position = blob.find(term, token_starts[token + 1])
+        matches = ids if matches is None else matches & ids
+        if not matches:
+            return
+    for hunk_id in sorted(matches):
+        out.write(entries[offsets[hunk_id] : offsets[hunk_id + 1]])
+
+
+def produce_entries(entries, pending, stopped):
+    """
+    Move entries onto the pending queue until they run out or stopped is
+    set, then queue None.  Returns the exception that ended it early, if any.
+    """
+    try:
+        for entry in entries:
+            if stopped.is_set():
+                return None
+            pending.put(entry)
+        return None
+    except Exception as e:
+        return e
+    finally:
+        pending.put(None)
+
+
+def produce_wakeups(entries, pending, stopped):
+    """
+    Like produce_entries, for entries that are also written to a file: queue
+    a wakeup for the file's reader instead of the entries themselves, and
+    only when it has taken the last one, so the queue never grows.
+    """
+    try:
+        for _ in entries:
+            if stopped.is_set():
+                return None
+            if pending.empty():
+                pending.put(True)
         return None
+    except Exception as e:
+        return e
+    finally:
+        pending.put(None)
+
+
+def follow_lines(path, pending):
+    """
+    Yield the lines appended to path, reading it again every time pending
+    has a wakeup, until it has None.  The file may appear after the first
+    wakeup.
+    """
+    f = None
+    partial = ""
+    try:
+        while True:
+            more = pending.get()
+            if f is None:
+                if more is None:
+                    return
+                f = open(path, encoding="utf-8", errors="surrogateescape")
+            while line := f.readline():
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial[:-1]
+                    partial = ""
+            if more is None:
+                return
+    finally:
+        if f is not None:
+            f.close()
 
-    preview_cmd = "cat {4} | delta --width=${FZF_PREVIEW_COLUMNS:-$COLUMNS}"
+
+def fuzzy_select(entries, preview_cache, search_index=None, file_groups=None):
+    """
+    Uses fzf to let the user select one entry from the entries iterator.
+    Entries are written to fzf as they are produced, so the list fills in
+    while the diff is still being read.
+    The preview window shows the hunk's byte range of the input or spool file,
+    pre-rendered by preview_cache when it got there first.
+    With a search_index, fzf does not filter by itself: every change of the
+    query reloads the list with the hunks whose contents match.
+    With file_groups, fzf starts with one row per file, and Enter on a file
+    reloads the list with that file's hunks.
+    Returns the selected entry string.
+    """
+    preview_cmd = preview_cache.preview_command()
     fzf_cmd = [
         "fzf",
         "--header=Select a diff chunk",
@@ -91,6 +758,18 @@ def fuzzy_select(entries):
         f"--preview={preview_cmd}",
         "--preview-window=bottom:70%",
     ]
+    entries = map(preview_cache.add, entries)
+    if search_index is not None:
+        fzf_cmd[1] = "--header=Search hunk contents"
+        fzf_cmd += [
+            "--disabled",
+            f"--bind=change:reload:{search_index.search_command()}",
+        ]
+        entries = map(search_index.add, entries)
+    if file_groups is not None:
+        fzf_cmd[1] = "--header=Select a file (Enter: its hunks, ctrl-b: back)"
+        fzf_cmd += [f"--bind={binding}" for binding in file_groups.bindings()]
+        entries = file_groups.group(entries)
     try:
         fzf = subprocess.Popen(
             fzf_cmd,
@@ -98,13 +777,66 @@ def fuzzy_select(entries):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
+            encoding="utf-8",
+            errors="surrogateescape",
         )
     except FileNotFoundError:
         print("Error: fzf is not installed or not in your PATH.", file=sys.stderr)
         sys.exit(1)
 
-    input_data = "\n".join(entries)
-    selected, _ = fzf.communicate(input_data)
+    # Parsing runs in its own thread: after a reload fzf may stop reading
+    # its input, and what reloads read still has to be written.  The search
+    # index and the file rows are on disk as soon as they are produced, so
+    # then the queue only wakes up the loop that copies that file to fzf,
+    # which can fall behind without holding anything in memory.
+    if search_index is not None:
+        followed = search_index.entries_path
+    elif file_groups is not None:
+        followed = file_groups.files_path
+    else:
+        followed = None
+    if followed is not None:
+        pending = queue.Queue()
+        produce_to = produce_wakeups
+        fed_entries = follow_lines(followed, pending)
+    else:
+        pending = queue.Queue(maxsize=1024)
+        produce_to = produce_entries
+        fed_entries = iter(pending.get, None)
+    stopped = threading.Event()
+    result = {}
+
+    def produce():
+        result["error"] = produce_to(entries, pending, stopped)
+        if search_index is not None and not stopped.is_set() and not result["error"]:
+            search_index.finish()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    preview_cache.start()
+    producer.start()
+    fed = False
+    try:
+        for entry in fed_entries:
+            fzf.stdin.write(entry + "\n")
+            fzf.stdin.flush()
+        fed = True
+        fzf.stdin.close()
+    except BrokenPipeError:
+        # fzf exited (selection made or aborted) before the diff ended.
+        pass
+    selected = fzf.stdout.read()
+    fzf.wait()
+
+    stopped.set()
+    if followed is not None:
+        fed_entries.close()
+    # Unblock the producer if it is waiting for room in the queue.
+    while not fed and followed is None and pending.get() is not None:
+        pass
+    producer.join()
+    preview_cache.stop()
+    if result["error"] is not None:
+        raise result["error"]
     return selected.strip() if selected else None
 
 
@@ -118,34 +850,81 @@ def open_in_editor(filepath, line_number):
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Pick a hunk of a diff with fzf and open it in $EDITOR"
+    )
+    parser.add_argument("file", nargs="?", help="Diff to read (default: stdin)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "-s",
+        "--search",
+        action="store_true",
+        help="Match the query against the hunks' added and removed lines",
+    )
+    mode.add_argument(
+        "-g",
+        "--group",
+        action="store_true",
+        help="List files first; Enter shows a file's hunks",
+    )
+    # The reload command of --search: print the entries matching a query.
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    parser.add_argument("--query", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.index:
+        search(args.index, args.file, args.query, sys.stdout.buffer)
+        return
+
     with tempfile.TemporaryDirectory() as temp_dir:
         # Read from a file if provided, otherwise from standard input.
-        if len(sys.argv) >= 2:
+        if args.file:
             try:
-                with open(sys.argv[1], "r", encoding="utf-8") as f:
-                    lines = f.readlines()
+                diff_file = open(args.file, "rb")
             except Exception as e:
-                print(f"Error reading file {sys.argv[1]}: {e}", file=sys.stderr)
+                print(f"Error reading file {args.file}: {e}", file=sys.stderr)
                 sys.exit(1)
         else:
-            lines = sys.stdin.readlines()
+            diff_file = sys.stdin.buffer
 
-        entries = parse_diff(lines, temp_dir)
-        if not entries:
-            print("No diff hunk entries found.")
-            sys.exit(0)
+        # Previews read hunks straight from a regular input file; anything
+        # else (a pipe, <(git diff)) is copied hunk by hunk to a spool file.
+        if args.file and os.path.isfile(args.file):
+            hunks_path = os.path.abspath(args.file)
+            spool = None
+        else:
+            hunks_path = os.path.join(temp_dir, "hunks")
+            spool = open(hunks_path, "wb")
+        preview_cache = PreviewCache(hunks_path, temp_dir)
+        search_index = SearchIndex(hunks_path, temp_dir) if args.search else None
+        file_groups = FileGroups(temp_dir) if args.group else None
+
+        with diff_file, spool or contextlib.nullcontext():
+            entries = parse_diff(
+                diff_file, spool, file_groups.count if file_groups else None
+            )
+            # Only start fzf once there is something to pick from.
+            first = next(entries, None)
+            if first is None:
+                print("No diff hunk entries found.")
+                sys.exit(0)
 
-        selected = fuzzy_select(entries)
+            selected = fuzzy_select(
+                itertools.chain([first], entries),
+                preview_cache,
+                search_index,
+                file_groups,
+            )
         if not selected:
             sys.exit(0)
 
-        # Expected format: ID<TAB>filepath:line_number<TAB>hunk header<TAB>tempfile.
+        # Expected format: ID<TAB>filepath:line_number<TAB>hunk header<TAB>hash<TAB>position<TAB>length.
         try:
             parts = selected.split("\t")
             if len(parts) < 2:
                 raise ValueError("Invalid selection format.")
             file_line = parts[1]
-            filepath, line_str = file_line.split(":", 1)
+            filepath, line_str = file_line.rsplit(":", 1)
             line_number = int(line_str)
         except ValueError:
             print("Failed to parse the selected entry:", selected, file=sys.stderr)
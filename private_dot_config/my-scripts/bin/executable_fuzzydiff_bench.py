@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, List
+
+# Every case is measured in a fresh interpreter so peak RSS belongs to that
+# case alone.  "spool" copies hunks to a spool file like stdin input does;
+# "direct" points entries into the input file.
+CASES = ("spool", "direct")
+
+WORDS = [b"alpha", b"beta", b"gamma", b"delta", b"return", b"static", b"int", b"0"]
+# Distinct content lines to draw from; generating every line afresh would
+# make multi-GB diffs take longer to write than to parse.
+LINE_POOL = 4096
+
+
+@dataclass
+class DiffSpec:
+    size_mb: int = 64
+    hunks_per_file: int = 8
+    lines_per_hunk: int = 12
+    binary_rate: float = 0.02
+    rename_rate: float = 0.02
+    combined_rate: float = 0.02
+    non_utf8_rate: float = 0.01
+    seed: int = 0
+
+
+@dataclass
+class Measurement:
+    case: str
+    wall_seconds: float
+    bytes: int
+    lines: int
+    hunks: int
+    lines_per_second: float
+    mb_per_second: float
+    peak_rss_kb: int
+
+
+def find_fuzzydiff() -> Path:
+    """The script under test, installed or still in the chezmoi source tree."""
+    here = Path(__file__).resolve().parent
+    for name in ("fuzzydiff.py", "executable_fuzzydiff.py"):
+        candidate = here / name
+        if candidate.is_file():
+            return candidate
+    print("Error: fuzzydiff.py not found next to this script", file=sys.stderr)
+    sys.exit(1)
+
+
+def make_line_pool(rng: random.Random, spec: DiffSpec) -> List[bytes]:
+    pool = []
+    for _ in range(LINE_POOL):
+        line = b" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 10)))
+        if rng.random() < spec.non_utf8_rate:
+            line += b" \xff\xfe latin-1 caf\xe9"
+        pool.append(line + b"\n")
+    return pool
+
+
+def write_hunk(
+    out: BinaryIO, rng: random.Random, spec: DiffSpec, pool: List[bytes], start: int
+) -> None:
+    kinds = rng.choices(b" +-", k=spec.lines_per_hunk)
+    old = spec.lines_per_hunk - kinds.count(ord("+"))
+    new = spec.lines_per_hunk - kinds.count(ord("-"))
+    out.write(b"@@ -%d,%d +%d,%d @@ int f%d(void)\n" % (start, old, start, new, start))
+    lines = rng.choices(pool, k=spec.lines_per_hunk)
+    out.writelines(bytes([kind]) + line for kind, line in zip(kinds, lines))
+
+
+def write_combined_hunk(out: BinaryIO, rng: random.Random, pool: List[bytes]) -> None:
+    out.write(b"@@@ -1,2 -1,2 +1,3 @@@\n")
+    for prefix in (b"- ", b" -", b"++", b"++", b"  "):
+        out.write(prefix + rng.choice(pool))
+
+
+def generate_diff(out: BinaryIO, spec: DiffSpec) -> Dict[str, int]:
+    """
+    Write a synthetic `git diff` of about spec.size_mb megabytes.
+
+    Most files get spec.hunks_per_file ordinary hunks; a few are binary,
+    pure renames, new or deleted files, or merges in combined format, and
+    some lines are not valid UTF-8.  Returns how many hunks and special
+    sections were written.
+    """
+    rng = random.Random(spec.seed)
+    pool = make_line_pool(rng, spec)
+    limit = spec.size_mb * 1024 * 1024
+    counts = {"files": 0, "hunks": 0, "binary": 0, "renames": 0, "combined": 0}
+    while out.tell() < limit:
+        number = counts["files"]
+        path = b"src/module%d/file%d.c" % (number % 97, number)
+        counts["files"] += 1
+        roll = rng.random()
+        if roll < spec.binary_rate:
+            out.write(b"diff --git a/%s.png b/%s.png\n" % (path, path))
+            out.write(b"index 1111111..2222222 100644\n")
+            out.write(b"Binary files a/%s.png and b/%s.png differ\n" % (path, path))
+            counts["binary"] += 1
+            continue
+        roll -= spec.binary_rate
+        if roll < spec.rename_rate:
+            out.write(b"diff --git a/%s b/%s.moved\n" % (path, path))
+            out.write(b"similarity index 100%\n")
+            out.write(b"rename from %s\nrename to %s.moved\n" % (path, path))
+            counts["renames"] += 1
+            continue
+        roll -= spec.rename_rate
+        if roll < spec.combined_rate:
+            out.write(b"diff --cc %s\n" % path)
+            out.write(b"index 1111111,2222222..3333333\n")
+            out.write(b"--- a/%s\n+++ b/%s\n" % (path, path))
+            write_combined_hunk(out, rng, pool)
+            counts["combined"] += 1
+            counts["hunks"] += 1
+            continue
+        out.write(b"diff --git a/%s b/%s\n" % (path, path))
+        out.write(b"index 1111111..2222222 100644\n")
+        if number % 50 == 0:
+            out.write(b"--- /dev/null\n+++ b/%s\n" % path)
+        else:
+            out.write(b"--- a/%s\n+++ b/%s\n" % (path, path))
+        for hunk in range(spec.hunks_per_file):
+            write_hunk(out, rng, spec, pool, 1 + hunk * 40)
+            counts["hunks"] += 1
+    return counts
+
+
+def count_lines(path: Path) -> int:
+    lines = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            lines += chunk.count(b"\n")
+    return lines
+
+
+def measure_case(case: str, diff: Path) -> Measurement:
+    """Parse the whole diff in this process; meant to be called in a fresh child."""
+    module = runpy.run_path(str(find_fuzzydiff()))
+    lines = count_lines(diff)
+    size = diff.stat().st_size
+
+    with tempfile.TemporaryDirectory(prefix="fuzzydiff-bench-") as tmp:
+        start = time.perf_counter()
+        with open(diff, "rb") as f:
+            if case == "spool":
+                with open(os.path.join(tmp, "hunks"), "wb") as spool:
+                    hunks = sum(1 for _ in module["parse_diff"](f, spool))
+            else:
+                hunks = sum(1 for _ in module["parse_diff"](f))
+        wall = time.perf_counter() - start
+
+    return Measurement(
+        case=case,
+        wall_seconds=round(wall, 4),
+        bytes=size,
+        lines=lines,
+        hunks=hunks,
+        lines_per_second=round(lines / wall),
+        mb_per_second=round(size / wall / (1024 * 1024), 1),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+
+def run_case(case: str, diff: Path) -> Measurement:
+    """Measure a case in a fresh interpreter."""
+    cmd = [sys.executable, str(Path(__file__).resolve()), "measure", case, str(diff)]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return Measurement(**json.loads(result.stdout))
+
+
+def run_benchmarks(diff: Path, cases: List[str], repeat: int) -> List[Dict]:
+    measurements = []
+    for case in cases:
+        for _ in range(repeat):
+            measurement = run_case(case, diff)
+            print(
+                f"{case:<7} {measurement.wall_seconds:>9.3f}s "
+                f"{measurement.lines_per_second:>12,} lines/s "
+                f"{measurement.mb_per_second:>7.1f} MiB/s "
+                f"{measurement.peak_rss_kb // 1024:>6} MiB",
+                file=sys.stderr,
+            )
+            measurements.append(asdict(measurement))
+    return measurements
+
+
+def add_diff_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = DiffSpec()
+    parser.add_argument(
+        "--size-mb", type=int, default=defaults.size_mb, help="Approximate diff size"
+    )
+    parser.add_argument("--hunks-per-file", type=int, default=defaults.hunks_per_file)
+    parser.add_argument("--lines-per-hunk", type=int, default=defaults.lines_per_hunk)
+    parser.add_argument("--binary-rate", type=float, default=defaults.binary_rate)
+    parser.add_argument("--rename-rate", type=float, default=defaults.rename_rate)
+    parser.add_argument("--combined-rate", type=float, default=defaults.combined_rate)
+    parser.add_argument(
+        "--non-utf8-rate",
+        type=float,
+        default=defaults.non_utf8_rate,
+        help="Probability that a line contains bytes that are not UTF-8",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def diff_spec(args: argparse.Namespace) -> DiffSpec:
+    return DiffSpec(
+        size_mb=args.size_mb,
+        hunks_per_file=args.hunks_per_file,
+        lines_per_hunk=args.lines_per_hunk,
+        binary_rate=args.binary_rate,
+        rename_rate=args.rename_rate,
+        combined_rate=args.combined_rate,
+        non_utf8_rate=args.non_utf8_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark fuzzydiff.py's parser on synthetic diffs"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Only write a diff")
+    generate.add_argument("output", help="File to write the diff to")
+    add_diff_arguments(generate)
+
+    run = subparsers.add_parser("run", help="Write a diff and time parsing it")
+    run.add_argument("--diff", help="Benchmark an existing diff instead")
+    run.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help=f"Comma-separated cases to run ({', '.join(CASES)})",
+    )
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("-o", "--output", help="Write the JSON report to a file")
+    add_diff_arguments(run)
+
+    measure = subparsers.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("case", choices=CASES)
+    measure.add_argument("diff")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        with open(args.output, "wb") as out:
+            counts = generate_diff(out, diff_spec(args))
+        print(json.dumps(counts))
+        return
+
+    if args.command == "measure":
+        measurement = measure_case(args.case, Path(args.diff).resolve())
+        print(json.dumps(asdict(measurement)))
+        return
+
+    cases = [case for case in args.cases.split(",") if case]
+    for case in cases:
+        if case not in CASES:
+            parser.error(f"unknown case: {case}")
+
+    with tempfile.TemporaryDirectory(prefix="fuzzydiff-bench-") as tmp:
+        if args.diff:
+            diff = Path(args.diff).resolve()
+            spec = None
+            counts = None
+        else:
+            diff = Path(tmp) / "bench.diff"
+            spec = diff_spec(args)
+            start = time.perf_counter()
+            with open(diff, "wb") as out:
+                counts = generate_diff(out, spec)
+            print(
+                f"generated {diff.stat().st_size // (1024 * 1024)} MiB, "
+                f"{counts['hunks']} hunks in {time.perf_counter() - start:.1f}s",
+                file=sys.stderr,
+            )
+        report = {
+            "diff": str(diff) if args.diff else None,
+            "spec": asdict(spec) if spec else None,
+            "generated": counts,
+            "measurements": run_benchmarks(diff, cases, args.repeat),
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,257 @@ import subprocess
 import sys
 import os
 import argparse
-from typing import List, Tuple, Optional
-from dataclasses import dataclass
+import ctypes
+import hashlib
+import heapq
+import json
+import mmap
+import resource
+import select
+import selectors
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from array import array
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional
+from dataclasses import dataclass, field
 from pathlib import Path
-from multiprocessing import Pool, cpu_count
-from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+LOG_FORMAT = "%at|%C(green)%cr%Creset %C(red)%h%Creset %C(yellow)%as%Creset %C(cyan)%an%Creset %C(white)%s%Creset"
 
-@dataclass
+# Prefixes every commit header in the history walk so it can be told apart
+# from the NUL-separated name-status entries that follow it.
+COMMIT_MARKER = "\x01"
+
+ENGINES = ("walk", "graph", "per-file")
+
+CACHE_NAME = "git-blame-dir-cache.json"
+CACHE_VERSION = 1
+# --ownership keeps surviving lines per author for every blob it blamed.
+OWNERSHIP_CACHE_NAME = "git-blame-dir-ownership.json"
+# Authors shown per directory by --ownership.
+OWNERSHIP_AUTHORS = 3
+
+# Commit-graph file layout, see gitformat-commit-graph(5).
+GRAPH_SIGNATURE = b"CGPH"
+GRAPH_HASH_LENGTHS = {1: 20, 2: 32}
+GRAPH_PARENT_NONE = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+BLOOM_SEEDS = (0x293AE76F, 0x7E646E2C)
+
+# Upper bound for concurrent `git log --follow` processes in the per-file
+# engine.
+MAX_WORKERS = 64
+
+# cat-file queries sent before reading answers back, so neither side of the
+# pipe can fill up and block the other.
+CAT_FILE_BATCH = 256
+
+# --serve: relative dates are rendered per query, so the formatted commit
+# keeps a marker where git would have put %cr.
+RELATIVE_DATE_MARK = "\x02"
+SOCKET_PREFIX = "git-blame-dir-"
+# Repository changes usually come as a burst of ref and index writes.
+WATCH_DEBOUNCE = 0.1
+# Without inotify the daemon polls HEAD and the index this often.
+POLL_INTERVAL = 2.0
+CLIENT_TIMEOUT = 5.0
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+
+# Column width used for the path when lines are printed before the longest
+# path is known.
+STREAM_WIDTH = 50
+
+
+@dataclass(slots=True)
 class FileCommitInfo:
     filepath: str
     timestamp: int
     commit_info: str
 
 
+@dataclass(slots=True)
+class HistoryCommit:
+    sha: str
+    timestamp: int
+    commit_info: str
+    # (status, path) pairs from --name-status, e.g. ("M", "src/main.c")
+    changes: List[Tuple[str, str]]
+    # New path -> old path for the renames among changes, when detected.
+    renames: Dict[str, str] = field(default_factory=dict)
+
+
+# Files a resolver has newly resolved.  Nothing bounds the timestamps of
+# later batches: neither author nor commit dates have to decrease along
+# the history (amends, rebases, skewed clocks).
+ResolvedBatch = List[FileCommitInfo]
+
+# Phases reported by --profile, in the order they usually run.
+PROFILE_PHASES = (
+    "git root",
+    "daemon",
+    "ls-files",
+    "filtering",
+    "resolve",
+    "sort",
+    "render",
+)
+
+
+class Profiler:
+    """
+    Wall time per phase and subprocess latencies for --profile.
+
+    Phases nest: while an inner phase runs, the outer one is paused, so every
+    moment is charged to exactly one phase.  Only the thread that enabled the
+    profiler records phases.  When disabled, phase() costs a function call
+    and nothing is recorded.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.thread = threading.get_ident()
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.stack: List[str] = []
+        self.mark = 0.0
+        self.spawned = 0
+        self.latencies: List[float] = []
+        # Worker threads of the per-file engine spawn concurrently.
+        self.lock = threading.Lock()
+        self.popen = subprocess.Popen
+
+    def enable(self) -> None:
+        """Start the clock and time every subprocess spawned until disable()."""
+        self.enabled = True
+        self.thread = threading.get_ident()
+        self.started = self.mark = time.perf_counter()
+        self.popen = subprocess.Popen
+        profiler = self
+
+        class TimedPopen(self.popen):
+            def __init__(self, *args, **kwargs):
+                self.profile_start = time.perf_counter()
+                self.profile_done = False
+                super().__init__(*args, **kwargs)
+                with profiler.lock:
+                    profiler.spawned += 1
+
+            def wait(self, timeout=None):
+                returncode = super().wait(timeout)
+                if not self.profile_done:
+                    self.profile_done = True
+                    latency = time.perf_counter() - self.profile_start
+                    with profiler.lock:
+                        profiler.latencies.append(latency)
+                return returncode
+
+        subprocess.Popen = TimedPopen
+
+    def disable(self) -> None:
+        """Stop timing subprocesses and put subprocess.Popen back."""
+        self.enabled = False
+        subprocess.Popen = self.popen
+
+    def switch(self, name: Optional[str]) -> None:
+        """Charge the time since the last switch to the running phase."""
+        now = time.perf_counter()
+        if self.stack:
+            running = self.stack[-1]
+            self.phases[running] = self.phases.get(running, 0.0) + now - self.mark
+        self.mark = now
+        if name is None:
+            self.stack.pop()
+        else:
+            self.stack.append(name)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled or threading.get_ident() != self.thread:
+            yield
+            return
+        self.switch(name)
+        try:
+            yield
+        finally:
+            self.switch(None)
+
+    def iterate(self, name: str, items: Iterator) -> Iterator:
+        """Charge the time spent producing each item of a generator to name."""
+        try:
+            while True:
+                with self.phase(name):
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            items.close()
+
+    def report(self) -> dict:
+        wall = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        p99 = latencies[-(-len(latencies) * 99 // 100) - 1] if latencies else 0.0
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        phases = {name: self.phases.get(name, 0.0) for name in PROFILE_PHASES}
+        phases.update(self.phases)
+        return {
+            "wall_seconds": wall,
+            "phases": phases,
+            "subprocesses": {
+                "count": self.spawned,
+                "total_seconds": sum(latencies),
+                "p99_seconds": p99,
+                "max_seconds": latencies[-1] if latencies else 0.0,
+            },
+            # ru_maxrss is in KiB on Linux.
+            "peak_rss_kb": usage.ru_maxrss,
+            "peak_child_rss_kb": children.ru_maxrss,
+        }
+
+
+def format_profile(report: dict) -> str:
+    lines = [f"{'total':<10} {report['wall_seconds'] * 1000:>10.1f} ms"]
+    for name, seconds in report["phases"].items():
+        lines.append(f"{name:<10} {seconds * 1000:>10.1f} ms")
+    procs = report["subprocesses"]
+    lines.append(
+        f"subprocesses: {procs['count']} spawned, "
+        f"{procs['total_seconds'] * 1000:.1f} ms total, "
+        f"p99 {procs['p99_seconds'] * 1000:.1f} ms, "
+        f"max {procs['max_seconds'] * 1000:.1f} ms"
+    )
+    lines.append(
+        f"peak RSS: {report['peak_rss_kb'] // 1024} MiB, "
+        f"largest child {report['peak_child_rss_kb'] // 1024} MiB"
+    )
+    return "\n".join(lines)
+
+
+def write_profile(report: dict, path: Optional[str]) -> None:
+    """Print the report on stderr, or write it as JSON when given a path."""
+    if path:
+        Path(path).write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(format_profile(report), file=sys.stderr)
+
+
+PROFILER = Profiler()
+
+
 def get_git_root() -> Path:
     """Get the git repository root directory."""
     result = subprocess.run(
@@ -29,42 +266,138 @@ def get_git_root() -> Path:
     return Path(result.stdout.strip())
 
 
-def get_git_files(start_path: Path, recursive: bool = False) -> List[Path]:
-    """Get git tracked files from the specified path."""
-    cmd = ["git", "ls-files", "--cached", "--others", "--exclude-standard"]
+class GitFiles:
+    """
+    Paths below a start directory, relative to it and in `git ls-files` order.
 
-    result = subprocess.run(
-        cmd, cwd=start_path, capture_output=True, text=True, check=True
-    )
+    Every directory prefix is stored once and a file is only an index into
+    those prefixes plus its name, so a million entries stay far smaller
+    than a million Path objects.
+    """
 
-    # Convert paths to absolute paths
-    files = [start_path / f for f in result.stdout.splitlines()]
+    __slots__ = ("dirs", "dir_ids", "names", "_dir_lookup")
 
-    # Filter files based on the start_path and recursive flag
-    rel_start = start_path.resolve()
-    filtered_files = []
-    for file in files:
-        try:
-            # Get the relative path from start_path
-            rel_path = file.resolve().relative_to(rel_start)
+    def __init__(self, paths: Iterable[str] = ()):
+        self.dirs: List[str] = []
+        self.dir_ids = array("I")
+        self.names: List[str] = []
+        self._dir_lookup: Dict[str, int] = {}
+        for path in paths:
+            self.append(path)
 
-            # For non-recursive, only include files directly in the directory
-            if not recursive and len(rel_path.parts) > 1:
-                continue
+    def append(self, path: str) -> None:
+        directory, _, name = path.rpartition("/")
+        dir_id = self._dir_lookup.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_lookup[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        self.dir_ids.append(dir_id)
+        self.names.append(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        dirs = self.dirs
+        for dir_id, name in zip(self.dir_ids, self.names):
+            directory = dirs[dir_id]
+            yield f"{directory}/{name}" if directory else name
+
+
+def get_git_files(
+    start_path: Path, recursive: bool = False, nested: Optional[List[str]] = None
+) -> GitFiles:
+    """
+    Get git tracked (and untracked, not ignored) files below start_path.
 
-            filtered_files.append(file)
-        except ValueError:
-            # Path is not relative to start_path
+    With a nested list, submodules and other repositories inside the working
+    tree are collected there instead of being listed as files.
+    """
+    cmd = ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"]
+    if nested is not None:
+        cmd.append("--stage")
+    if not recursive:
+        # Under glob magic `*` does not cross "/", so git itself skips
+        # everything in subdirectories.
+        cmd += ["--", ":(glob)*"]
+
+    with PROFILER.phase("ls-files"):
+        result = subprocess.run(cmd, cwd=start_path, capture_output=True, check=True)
+    with PROFILER.phase("filtering"):
+        paths = result.stdout.decode("utf-8", "surrogateescape").split("\0")
+        paths.pop()  # the output ends with a NUL
+
+        if nested is not None:
+            paths = split_nested_repositories(start_path, paths, nested)
+
+        files = GitFiles()
+        for path in paths:
+            if recursive or "/" not in path:
+                files.append(path)
+    return files
+
+
+def split_nested_repositories(
+    start_path: Path, records: List[str], nested: List[str]
+) -> List[str]:
+    """
+    Turn `ls-files --stage` records into paths, moving checked-out
+    submodules (gitlinks) and untracked repositories ("dir/") to nested.
+    """
+    paths = []
+    for record in records:
+        if record.endswith("/"):
+            # --others lists a repository inside the working tree as one
+            # directory entry.
+            nested.append(record[:-1])
             continue
+        mode, tab, path = record.partition("\t")
+        if not tab or not mode.endswith((" 0", " 1", " 2", " 3")):
+            # Untracked files come without the staging columns.
+            paths.append(record)
+        elif mode.startswith("160000 ") and (start_path / path / ".git").exists():
+            nested.append(path)
+        else:
+            paths.append(path)
+    return paths
 
-    return filtered_files
 
+def get_color_env() -> Dict[str, str]:
+    """Environment that keeps git's colored output when stdout is a pipe."""
+    env = os.environ.copy()
+    env["FORCE_COLOR"] = "true"
+    return env
 
-def get_file_info(filepath: Path) -> Optional[FileCommitInfo]:
-    """Get git commit info for a single file."""
+
+def get_display_path(filepath: Path) -> str:
+    """Show a file relative to the current directory when possible."""
+    try:
+        return str(filepath.relative_to(Path.cwd()))
+    except ValueError:
+        return str(filepath)
+
+
+def get_display_prefix(start_path: Path) -> str:
+    """
+    What to put in front of a path relative to start_path to display it the
+    way get_display_path would, without touching the filesystem per file.
+    """
+    display = get_display_path(start_path)
+    return "" if display == "." else f"{display}/"
+
+
+def get_repo_prefix(git_root: Path, start_path: Path) -> str:
+    """start_path relative to the repository root, as a path prefix."""
+    prefix = start_path.relative_to(git_root).as_posix()
+    return "" if prefix == "." else f"{prefix}/"
+
+
+def get_file_info(
+    filepath: Path, repository: Optional[Path] = None
+) -> Optional[FileCommitInfo]:
+    """Get git commit info for a single file, in repository if given."""
     try:
-        env = os.environ.copy()
-        env["FORCE_COLOR"] = "true"
+        env = get_color_env()
 
         result = subprocess.run(
             [
@@ -74,10 +407,11 @@ def get_file_info(filepath: Path) -> Optional[FileCommitInfo]:
                 "--color=always",
                 "--follow",
                 "-1",
-                "--format=%at|%C(green)%cr%Creset %C(red)%h%Creset %C(yellow)%as%Creset %C(cyan)%an%Creset %C(white)%s%Creset",
+                f"--format={LOG_FORMAT}",
                 "--",
                 str(filepath),
             ],
+            cwd=repository,
             capture_output=True,
             text=True,
             check=True,
@@ -89,14 +423,8 @@ def get_file_info(filepath: Path) -> Optional[FileCommitInfo]:
 
         timestamp, commit_info = result.stdout.strip().split("|", 1)
 
-        # Use relative path for display
-        try:
-            display_path = filepath.resolve().relative_to(Path.cwd())
-        except ValueError:
-            display_path = filepath
-
         return FileCommitInfo(
-            filepath=str(display_path),
+            filepath=get_display_path(filepath),
             timestamp=int(timestamp),
             commit_info=commit_info,
         )
@@ -104,15 +432,924 @@ def get_file_info(filepath: Path) -> Optional[FileCommitInfo]:
         return None
 
 
-def process_directory(
-    directory: str, recursive: bool = False, use_git_root: bool = False
-) -> List[FileCommitInfo]:
-    """Process files in parallel and get their git info."""
+def iter_history(
+    start_path: Path, revision: Optional[str] = None, renames: bool = False
+) -> Iterator[HistoryCommit]:
+    """
+    Stream the commits touching start_path, newest first.
+
+    Changed paths are relative to start_path.  A single `git log
+    --name-status` process backs the whole walk; it is killed as soon as the
+    caller stops iterating.  revision limits the walk (e.g. "old..HEAD").
+    With renames, git detects them (-M) and they are listed under the new
+    path with the old one in HistoryCommit.renames.
+
+    git writes one commit at a time, so a commit is yielded as soon as its
+    entries stop at a field boundary with nothing more to read, not when
+    the next commit arrives: finding that can take a walk to the root.
+    Should more entries follow after all, they come as another
+    HistoryCommit with the same header.
+    """
+    cmd = [
+        "git",
+        "--no-pager",
+        "log",
+        "--color=always",
+        "-z",
+        "--name-status",
+        "-M" if renames else "--no-renames",
+        # Without it git simplifies merges against the walked directory, so
+        # the answer for a file would depend on where the walk starts; the
+        # per-file `git log -- <path>` simplifies against the file alone.
+        "--full-history",
+        # Merges only list paths that differ from every parent, which is
+        # when `git log -- <path>` would show the merge itself.
+        "-c",
+        "--relative",
+        f"--format={COMMIT_MARKER}%H|{LOG_FORMAT}",
+    ]
+    if revision:
+        cmd.append(revision)
+    cmd += ["--", "."]
+    proc = subprocess.Popen(
+        cmd,
+        cwd=start_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=get_color_env(),
+    )
+
+    def commits() -> Iterator[HistoryCommit]:
+        fd = proc.stdout.fileno()
+        commit = None
+        # Whether part of commit was already yielded.
+        yielded = False
+        status = None
+        old_path = None
+        pending = b""
+        while True:
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                break
+            fields = (pending + chunk).split(b"\0")
+            pending = fields.pop()
+            for raw in fields:
+                field = raw.decode("utf-8", "surrogateescape")
+                if field.startswith(COMMIT_MARKER):
+                    if commit is not None and (commit.changes or not yielded):
+                        yield commit
+                    sha, timestamp, commit_info = field[1:].split("|", 2)
+                    commit = HistoryCommit(sha, int(timestamp), commit_info, [])
+                    yielded = False
+                    status = old_path = None
+                    continue
+                # Non-merge commits separate the header from the first
+                # entry with a newline; merges use an empty field.
+                field = field.lstrip("\n")
+                if not field:
+                    continue
+                if status is None:
+                    status = field
+                elif status[0] == "R" and status[1:].isdigit() and old_path is None:
+                    # Renames list the old path, then the new one.  Merges
+                    # show a combined status such as "RM" and only the new
+                    # path.
+                    old_path = field
+                else:
+                    commit.changes.append((status, field))
+                    if old_path is not None:
+                        commit.renames[field] = old_path
+                    status = old_path = None
+            if (
+                commit is not None
+                and commit.changes
+                and not pending
+                and status is None
+                and not select.select([fd], [], [], 0)[0]
+            ):
+                yield commit
+                yielded = True
+                commit = HistoryCommit(
+                    commit.sha,
+                    commit.timestamp,
+                    commit.commit_info,
+                    [],
+                )
+        if commit is not None and (commit.changes or not yielded):
+            yield commit
+
     try:
-        if use_git_root:
-            start_path = get_git_root()
-        else:
-            start_path = Path(directory).resolve()
+        yield from commits()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+
+def get_committed_paths(start_path: Path, rollup: bool = False) -> Set[str]:
+    """
+    Paths below start_path that exist at HEAD, relative to it; with rollup,
+    only its immediate children.
+    """
+    cmd = ["git", "ls-tree", "-z", "--name-only", "HEAD"]
+    if not rollup:
+        cmd.insert(2, "-r")
+    try:
+        result = subprocess.run(cmd, cwd=start_path, capture_output=True, check=True)
+    except subprocess.CalledProcessError:
+        # No commits yet.
+        return set()
+    paths = set(result.stdout.decode("utf-8", "surrogateescape").split("\0"))
+    paths.discard("")
+    return paths
+
+
+def iter_files_walk(
+    start_path: Path,
+    files: GitFiles,
+    rollup: bool = False,
+    skip_renames: bool = False,
+) -> Iterator[ResolvedBatch]:
+    """
+    Resolve the last commit of every file with one history walk.
+
+    Each path gets the first (newest) commit that touches it and the walk
+    stops once every file is resolved.  Files that never appear in history
+    (untracked or only staged) are left out, like get_file_info does.
+    With rollup, files are immediate children of start_path and a directory
+    counts as touched by any change below it.
+
+    With skip_renames, a commit that only renamed a file (R100) does not
+    count: the walk carries on under the old name, keeping a map from the
+    historical path back to the current one.
+    """
+    # Untracked and staged files would keep the walk going to the root
+    # without ever being found, so only paths at HEAD are looked for.
+    committed = get_committed_paths(start_path, rollup)
+    # Path in the commit being looked at -> path in the working tree.
+    pending = {path: path for path in files if path in committed}
+    if not pending:
+        return
+    display_prefix = get_display_prefix(start_path)
+
+    history = iter_history(start_path, None, skip_renames)
+    try:
+        for commit in history:
+            batch = []
+            for status, path in commit.changes:
+                old_path = commit.renames.get(path)
+                if rollup:
+                    touched = [path.partition("/")[0]]
+                    if old_path is not None:
+                        # A file moved between children changes both.
+                        touched.append(old_path.partition("/")[0])
+                        if status == "R100" and touched[0] == touched[1]:
+                            continue
+                else:
+                    touched = [path]
+                for path in touched:
+                    current = pending.pop(path, None)
+                    if current is None:
+                        continue
+                    if status == "R100" and not rollup and old_path not in pending:
+                        pending[old_path] = current
+                        continue
+                    batch.append(
+                        FileCommitInfo(
+                            filepath=display_prefix + current,
+                            timestamp=commit.timestamp,
+                            commit_info=commit.commit_info,
+                        )
+                    )
+            yield batch
+            if not pending:
+                break
+    finally:
+        history.close()
+
+
+def resolve_files_walk(start_path: Path, files: GitFiles) -> List[FileCommitInfo]:
+    """Resolve the last commit of every file with one history walk."""
+    return [info for batch in iter_files_walk(start_path, files) for info in batch]
+
+
+def git_output(git_root: Path, *args: str) -> str:
+    """Run a git command in git_root and return its stripped stdout."""
+    result = subprocess.run(
+        ["git", *args], cwd=git_root, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def get_cache_path(git_root: Path) -> Path:
+    """Location of the last-commit cache inside the repository's git dir."""
+    return git_root / git_output(git_root, "rev-parse", "--git-path", CACHE_NAME)
+
+
+def read_cache(cache_path: Path) -> Optional[dict]:
+    """Load a cache file, ignoring missing, corrupt or outdated ones."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return None
+    return cache
+
+
+def write_cache(cache_path: Path, head: str, entries: Dict[str, list]) -> None:
+    """Atomically replace the cache so concurrent readers never see half a file."""
+    fd, tmp_path = tempfile.mkstemp(prefix=CACHE_NAME, dir=cache_path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": CACHE_VERSION, "head": head, "files": entries},
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def build_cache_entries(git_root: Path) -> Dict[str, list]:
+    """Resolve every file committed at HEAD with one walk from the root."""
+    return resolve_cache_entries(git_root, get_committed_paths(git_root))
+
+
+def resolve_cache_entries(git_root: Path, pending: Set[str]) -> Dict[str, list]:
+    """Resolve pending paths with a walk from HEAD that stops once all are found."""
+    entries: Dict[str, list] = {}
+    if not pending:
+        return entries
+
+    history = iter_history(git_root)
+    try:
+        for commit in history:
+            for _, path in commit.changes:
+                if path in pending:
+                    pending.discard(path)
+                    entries[path] = [commit.timestamp, commit.sha]
+            if not pending:
+                break
+    finally:
+        history.close()
+    return entries
+
+
+def get_touched_paths(git_root: Path, old_head: str) -> Set[str]:
+    """Paths changed by any commit in old_head..HEAD, side branches included."""
+    touched = set()
+    history = iter_history(git_root, f"{old_head}..HEAD")
+    try:
+        for commit in history:
+            touched.update(path for _, path in commit.changes)
+    finally:
+        history.close()
+    return touched
+
+
+def reresolve_cache_entries(
+    git_root: Path, old_head: str, entries: Dict[str, list]
+) -> None:
+    """
+    Resolve the paths touched in old_head..HEAD again with a walk from HEAD.
+
+    A merge can bring in side-branch commits older than what old_head
+    already had, so the newest commit in the range is not always the
+    answer.  Paths no range commit touched keep their entries.
+    """
+    touched = get_touched_paths(git_root, old_head)
+    for path in touched:
+        entries.pop(path, None)
+    pending = touched & get_committed_paths(git_root)
+    entries.update(resolve_cache_entries(git_root, pending))
+
+
+def update_cache_entries(
+    git_root: Path, old_head: str, entries: Dict[str, list]
+) -> None:
+    """Apply the commits in old_head..HEAD to entries, newest change first."""
+    seen = set()
+    history = iter_history(git_root, f"{old_head}..HEAD")
+    try:
+        for commit in history:
+            for status, path in commit.changes:
+                if path in seen:
+                    continue
+                seen.add(path)
+                if status == "D":
+                    entries.pop(path, None)
+                else:
+                    entries[path] = [commit.timestamp, commit.sha]
+    finally:
+        history.close()
+
+
+def load_last_commits(
+    git_root: Path, cache: Optional[dict] = None
+) -> Tuple[Optional[str], Dict[str, list]]:
+    """
+    Return HEAD and path -> [timestamp, commit sha] for every file committed
+    at HEAD.
+
+    The result is cached under the git dir together with the HEAD it was
+    built at.  When HEAD moved forward without merges only old_head..HEAD
+    is walked; after a merge the paths changed in that range are resolved
+    again from HEAD.  When the old head is no longer an ancestor (rebase,
+    reset) the cache is rebuilt from scratch.  A cache already held in
+    memory is used instead of reading the file.
+    """
+    try:
+        head = git_output(git_root, "rev-parse", "--verify", "-q", "HEAD")
+        cache_path = get_cache_path(git_root)
+    except subprocess.CalledProcessError:
+        # No commits yet, so there is nothing to resolve.
+        return None, {}
+
+    if cache is None:
+        cache = read_cache(cache_path)
+    if cache is not None and cache.get("head") == head:
+        return head, cache["files"]
+
+    entries = None
+    if cache is not None:
+        is_ancestor = subprocess.run(
+            ["git", "merge-base", "--is-ancestor", cache["head"], head],
+            cwd=git_root,
+            capture_output=True,
+        )
+        if is_ancestor.returncode == 0:
+            entries = cache["files"]
+            if git_output(
+                git_root, "rev-list", "--merges", "-n", "1", f"{cache['head']}..{head}"
+            ):
+                reresolve_cache_entries(git_root, cache["head"], entries)
+            else:
+                update_cache_entries(git_root, cache["head"], entries)
+    if entries is None:
+        entries = build_cache_entries(git_root)
+
+    write_cache(cache_path, head, entries)
+    return head, entries
+
+
+def get_commit_infos(git_root: Path, shas: List[str]) -> Dict[str, Tuple[int, str]]:
+    """
+    Format commits with LOG_FORMAT in one process, so relative dates stay fresh.
+
+    Returns sha -> (author timestamp, commit_info).
+    """
+    if not shas:
+        return {}
+    result = subprocess.run(
+        [
+            "git",
+            "--no-pager",
+            "log",
+            "--color=always",
+            "--no-walk=unsorted",
+            "--stdin",
+            f"--format=%H|{LOG_FORMAT}",
+        ],
+        cwd=git_root,
+        input="\n".join(shas) + "\n",
+        capture_output=True,
+        text=True,
+        check=True,
+        env=get_color_env(),
+    )
+    commit_infos = {}
+    for line in result.stdout.splitlines():
+        sha, timestamp, commit_info = line.split("|", 2)
+        commit_infos[sha] = (int(timestamp), commit_info)
+    return commit_infos
+
+
+def resolve_files_cached(start_path: Path, files: GitFiles) -> List[FileCommitInfo]:
+    """Resolve files from the persistent last-commit cache."""
+    git_root = Path(git_output(start_path, "rev-parse", "--show-toplevel"))
+    _, entries = load_last_commits(git_root)
+    repo_prefix = get_repo_prefix(git_root, start_path)
+    display_prefix = get_display_prefix(start_path)
+
+    found = []
+    for path in files:
+        entry = entries.get(repo_prefix + path)
+        if entry is not None:
+            found.append((path, entry))
+
+    commit_infos = get_commit_infos(git_root, list({sha for _, (_, sha) in found}))
+    return [
+        FileCommitInfo(
+            filepath=display_prefix + path,
+            timestamp=timestamp,
+            commit_info=commit_infos[sha][1],
+        )
+        for path, (timestamp, sha) in found
+        if sha in commit_infos
+    ]
+
+
+def murmur3_32(seed: int, data: bytes, signed_chars: bool) -> int:
+    """
+    The murmur3 variant git hashes Bloom filter keys with.
+
+    Version 1 filters were written by a build where `char` is signed, so
+    bytes >= 0x80 are sign-extended before mixing; version 2 fixed that.
+    """
+    if signed_chars:
+        words = [b - 0x100 if b >= 0x80 else b for b in data]
+    else:
+        words = list(data)
+
+    def byte(i: int, shift: int) -> int:
+        return (words[i] << shift) & 0xFFFFFFFF
+
+    def rotl(value: int, bits: int) -> int:
+        return ((value << bits) | (value >> (32 - bits))) & 0xFFFFFFFF
+
+    h = seed
+    length = len(data)
+    blocks = length // 4
+    for i in range(blocks):
+        k = (
+            byte(4 * i, 0)
+            | byte(4 * i + 1, 8)
+            | byte(4 * i + 2, 16)
+            | byte(4 * i + 3, 24)
+        )
+        k = rotl((k * 0xCC9E2D51) & 0xFFFFFFFF, 15) * 0x1B873593 & 0xFFFFFFFF
+        h = (rotl(h ^ k, 13) * 5 + 0xE6546B64) & 0xFFFFFFFF
+
+    tail = length & 3
+    if tail:
+        k = 0
+        if tail == 3:
+            k ^= byte(4 * blocks + 2, 16)
+        if tail >= 2:
+            k ^= byte(4 * blocks + 1, 8)
+        k ^= byte(4 * blocks, 0)
+        k = rotl((k * 0xCC9E2D51) & 0xFFFFFFFF, 15) * 0x1B873593 & 0xFFFFFFFF
+        h ^= k
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
+
+
+class CommitGraph:
+    """
+    Memory-mapped view of a single `objects/info/commit-graph` file.
+
+    Commits are addressed by their position in the graph.  Only what the
+    history walk needs is decoded: parents, commit date and the
+    changed-path Bloom filter of each commit.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+
+        if len(data) < 8 or data[:4] != GRAPH_SIGNATURE or data[4] != 1:
+            raise ValueError("unsupported commit-graph version")
+        self.hash_len = GRAPH_HASH_LENGTHS.get(data[5])
+        if self.hash_len is None:
+            raise ValueError("unsupported commit-graph hash")
+        if data[7] != 0:
+            raise ValueError("split commit-graphs are not supported")
+
+        chunks = {}
+        for i in range(data[6]):
+            chunk_id, offset = struct.unpack_from(">4sQ", data, 8 + 12 * i)
+            chunks[chunk_id] = offset
+        for required in (b"OIDF", b"OIDL", b"CDAT", b"BIDX", b"BDAT"):
+            if required not in chunks:
+                raise ValueError(f"commit-graph has no {required.decode()} chunk")
+
+        self.fanout = chunks[b"OIDF"]
+        self.oids = chunks[b"OIDL"]
+        self.commits = chunks[b"CDAT"]
+        self.edges = chunks.get(b"EDGE")
+        self.bloom_index = chunks[b"BIDX"]
+        self.num_commits = struct.unpack_from(">I", data, self.fanout + 4 * 255)[0]
+
+        bloom_version, self.num_hashes, _ = struct.unpack_from(
+            ">III", data, chunks[b"BDAT"]
+        )
+        if bloom_version not in (1, 2):
+            raise ValueError("unsupported Bloom filter version")
+        self.signed_chars = bloom_version == 1
+        self.bloom_data = chunks[b"BDAT"] + 12
+        self.commit_size = self.hash_len + 16
+
+    def close(self) -> None:
+        self.data.close()
+
+    def oid(self, pos: int) -> str:
+        start = self.oids + pos * self.hash_len
+        return self.data[start : start + self.hash_len].hex()
+
+    def lookup(self, oid: str) -> Optional[int]:
+        """Position of a commit in the graph, or None if it was written later."""
+        raw = bytes.fromhex(oid)
+        # The fanout table counts the commits whose first byte is <= i.
+        lo = 0
+        if raw[0]:
+            lo = struct.unpack_from(">I", self.data, self.fanout + 4 * (raw[0] - 1))[0]
+        hi = struct.unpack_from(">I", self.data, self.fanout + 4 * raw[0])[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.oids + mid * self.hash_len
+            current = self.data[start : start + self.hash_len]
+            if current == raw:
+                return mid
+            if current < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def parents(self, pos: int) -> List[int]:
+        start = self.commits + pos * self.commit_size + self.hash_len
+        first, second = struct.unpack_from(">II", self.data, start)
+        parents = []
+        if first != GRAPH_PARENT_NONE:
+            parents.append(first)
+        if second == GRAPH_PARENT_NONE:
+            return parents
+        if not second & GRAPH_EXTRA_EDGES:
+            parents.append(second)
+            return parents
+        # Octopus merge: the rest of the parents live in the EDGE chunk.
+        edge = self.edges + 4 * (second & ~GRAPH_EXTRA_EDGES)
+        while True:
+            (value,) = struct.unpack_from(">I", self.data, edge)
+            parents.append(value & ~GRAPH_LAST_EDGE)
+            if value & GRAPH_LAST_EDGE:
+                return parents
+            edge += 4
+
+    def commit_time(self, pos: int) -> int:
+        start = self.commits + pos * self.commit_size + self.hash_len + 8
+        high, low = struct.unpack_from(">II", self.data, start)
+        return ((high & 0x3) << 32) | low
+
+    def bloom_filter(self, pos: int) -> Optional[bytes]:
+        """The changed-path filter of a commit, or None if it can match anything."""
+        end = struct.unpack_from(">I", self.data, self.bloom_index + 4 * pos)[0]
+        start = (
+            0
+            if pos == 0
+            else struct.unpack_from(">I", self.data, self.bloom_index + 4 * (pos - 1))[
+                0
+            ]
+        )
+        if end <= start:
+            return None
+        return self.data[self.bloom_data + start : self.bloom_data + end]
+
+    def bloom_key(self, path: str) -> List[int]:
+        raw = path.encode("utf-8", "surrogateescape")
+        first, second = (
+            murmur3_32(seed, raw, self.signed_chars) for seed in BLOOM_SEEDS
+        )
+        return [(first + i * second) & 0xFFFFFFFF for i in range(self.num_hashes)]
+
+
+def bloom_maybe_contains(bloom_filter: Optional[bytes], key: List[int]) -> bool:
+    """False only when the commit certainly did not change the keyed path."""
+    if bloom_filter is None:
+        return True
+    bits = len(bloom_filter) * 8
+    for value in key:
+        bit = value % bits
+        if not bloom_filter[bit >> 3] & (1 << (bit & 7)):
+            return False
+    return True
+
+
+def open_commit_graph(git_root: Path) -> Optional[CommitGraph]:
+    """The repository's commit-graph, if it exists and carries Bloom filters."""
+    try:
+        path = git_root / git_output(
+            git_root, "rev-parse", "--git-path", "objects/info/commit-graph"
+        )
+        return CommitGraph(path)
+    except (OSError, ValueError, struct.error, subprocess.CalledProcessError):
+        return None
+
+
+class BlobLookup:
+    """A long-running `git cat-file --batch-check` answering `<commit>:<path>`."""
+
+    def __init__(self, git_root: Path):
+        self.proc = subprocess.Popen(
+            ["git", "cat-file", "--batch-check=%(objectname)"],
+            cwd=git_root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="surrogateescape",
+        )
+
+    def object_ids(self, names: List[str]) -> List[Optional[str]]:
+        """Object id for each `<commit>:<path>`, or None where the path is missing."""
+        answers: List[Optional[str]] = []
+        for i in range(0, len(names), CAT_FILE_BATCH):
+            chunk = names[i : i + CAT_FILE_BATCH]
+            self.proc.stdin.write("".join(f"{name}\n" for name in chunk))
+            self.proc.stdin.flush()
+            for _ in chunk:
+                answer = self.proc.stdout.readline().rstrip("\n")
+                answers.append(None if answer.endswith(" missing") else answer)
+        return answers
+
+    def close(self) -> None:
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+class PathNode:
+    """A directory or file still waiting for its last commit."""
+
+    __slots__ = ("path", "parent", "children", "key")
+
+    def __init__(self, path: str, parent: Optional["PathNode"]):
+        self.path = path
+        self.parent = parent
+        self.children: Optional[Dict[str, "PathNode"]] = None
+        self.key: Optional[List[int]] = None
+
+
+def build_path_tree(prefix: str, paths: List[str]) -> PathNode:
+    """Arrange repository-relative file paths below prefix into a tree."""
+    root = PathNode(prefix, None)
+    root.children = {}
+    for path in paths:
+        node = root
+        rest = path[len(prefix) + 1 :] if prefix else path
+        parts = rest.split("/")
+        for depth, part in enumerate(parts):
+            child = node.children.get(part)
+            if child is None:
+                child = PathNode(f"{node.path}/{part}" if node.path else part, node)
+                if depth < len(parts) - 1:
+                    child.children = {}
+                node.children[part] = child
+            node = child
+    return root
+
+
+def iter_files_graph(
+    git_root: Path,
+    graph: CommitGraph,
+    head: int,
+    start_path: Path,
+    files: GitFiles,
+    rollup: bool = False,
+) -> Iterator[ResolvedBatch]:
+    """
+    Resolve files by walking the commit-graph instead of running `git log`.
+
+    The walk visits commits in commit-date order from HEAD and follows every
+    parent of a merge, like the `git log --full-history` walk.  A
+    commit's Bloom filter rules out most paths without reading any object;
+    only the paths it may have changed are compared against the parents
+    through one `git cat-file --batch-check` process.
+    """
+    # As in iter_files_walk, paths missing at HEAD would never resolve and
+    # keep the walk going to the root.
+    committed = get_committed_paths(start_path, rollup)
+    repo_prefix = get_repo_prefix(git_root, start_path)
+    by_path = {repo_prefix + path: path for path in files if path in committed}
+    if not by_path:
+        return
+    prefix = repo_prefix.rstrip("/")
+    display_prefix = get_display_prefix(start_path)
+    root = build_path_tree(prefix, list(by_path))
+    lookup = BlobLookup(git_root)
+    resolved: Dict[str, str] = {}
+
+    def maybe_changed(node: PathNode, bloom_filter: Optional[bytes]) -> bool:
+        if node.key is None:
+            node.key = graph.bloom_key(node.path)
+        return bloom_maybe_contains(bloom_filter, node.key)
+
+    def candidates(bloom_filter: Optional[bytes]) -> List[PathNode]:
+        found = []
+        stack = [root]
+        while stack:
+            for child in stack.pop().children.values():
+                if not maybe_changed(child, bloom_filter):
+                    continue
+                if child.children is None:
+                    found.append(child)
+                else:
+                    stack.append(child)
+        return found
+
+    def differs_from_all(
+        commit: str, parents: List[str], nodes: List[PathNode]
+    ) -> List[PathNode]:
+        names = [f"{sha}:{node.path}" for node in nodes for sha in [commit, *parents]]
+        answers = lookup.object_ids(names)
+        width = len(parents) + 1
+        changed = []
+        for i, node in enumerate(nodes):
+            own, *others = answers[i * width : (i + 1) * width]
+            if own is not None and all(own != other for other in others):
+                changed.append(node)
+        return changed
+
+    def forget(node: PathNode) -> None:
+        while node.parent is not None:
+            siblings = node.parent.children
+            del siblings[node.path.rsplit("/", 1)[-1]]
+            if siblings or node.parent is root:
+                return
+            node = node.parent
+
+    queue = [(-graph.commit_time(head), 0, head)]
+    seen = {head}
+    order = 1
+    try:
+        while queue and root.children:
+            _, _, pos = heapq.heappop(queue)
+            parents = graph.parents(pos)
+            bloom_filter = graph.bloom_filter(pos)
+            # The filter covers the diff against the first parent only.
+            if not prefix or maybe_changed(root, bloom_filter):
+                nodes = candidates(bloom_filter)
+                if nodes:
+                    commit = graph.oid(pos)
+                    changed = differs_from_all(
+                        commit, [graph.oid(p) for p in parents], nodes
+                    )
+                    for node in changed:
+                        resolved[node.path] = commit
+                        forget(node)
+            for parent in parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    heapq.heappush(queue, (-graph.commit_time(parent), order, parent))
+                    order += 1
+    finally:
+        lookup.close()
+
+    commit_infos = get_commit_infos(git_root, list(set(resolved.values())))
+    batch = []
+    for path, sha in resolved.items():
+        timestamp, commit_info = commit_infos[sha]
+        batch.append(
+            FileCommitInfo(
+                filepath=display_prefix + by_path[path],
+                timestamp=timestamp,
+                commit_info=commit_info,
+            )
+        )
+    yield batch
+
+
+def iter_files_graph_or_walk(
+    start_path: Path, files: GitFiles, rollup: bool = False
+) -> Iterator[ResolvedBatch]:
+    """
+    Use the commit-graph when it covers HEAD, else the `git log` walk.
+
+    With rollup, files are immediate children of start_path as for
+    iter_files_walk; the graph compares directories as whole trees anyway.
+    """
+    git_root = Path(git_output(start_path, "rev-parse", "--show-toplevel"))
+    graph = open_commit_graph(git_root)
+    if graph is not None:
+        try:
+            head = graph.lookup(git_output(git_root, "rev-parse", "HEAD"))
+            if head is not None:
+                yield from iter_files_graph(
+                    git_root, graph, head, start_path, files, rollup
+                )
+                return
+        except subprocess.CalledProcessError:
+            pass
+        finally:
+            graph.close()
+    yield from iter_files_walk(start_path, files, rollup)
+
+
+def get_worker_count() -> int:
+    """One git process per CPU that is not already busy, at least one."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except OSError:
+        load = 0.0
+    return max(1, min(MAX_WORKERS, cpus - int(load)))
+
+
+def iter_bounded(fn: Callable, items: Iterable) -> Iterator[Tuple]:
+    """
+    Yield (item, fn(item)) for every item, in completion order, from a
+    thread pool.
+
+    The calls are meant to wait on a git child, so threads are enough and
+    there is no Python process per worker or anything to pickle.  At most
+    twice the worker count is queued at a time; pending work is cancelled
+    when the caller stops early or on Ctrl-C (which the git children
+    receive too).
+    """
+    workers = get_worker_count()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    remaining = iter(items)
+    running = {}
+    try:
+        while True:
+            for item in remaining:
+                running[executor.submit(fn, item)] = item
+                if len(running) >= 2 * workers:
+                    break
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_files_per_file(start_path: Path, files: GitFiles) -> Iterator[ResolvedBatch]:
+    """Resolve files with one `git log --follow` process each."""
+    results = iter_bounded(
+        lambda path: get_file_info(start_path / path, start_path), files
+    )
+    try:
+        for _, result in results:
+            if result is not None:
+                yield [result]
+    finally:
+        results.close()
+
+
+def get_tree_entries(files: GitFiles) -> Tuple[GitFiles, Set[str]]:
+    """The immediate children holding files, and which of them are directories."""
+    entries = set()
+    directories = set()
+    for directory in files.dirs:
+        if directory:
+            directories.add(directory.partition("/")[0])
+    entries.update(directories)
+    for dir_id, name in zip(files.dir_ids, files.names):
+        if not files.dirs[dir_id]:
+            entries.add(name)
+    return GitFiles(sorted(entries)), directories
+
+
+def mark_directories(
+    batches: Iterator[ResolvedBatch], shown: Set[str]
+) -> Iterator[ResolvedBatch]:
+    """Give directory rows (by displayed path) a trailing slash, like `ls -F`."""
+    try:
+        for batch in batches:
+            for file_info in batch:
+                if file_info.filepath in shown:
+                    file_info.filepath += "/"
+            yield batch
+    finally:
+        batches.close()
+
+
+def iter_directory(
+    directory: str,
+    recursive: bool = False,
+    use_git_root: bool = False,
+    engine: str = "walk",
+    use_cache: bool = False,
+    tree: bool = False,
+    use_daemon: bool = False,
+    recurse_submodules: bool = False,
+    skip_renames: bool = False,
+) -> Iterator[ResolvedBatch]:
+    """Collect the files under directory and resolve their git info as it comes."""
+    try:
+        with PROFILER.phase("git root"):
+            if use_git_root:
+                start_path = get_git_root()
+            else:
+                start_path = Path(directory).resolve()
     except subprocess.CalledProcessError:
         print("Error: Not a git repository")
         sys.exit(1)
@@ -121,23 +1358,724 @@ def process_directory(
         print(f"Error: '{directory}' is not a directory")
         sys.exit(1)
 
+    if use_daemon:
+        with PROFILER.phase("daemon"):
+            files_info = query_daemon(start_path, recursive)
+        if files_info is not None:
+            yield files_info
+            return
+
+    if recurse_submodules:
+        try:
+            git_output(start_path, "rev-parse", "--git-dir")
+        except subprocess.CalledProcessError:
+            print("Error: Not a git repository")
+            sys.exit(1)
+        yield from iter_repositories(start_path, engine, use_cache, skip_renames)
+        return
+
     # Get all git tracked files efficiently
     try:
-        files = get_git_files(start_path, recursive)
+        files = get_git_files(start_path, recursive or tree)
     except subprocess.CalledProcessError:
         print("Error: Git command failed")
         sys.exit(1)
 
     if not files:
-        return []
+        return
+
+    if tree:
+        # One row per immediate child.  Directories are resolved as single
+        # paths, never file by file, so the per-file cache is not used here.
+        with PROFILER.phase("filtering"):
+            entries, directories = get_tree_entries(files)
+        if skip_renames:
+            batches = iter_files_walk(start_path, entries, True, skip_renames)
+        elif engine == "per-file":
+            batches = iter_files_per_file(start_path, entries)
+        elif engine == "graph":
+            batches = iter_files_graph_or_walk(start_path, entries, rollup=True)
+        else:
+            batches = iter_files_walk(start_path, entries, rollup=True)
+        display_prefix = get_display_prefix(start_path)
+        shown = {display_prefix + directory for directory in directories}
+        yield from mark_directories(batches, shown)
+    else:
+        yield from iter_files(start_path, files, engine, use_cache, skip_renames)
+
+
+def iter_files(
+    start_path: Path,
+    files: GitFiles,
+    engine: str,
+    use_cache: bool,
+    skip_renames: bool = False,
+) -> Iterator[ResolvedBatch]:
+    """Resolve files with the selected engine."""
+    if skip_renames:
+        # Only the walk sees whole commits, and with them the renames.
+        yield from iter_files_walk(start_path, files, skip_renames=True)
+    elif engine == "per-file":
+        yield from iter_files_per_file(start_path, files)
+    elif use_cache:
+        yield resolve_files_cached(start_path, files)
+    elif engine == "graph":
+        yield from iter_files_graph_or_walk(start_path, files)
+    else:
+        yield from iter_files_walk(start_path, files)
+
+
+def resolve_repository(
+    start_path: Path, engine: str, use_cache: bool, skip_renames: bool = False
+) -> Tuple[List[FileCommitInfo], List[Path]]:
+    """
+    Resolve every file below start_path in its own repository and return
+    them with the repositories nested below it.
+    """
+    nested: List[str] = []
+    try:
+        files = get_git_files(start_path, True, nested)
+        batches = (
+            iter_files(start_path, files, engine, use_cache, skip_renames)
+            if files
+            else ()
+        )
+        files_info = [info for batch in batches for info in batch]
+    except subprocess.CalledProcessError:
+        print(f"Warning: skipping {get_display_path(start_path)}", file=sys.stderr)
+        return [], []
+    return files_info, [start_path / path for path in nested]
+
+
+def iter_repositories(
+    start_path: Path, engine: str, use_cache: bool, skip_renames: bool = False
+) -> Iterator[ResolvedBatch]:
+    """
+    Resolve start_path and every submodule or nested repository below it,
+    each with its own history walk, several repositories at a time.
+    """
+    executor = ThreadPoolExecutor(max_workers=get_worker_count())
+    options = (engine, use_cache, skip_renames)
+    pending = {executor.submit(resolve_repository, start_path, *options)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files_info, nested = future.result()
+                for path in nested:
+                    pending.add(executor.submit(resolve_repository, path, *options))
+                yield files_info
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
-    # Process files in parallel
-    num_processes = min(cpu_count(), 40)
-    with Pool(num_processes) as pool:
-        results = pool.map(get_file_info, files)
-        files_info = [r for r in results if r is not None]
+def process_directory(
+    directory: str,
+    recursive: bool = False,
+    use_git_root: bool = False,
+    engine: str = "walk",
+    use_cache: bool = False,
+    tree: bool = False,
+) -> List[FileCommitInfo]:
+    """Collect the files under directory and resolve their git info."""
+    batches = iter_directory(
+        directory, recursive, use_git_root, engine, use_cache, tree
+    )
+    return [info for batch in batches for info in batch]
+
+
+def sort_key(file_info: FileCommitInfo) -> Tuple[int, str]:
+    """Most recent first; ties keep `git ls-files` (path) order."""
+    return -file_info.timestamp, file_info.filepath
+
+
+def iter_most_recent(
+    batches: Iterator[ResolvedBatch], limit: int
+) -> Iterator[FileCommitInfo]:
+    """
+    Yield the `limit` most recent files in order once every batch is in.
+
+    Any later batch can still outrank what is held, so nothing is printed
+    early; only memory is bounded, to at most 2 * limit candidates.
+    """
+    candidates: List[FileCommitInfo] = []
+    try:
+        for batch in batches:
+            candidates.extend(batch)
+            if len(candidates) > 2 * limit:
+                candidates = heapq.nsmallest(limit, candidates, key=sort_key)
+        yield from heapq.nsmallest(limit, candidates, key=sort_key)
+    finally:
+        batches.close()
+
+
+def format_stream_line(file_info: FileCommitInfo, null: bool) -> str:
+    """One output record whose layout does not depend on the other rows."""
+    if null:
+        return f"{file_info.filepath}\t{file_info.commit_info}\0"
+    return f"{file_info.filepath:<{STREAM_WIDTH}} | {file_info.commit_info}\n"
+
+
+def format_relative_date(timestamp: int, now: int) -> str:
+    """The English text of git's %cr, from show_date_relative() in date.c."""
+
+    def ago(count: int, unit: str) -> str:
+        return f"{count} {unit}{'' if count == 1 else 's'} ago"
 
-    return files_info
+    diff = now - timestamp
+    if diff < 0:
+        return "in the future"
+    if diff < 90:
+        return ago(diff, "second")
+    diff = (diff + 30) // 60
+    if diff < 90:
+        return ago(diff, "minute")
+    diff = (diff + 30) // 60
+    if diff < 36:
+        return ago(diff, "hour")
+    diff = (diff + 12) // 24
+    if diff < 14:
+        return ago(diff, "day")
+    if diff < 70:
+        return ago((diff + 3) // 7, "week")
+    if diff < 365:
+        return ago((diff + 15) // 30, "month")
+    if diff < 1825:
+        years, months = divmod((diff * 12 * 2 + 365) // (365 * 2), 12)
+        if months:
+            return f"{years} year{'' if years == 1 else 's'}, " + ago(months, "month")
+        return ago(years, "year")
+    return ago((diff + 183) // 365, "year")
+
+
+def get_commit_templates(git_root: Path, shas: List[str]) -> Dict[str, Tuple[int, str]]:
+    """sha -> (commit time, LOG_FORMAT output with RELATIVE_DATE_MARK for %cr)."""
+    if not shas:
+        return {}
+    template_format = LOG_FORMAT.replace("%cr", "%x02").split("|", 1)[1]
+    result = subprocess.run(
+        [
+            "git",
+            "--no-pager",
+            "log",
+            "--color=always",
+            "--no-walk=unsorted",
+            "--stdin",
+            f"--format=%H|%ct|{template_format}",
+        ],
+        cwd=git_root,
+        input="\n".join(shas) + "\n",
+        capture_output=True,
+        text=True,
+        check=True,
+        env=get_color_env(),
+    )
+    templates = {}
+    for line in result.stdout.splitlines():
+        sha, commit_time, template = line.split("|", 2)
+        templates[sha] = (int(commit_time), template)
+    return templates
+
+
+def get_socket_path(git_dir: str) -> Path:
+    """Where the daemon for a git dir listens; short enough for AF_UNIX."""
+    digest = hashlib.sha1(git_dir.encode("utf-8", "surrogateescape")).hexdigest()
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / f"{SOCKET_PREFIX}{digest[:16]}.sock"
+
+
+class LastCommitIndex:
+    """
+    Everything --serve answers from: the last-commit cache for HEAD, the
+    paths in the index that have one, and the formatted commits.
+    """
+
+    def __init__(self, git_root: Path):
+        self.git_root = git_root
+        self.index_path = git_root / git_output(
+            git_root, "rev-parse", "--git-path", "index"
+        )
+        self.cache: Optional[dict] = None
+        self.paths: List[str] = []
+        self.templates: Dict[str, Tuple[int, str]] = {}
+        self.state: Optional[Tuple[Optional[str], int]] = None
+
+    def get_state(self) -> Tuple[Optional[str], int]:
+        try:
+            head = git_output(self.git_root, "rev-parse", "--verify", "-q", "HEAD")
+        except subprocess.CalledProcessError:
+            head = None
+        try:
+            index_mtime = self.index_path.stat().st_mtime_ns
+        except OSError:
+            index_mtime = 0
+        return head, index_mtime
+
+    def refresh(self) -> bool:
+        """Bring the index up to date with HEAD and the git index; True if it changed."""
+        state = self.get_state()
+        if state == self.state:
+            return False
+        head, entries = load_last_commits(self.git_root, self.cache)
+        self.cache = {"head": head, "files": entries}
+
+        result = subprocess.run(
+            ["git", "ls-files", "-z", "--cached"],
+            cwd=self.git_root,
+            capture_output=True,
+            check=True,
+        )
+        listed = result.stdout.decode("utf-8", "surrogateescape").split("\0")
+        self.paths = sorted(path for path in listed if path in entries)
+
+        shas = {entries[path][1] for path in self.paths}
+        missing = [sha for sha in shas if sha not in self.templates]
+        self.templates.update(get_commit_templates(self.git_root, missing))
+        self.state = (head, state[1])
+        return True
+
+    def query(self, prefix: str, recursive: bool) -> List[list]:
+        """[path relative to prefix, author timestamp, commit_info] per file."""
+        lo = 0
+        hi = len(self.paths)
+        if prefix:
+            # Every path below "dir/" sorts before "dir0".
+            lo = bisect_left(self.paths, prefix)
+            hi = bisect_left(self.paths, prefix[:-1] + "0")
+        entries = self.cache["files"]
+        now = int(time.time())
+        rows = []
+        for path in self.paths[lo:hi]:
+            rel_path = path[len(prefix) :]
+            if not recursive and "/" in rel_path:
+                continue
+            timestamp, sha = entries[path]
+            commit_time, template = self.templates[sha]
+            rows.append(
+                [
+                    rel_path,
+                    timestamp,
+                    template.replace(
+                        RELATIVE_DATE_MARK, format_relative_date(commit_time, now)
+                    ),
+                ]
+            )
+        return rows
+
+
+class Inotify:
+    """Minimal inotify(7) through libc, enough to notice ref and index writes."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def watch(self, path: Path) -> None:
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {path}")
+
+    def watch_tree(self, path: Path) -> None:
+        for directory, _, _ in os.walk(path):
+            self.watch(Path(directory))
+
+    def read(self) -> bool:
+        """Drain pending events; True if a new directory needs watching."""
+        new_directory = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return new_directory
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = struct.unpack_from("iIII", data, offset)
+                new_directory |= bool(mask & IN_ISDIR and mask & IN_CREATE)
+                offset += 16 + length
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_watcher(git_dirs: List[Path]) -> Optional[Inotify]:
+    """Watch HEAD, the index and all refs; None where inotify is unavailable."""
+    try:
+        watcher = Inotify()
+    except (OSError, AttributeError):
+        return None
+    try:
+        for git_dir in git_dirs:
+            watcher.watch(git_dir)
+            if (git_dir / "refs").is_dir():
+                watcher.watch_tree(git_dir / "refs")
+    except OSError:
+        watcher.close()
+        return None
+    return watcher
+
+
+def answer_client(connection: socket.socket, index: LastCommitIndex) -> None:
+    """Read one JSON request line and reply with the matching rows."""
+    connection.settimeout(CLIENT_TIMEOUT)
+    with connection, connection.makefile("rwb") as stream:
+        try:
+            request = json.loads(stream.readline())
+            rows = index.query(request["prefix"], bool(request["recursive"]))
+            stream.write(json.dumps({"files": rows}).encode() + b"\n")
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+
+def serve(directory: str) -> None:
+    """
+    Keep the last-commit index of a repository in memory and answer
+    queries over a Unix socket until interrupted.
+    """
+    start_path = Path(directory).resolve()
+    try:
+        git_root, git_dir, common_dir = git_output(
+            start_path,
+            "rev-parse",
+            "--show-toplevel",
+            "--absolute-git-dir",
+            "--git-common-dir",
+        ).splitlines()
+    except subprocess.CalledProcessError:
+        print("Error: Not a git repository")
+        sys.exit(1)
+    git_root = Path(git_root)
+
+    index = LastCommitIndex(git_root)
+    index.refresh()
+
+    socket_path = get_socket_path(git_dir)
+    if socket_path.exists():
+        if query_socket(socket_path, {"prefix": "", "recursive": False}) is not None:
+            print(f"Error: already serving {git_root}", file=sys.stderr)
+            sys.exit(1)
+        socket_path.unlink()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(old_umask)
+    server.listen()
+
+    watch_dirs = [Path(git_dir), (start_path / common_dir).resolve()]
+    watcher = open_watcher(list(dict.fromkeys(watch_dirs)))
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    if watcher is not None:
+        selector.register(watcher, selectors.EVENT_READ)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(
+        f"Serving {git_root} on {socket_path} "
+        f"({'inotify' if watcher else 'polling'})",
+        file=sys.stderr,
+    )
+
+    dirty = False
+    try:
+        while True:
+            if watcher is None:
+                timeout = POLL_INTERVAL
+            else:
+                timeout = WATCH_DEBOUNCE if dirty else None
+            events = selector.select(timeout)
+            if not events:
+                index.refresh()
+                dirty = False
+                continue
+            for key, _ in events:
+                if key.fileobj is server:
+                    connection, _ = server.accept()
+                    if dirty:
+                        index.refresh()
+                        dirty = False
+                    answer_client(connection, index)
+                else:
+                    if watcher.read():
+                        for git_dir_path in watch_dirs:
+                            if (git_dir_path / "refs").is_dir():
+                                watcher.watch_tree(git_dir_path / "refs")
+                    dirty = True
+    finally:
+        selector.close()
+        server.close()
+        if watcher is not None:
+            watcher.close()
+        try:
+            socket_path.unlink()
+        except OSError:
+            pass
+
+
+def get_peer_uid(client: socket.socket, socket_path: Path) -> int:
+    """The user running the process at the other end of a connected socket."""
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = client.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        return struct.unpack("3i", credentials)[1]
+    # Without SO_PEERCRED, trust the owner of the socket file instead.
+    return socket_path.stat().st_uid
+
+
+def query_socket(socket_path: Path, request: dict) -> Optional[List[list]]:
+    """
+    Send one request to a daemon; None if nobody answers.
+
+    The socket may sit in a shared temporary directory, so a daemon run by
+    another user is never asked.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(str(socket_path))
+            if get_peer_uid(client, socket_path) != os.getuid():
+                return None
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                return json.loads(stream.readline())["files"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def query_daemon(start_path: Path, recursive: bool) -> Optional[List[FileCommitInfo]]:
+    """Ask a running --serve daemon for start_path; None if none is running."""
+    try:
+        git_root, git_dir = git_output(
+            start_path, "rev-parse", "--show-toplevel", "--absolute-git-dir"
+        ).splitlines()
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+    socket_path = get_socket_path(git_dir)
+    if not socket_path.exists():
+        return None
+    request = {
+        "prefix": get_repo_prefix(Path(git_root), start_path),
+        "recursive": recursive,
+    }
+    rows = query_socket(socket_path, request)
+    if rows is None:
+        return None
+    display_prefix = get_display_prefix(start_path)
+    return [
+        FileCommitInfo(display_prefix + path, timestamp, commit_info)
+        for path, timestamp, commit_info in rows
+    ]
+
+
+def get_head_blobs(start_path: Path) -> Dict[str, str]:
+    """Path relative to start_path -> blob SHA of every file below it at HEAD."""
+    result = subprocess.run(
+        ["git", "ls-tree", "-r", "-z", "HEAD", "."],
+        cwd=start_path,
+        capture_output=True,
+        check=True,
+    )
+    blobs = {}
+    for record in result.stdout.decode("utf-8", "surrogateescape").split("\0"):
+        meta, _, path = record.partition("\t")
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == "blob":
+            blobs[path] = parts[2]
+    return blobs
+
+
+def blame_authors(start_path: Path, path: str) -> Dict[str, int]:
+    """Lines of path at HEAD that each author last touched."""
+    process = subprocess.Popen(
+        ["git", "blame", "--incremental", "--porcelain", "HEAD", "--", path],
+        cwd=start_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8",
+        errors="surrogateescape",
+    )
+    authors: Dict[str, str] = {}
+    lines: Dict[str, int] = {}
+    sha = ""
+    count = 0
+    try:
+        for line in process.stdout:
+            key, _, value = line.rstrip("\n").partition(" ")
+            if key == "author":
+                authors[sha] = value
+            elif key == "filename":
+                # Every group of lines ends with the file name; the author
+                # was sent the first time the commit showed up.
+                author = authors.get(sha, "")
+                lines[author] = lines.get(author, 0) + count
+            elif len(key) >= 40 and value.count(" ") == 2:
+                sha = key
+                count = int(value.rsplit(" ", 1)[1])
+    finally:
+        process.stdout.close()
+        process.wait()
+    return lines
+
+
+def iter_blames(
+    start_path: Path, paths: List[str]
+) -> Iterator[Tuple[str, Dict[str, int]]]:
+    """Blame paths with as many git processes as the per-file engine runs."""
+    return iter_bounded(lambda path: blame_authors(start_path, path), paths)
+
+
+def load_ownership(start_path: Path) -> Dict[str, Dict[str, int]]:
+    """
+    Lines per author for every file below start_path at HEAD.
+
+    Results are cached per path and blob SHA in the git dir, so a later run
+    only blames files whose contents changed.
+    """
+    git_root = Path(git_output(start_path, "rev-parse", "--show-toplevel"))
+    repo_prefix = get_repo_prefix(git_root, start_path)
+    cache_path = git_root / git_output(
+        git_root, "rev-parse", "--git-path", OWNERSHIP_CACHE_NAME
+    )
+    cache = read_cache(cache_path)
+    cached = cache["files"] if cache else {}
+
+    blobs = get_head_blobs(start_path)
+    ownership = {}
+    stale = []
+    for path, blob in blobs.items():
+        entry = cached.get(repo_prefix + path)
+        if entry is not None and entry[0] == blob:
+            ownership[path] = entry[1]
+        else:
+            stale.append(path)
+    ownership.update(iter_blames(start_path, stale))
+
+    outdated = [
+        path
+        for path in cached
+        if path.startswith(repo_prefix) and path[len(repo_prefix) :] not in blobs
+    ]
+    if stale or outdated:
+        entries = {
+            path: entry for path, entry in cached.items() if path not in outdated
+        }
+        for path in stale:
+            entries[repo_prefix + path] = [blobs[path], ownership[path]]
+        write_cache(cache_path, git_output(git_root, "rev-parse", "HEAD"), entries)
+    return ownership
+
+
+def aggregate_ownership(
+    ownership: Dict[str, Dict[str, int]], recursive: bool
+) -> Dict[str, Dict[str, int]]:
+    """
+    Sum lines per author for start_path ("") and its directories: all of
+    them when recursive, otherwise only the immediate children.
+    """
+    directories: Dict[str, Dict[str, int]] = {}
+    for path, authors in ownership.items():
+        parts = path.split("/")[:-1]
+        if not recursive:
+            parts = parts[:1]
+        for depth in range(len(parts) + 1):
+            totals = directories.setdefault("/".join(parts[:depth]), {})
+            for author, lines in authors.items():
+                totals[author] = totals.get(author, 0) + lines
+    return directories
+
+
+def print_ownership(args: argparse.Namespace) -> None:
+    """Print who owns the surviving lines of each directory."""
+    try:
+        start_path = get_git_root() if args.git_root else Path(args.directory).resolve()
+        with PROFILER.phase("resolve"):
+            ownership = load_ownership(start_path)
+    except subprocess.CalledProcessError:
+        print("Error: Not a git repository or no commits yet")
+        sys.exit(1)
+
+    directories = aggregate_ownership(ownership, args.recursive)
+    if not directories:
+        print("No committed files found in the specified directory")
+        return
+
+    display_prefix = get_display_prefix(start_path)
+    names = {
+        directory: (display_prefix + directory + "/" if directory else display_prefix)
+        or "."
+        for directory in directories
+    }
+    width = max(len(name) for name in names.values())
+    for directory in sorted(directories):
+        authors = directories[directory]
+        total = sum(authors.values())
+        top = sorted(authors.items(), key=lambda item: (-item[1], item[0]))
+        owners = "  ".join(
+            f"{author} {lines * 100 // total if total else 0}%"
+            for author, lines in top[:OWNERSHIP_AUTHORS]
+        )
+        print(f"{names[directory]:<{width}} {total:>8} lines  {owners}")
+
+
+def print_files(args: argparse.Namespace) -> None:
+    """Resolve the requested files and print them in the selected layout."""
+    batches = iter_directory(
+        args.directory,
+        args.recursive,
+        args.git_root,
+        args.engine,
+        args.cache,
+        args.tree,
+        use_daemon=not (
+            args.no_daemon or args.tree or args.recurse_submodules or args.skip_renames
+        )
+        and args.engine == "walk",
+        recurse_submodules=args.recurse_submodules,
+        skip_renames=args.skip_renames,
+    )
+    if PROFILER.enabled:
+        batches = PROFILER.iterate("resolve", batches)
+    if args.limit:
+        files_iter = iter_most_recent(batches, args.limit)
+        if PROFILER.enabled:
+            files_iter = PROFILER.iterate("sort", files_iter)
+    else:
+        files_iter = (info for batch in batches for info in batch)
+
+    if args.stream:
+        try:
+            for file_info in files_iter:
+                sys.stdout.write(format_stream_line(file_info, args.null))
+                sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader (head, fzf) went away; stop quietly.
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        return
+
+    files_info = list(files_iter)
+
+    if not files_info:
+        print("No git tracked files found in the specified directory")
+        return
+
+    # Sort by timestamp in descending order
+    with PROFILER.phase("sort"):
+        files_info.sort(key=sort_key)
+
+    # Find the maximum filename length for alignment
+    max_length = max((len(file_info.filepath) for file_info in files_info), default=0)
+
+    # Print the results
+    for file_info in files_info:
+        print(f"{file_info.filepath:<{max_length}} | {file_info.commit_info}")
 
 
 def main():
@@ -159,24 +2097,114 @@ def main():
     parser.add_argument(
         "-g", "--git-root", action="store_true", help="Process from git root directory"
     )
+    parser.add_argument(
+        "-t",
+        "--tree",
+        action="store_true",
+        help="One row per file and subdirectory, showing the last commit under each",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="walk",
+        help="Resolve files with one `git log` walk (default), the commit-graph's "
+        "Bloom filters (falls back to the walk), or one `git log --follow` per file",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        help="Reuse and incrementally update the last-commit cache kept in the git dir",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        metavar="N",
+        help="Only show the N most recently changed files (keeps memory bounded; "
+        "nothing is printed before every file is resolved)",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Print each file as soon as it is resolved (fixed-width columns)",
+    )
+    parser.add_argument(
+        "-z",
+        "--null",
+        action="store_true",
+        help="With --stream, separate columns with a tab and end records with NUL",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep the repository's index in memory and answer other runs over a socket",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Do not ask a running --serve daemon, even if there is one",
+    )
+    parser.add_argument(
+        "--skip-renames",
+        action="store_true",
+        help="Do not count commits that only renamed a file; follow it to its "
+        "old name instead (always uses the walk engine)",
+    )
+    parser.add_argument(
+        "--ownership",
+        action="store_true",
+        help="Show who last touched the surviving lines of each directory, "
+        "from git blame",
+    )
+    parser.add_argument(
+        "--recurse-submodules",
+        action="store_true",
+        help="Also list files of submodules and nested repositories (implies -r)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report time per phase, subprocess latencies and peak RSS on stderr",
+    )
+    parser.add_argument(
+        "--profile-json",
+        metavar="FILE",
+        help="Like --profile, but write the report to FILE as JSON",
+    )
 
     args = parser.parse_args()
+    if args.limit is not None and args.limit < 1:
+        parser.error("--limit must be a positive number")
+    if args.recurse_submodules:
+        if args.tree:
+            parser.error("--recurse-submodules cannot be combined with --tree")
+        args.recursive = True
 
-    files_info = process_directory(args.directory, args.recursive, args.git_root)
-
-    if not files_info:
-        print("No git tracked files found in the specified directory")
+    if args.serve:
+        try:
+            serve(args.directory)
+        except KeyboardInterrupt:
+            pass
         return
 
-    # Sort by timestamp in descending order
-    files_info.sort(key=lambda x: x.timestamp, reverse=True)
-
-    # Find the maximum filename length for alignment
-    max_length = max((len(file_info.filepath) for file_info in files_info), default=0)
-
-    # Print the results
-    for file_info in files_info:
-        print(f"{file_info.filepath:<{max_length}} | {file_info.commit_info}")
+    profile = args.profile or args.profile_json is not None
+    if profile:
+        PROFILER.enable()
+    try:
+        # Whatever the nested phases do not claim is output and glue.
+        with PROFILER.phase("render"):
+            if args.ownership:
+                print_ownership(args)
+            else:
+                print_files(args)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        if profile:
+            PROFILER.disable()
+            write_profile(PROFILER.report(), args.profile_json)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ENGINES = ("walk", "graph", "per-file")
+
+# Every case is measured in a fresh interpreter so peak RSS and the
+# subprocess count belong to that case alone.
+CASES = ("get_git_files", "process_directory", "cli")
+
+
+@dataclass
+class RepoSpec:
+    files: int = 2000
+    depth: int = 3
+    fanout: int = 8
+    commits: int = 500
+    changes_per_commit: int = 3
+    rename_rate: float = 0.05
+    seed: int = 0
+    commit_graph: bool = True
+
+
+@dataclass
+class Measurement:
+    case: str
+    engine: Optional[str]
+    wall_seconds: float
+    subprocesses: int
+    peak_rss_kb: int
+    peak_child_rss_kb: int
+    results: int
+
+
+def find_git_blame_dir() -> Path:
+    """The script under test, installed or still in the chezmoi source tree."""
+    here = Path(__file__).resolve().parent
+    for name in ("git_blame_dir.py", "executable_git_blame_dir.py"):
+        candidate = here / name
+        if candidate.is_file():
+            return candidate
+    print("Error: git_blame_dir.py not found next to this script", file=sys.stderr)
+    sys.exit(1)
+
+
+def fast_import_data(text: str) -> bytes:
+    raw = text.encode()
+    return b"data %d\n" % len(raw) + raw + b"\n"
+
+
+def random_path(rng: random.Random, spec: RepoSpec, index: int) -> str:
+    depth = rng.randint(0, spec.depth)
+    dirs = [f"d{rng.randrange(spec.fanout)}" for _ in range(depth)]
+    return "/".join(dirs + [f"f{index}.txt"])
+
+
+def generate_repo(repo: Path, spec: RepoSpec) -> None:
+    """
+    Build a throwaway repository with `git fast-import`.
+
+    The first commit adds spec.files files spread over spec.depth levels of
+    directories; every later commit edits a few random files and, with
+    probability spec.rename_rate, renames one.  Dates are fixed so two runs
+    with the same seed produce the same repository.
+    """
+    rng = random.Random(spec.seed)
+    repo.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["git", "init", "-q", "-b", "main", str(repo)], check=True)
+
+    paths = sorted({random_path(rng, spec, i) for i in range(spec.files)})
+    timestamp = 1_500_000_000
+    stream = bytearray()
+    for number in range(spec.commits):
+        timestamp += rng.randint(60, 86400)
+        stream += b"commit refs/heads/main\n"
+        stream += b"mark :%d\n" % (number + 1)
+        for role in (b"author", b"committer"):
+            stream += b"%s Bench <bench@example.com> %d +0000\n" % (role, timestamp)
+        stream += fast_import_data(f"commit {number}")
+        if number == 0:
+            for path in paths:
+                stream += f"M 100644 inline {path}\n".encode()
+                stream += fast_import_data(f"{path} 0\n")
+            continue
+        stream += b"from :%d\n" % number
+        for path in rng.sample(paths, min(spec.changes_per_commit, len(paths))):
+            stream += f"M 100644 inline {path}\n".encode()
+            stream += fast_import_data(f"{path} {number}\n")
+        if rng.random() < spec.rename_rate:
+            old = rng.choice(paths)
+            new = random_path(rng, spec, len(paths) + number)
+            if new not in paths:
+                stream += f'R "{old}" "{new}"\n'.encode()
+                paths[paths.index(old)] = new
+
+    subprocess.run(
+        ["git", "fast-import", "--quiet"], cwd=repo, input=bytes(stream), check=True
+    )
+    subprocess.run(["git", "reset", "-q", "--hard", "main"], cwd=repo, check=True)
+    if spec.commit_graph:
+        subprocess.run(
+            ["git", "commit-graph", "write", "--reachable", "--changed-paths"],
+            cwd=repo,
+            check=True,
+            capture_output=True,
+        )
+
+
+def count_subprocesses() -> Callable[[], int]:
+    """Patch subprocess.Popen to count spawns; returns a reader for the count."""
+    spawned = [0]
+    original = subprocess.Popen
+
+    class CountingPopen(original):
+        def __init__(self, *args, **kwargs):
+            spawned[0] += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    return lambda: spawned[0]
+
+
+def measure_case(case: str, engine: Optional[str], repo: Path) -> Measurement:
+    """Run one case in this process; meant to be called in a fresh child."""
+    module = runpy.run_path(str(find_git_blame_dir()))
+    spawned = count_subprocesses()
+    os.chdir(repo)
+
+    start = time.perf_counter()
+    if case == "get_git_files":
+        results = len(module["get_git_files"](repo, True))
+    elif case == "process_directory":
+        results = len(module["process_directory"](str(repo), True, False, engine))
+    else:
+        sys.argv = ["git_blame_dir.py", "-r", "--engine", engine, str(repo)]
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                runpy.run_path(str(find_git_blame_dir()), run_name="__main__")
+            finally:
+                sys.stdout = stdout
+        results = -1
+    wall = time.perf_counter() - start
+
+    return Measurement(
+        case=case,
+        engine=engine,
+        wall_seconds=round(wall, 4),
+        subprocesses=spawned(),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        peak_child_rss_kb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        results=results,
+    )
+
+
+def run_case(case: str, engine: Optional[str], repo: Path) -> Measurement:
+    """Measure a case in a fresh interpreter."""
+    cmd = [sys.executable, str(Path(__file__).resolve()), "measure", case, str(repo)]
+    if engine:
+        cmd += ["--engine", engine]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return Measurement(**json.loads(result.stdout))
+
+
+def run_benchmarks(repo: Path, engines: List[str], repeat: int) -> List[Dict]:
+    measurements = []
+    plan = [("get_git_files", None)]
+    plan += [(case, engine) for case in CASES[1:] for engine in engines]
+    for case, engine in plan:
+        for _ in range(repeat):
+            measurement = run_case(case, engine, repo)
+            print(
+                f"{case:<18} {engine or '-':<9} {measurement.wall_seconds:>9.3f}s "
+                f"{measurement.subprocesses:>7} procs "
+                f"{measurement.peak_rss_kb // 1024:>6} MiB",
+                file=sys.stderr,
+            )
+            measurements.append(asdict(measurement))
+    return measurements
+
+
+def add_repo_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = RepoSpec()
+    parser.add_argument("--files", type=int, default=defaults.files)
+    parser.add_argument(
+        "--depth", type=int, default=defaults.depth, help="Maximum directory depth"
+    )
+    parser.add_argument(
+        "--fanout", type=int, default=defaults.fanout, help="Directories per level"
+    )
+    parser.add_argument("--commits", type=int, default=defaults.commits)
+    parser.add_argument(
+        "--changes-per-commit", type=int, default=defaults.changes_per_commit
+    )
+    parser.add_argument(
+        "--rename-rate",
+        type=float,
+        default=defaults.rename_rate,
+        help="Probability that a commit renames a file",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--no-commit-graph",
+        action="store_true",
+        help="Do not write a commit-graph with changed-path Bloom filters",
+    )
+
+
+def repo_spec(args: argparse.Namespace) -> RepoSpec:
+    return RepoSpec(
+        files=args.files,
+        depth=args.depth,
+        fanout=args.fanout,
+        commits=args.commits,
+        changes_per_commit=args.changes_per_commit,
+        rename_rate=args.rename_rate,
+        seed=args.seed,
+        commit_graph=not args.no_commit_graph,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark git_blame_dir.py on synthetic repositories"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Only build a repository")
+    generate.add_argument("repo", help="Directory to create the repository in")
+    add_repo_arguments(generate)
+
+    run = subparsers.add_parser("run", help="Build a repository and time it")
+    run.add_argument("--repo", help="Benchmark an existing repository instead")
+    run.add_argument(
+        "--engines",
+        default="walk,graph",
+        help=f"Comma-separated engines to compare ({', '.join(ENGINES)})",
+    )
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("-o", "--output", help="Write the JSON report to a file")
+    add_repo_arguments(run)
+
+    measure = subparsers.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("case", choices=CASES)
+    measure.add_argument("repo")
+    measure.add_argument("--engine", choices=ENGINES)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate_repo(Path(args.repo), repo_spec(args))
+        return
+
+    if args.command == "measure":
+        measurement = measure_case(args.case, args.engine, Path(args.repo).resolve())
+        print(json.dumps(asdict(measurement)))
+        return
+
+    engines = [engine for engine in args.engines.split(",") if engine]
+    for engine in engines:
+        if engine not in ENGINES:
+            parser.error(f"unknown engine: {engine}")
+
+    with tempfile.TemporaryDirectory(prefix="git-blame-dir-bench-") as tmp:
+        if args.repo:
+            repo = Path(args.repo).resolve()
+            spec = None
+        else:
+            repo = Path(tmp) / "repo"
+            spec = repo_spec(args)
+            start = time.perf_counter()
+            generate_repo(repo, spec)
+            print(
+                f"generated {spec.files} files / {spec.commits} commits "
+                f"in {time.perf_counter() - start:.1f}s",
+                file=sys.stderr,
+            )
+        report = {
+            "repo": str(repo) if args.repo else None,
+            "spec": asdict(spec) if spec else None,
+            "measurements": run_benchmarks(repo, engines, args.repeat),
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
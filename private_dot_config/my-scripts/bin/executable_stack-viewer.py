@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
+import argparse
+import array
+import bisect
+import ctypes
 import curses
+import functools
+import hashlib
+import json
+import mmap
 import os
 import re
+import select
 import subprocess
 import sys
-
-from pygments import lex
-from pygments.lexers.c_cpp import CppLexer
-from pygments.token import Token
+import threading
+from dataclasses import dataclass
 
 # ---------------------------------------------------------------------------
 # Constants and Regular Expressions
@@ -16,23 +23,300 @@ from pygments.token import Token
 SEPARATOR = "Stack trace (most recent call first):"
 DEFAULT_EDITOR = os.environ.get("EDITOR", "nvim")  # Default editor if not set.
 
-lexer = CppLexer()
+# Both are set up by main(); exporting never builds a lexer or color pairs,
+# so it works without Pygments installed.
+lexer = None
 token_colors = None
 
 # Regex to remove ANSI escape sequences (used in file parsing only)
 ANSI_ESCAPE_REGEX = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
 
+# Regex splitting a stacktrace line into its parts for colorizing.
+FRAME_REGEX = re.compile(
+    r"""
+    ^\s*                             # Leading whitespace
+    \#(?P<frame>\d+)\s+              # Frame number preceded by #
+    (?P<address>0x[0-9a-f]+)\s+       # Address in hex
+    in\s+                           # Literal "in"
+    (?P<func>[^(]+(?:\([^)]*\))?)\s+  # Function signature (name and optional args)
+    at\s+                           # Literal "at"
+    (?P<file>[^\s:]+)               # Filename (up to a space or colon)
+    (?:\:(?P<line>\d+))?            # Optional line number prefixed by :
+    (?:\:(?P<col>\d+))?             # Optional column number prefixed by :
+    (?P<rest>.*)$                   # Remainder of the line (e.g. trailing " ....")
+""",
+    re.VERBOSE,
+)
+
+# How many lines keep their lexed and styled spans between redraws.
+SPAN_CACHE_SIZE = 4096
+# How many traces stay decoded in memory.
+TRACE_CACHE_SIZE = 64
+# Scanned pages are dropped from the process every so many bytes.
+SCAN_RELEASE_BYTES = 16 * 1024 * 1024
+
+NON_WHITESPACE_REGEX = re.compile(rb"\S")
+
+# What a frame's signature leaves out when the frame regex does not match.
+FRAME_NOISE_REGEX = re.compile(r"^\s*#\d+\s+|0x[0-9a-fA-F]+")
+# Frame lines as clustering reads them from the mapped file.
+FRAME_LINE_REGEX = re.compile(rb"^[ \t]*(#(?:.*\S)?)", re.MULTILINE)
+# Signatures remembered by the exact text of the frames, as crash loops
+# repeat it byte for byte.
+SIGNATURE_CACHE_SIZE = 65536
+
+# Function names in frames without a source location.
+FRAME_FUNCTION_REGEX = re.compile(r"\bin\s+([^\s(]+)")
+# Search hits pack a trace and a frame number into one integer.
+FRAME_BITS = 32
+# Traces the search indexer reads per turn while holding the index lock.
+SEARCH_BATCH = 1000
+
+# How long the viewer waits for a key before checking a followed file, in ms.
+FOLLOW_POLL_INTERVAL = 200
+IN_MODIFY = 0x002
+
 # ---------------------------------------------------------------------------
 # Trace Processing Functions
 # ---------------------------------------------------------------------------
 
 
-def load_traces(filename: str) -> list[str]:
-    with open(filename, "r") as f:
-        content = f.read()
-    parts = [part.strip() for part in content.split(SEPARATOR) if part.strip()]
-    traces = [f"{SEPARATOR}\n{part}" for part in parts]
-    return traces
+class TraceIndex:
+    """
+    The traces of a log file, split on SEPARATOR, as a read-only sequence.
+
+    The file is memory-mapped and scanned once for separators; only the byte
+    range of each trace is kept.  A trace is decoded when it is asked for,
+    and the last TRACE_CACHE_SIZE decoded traces are kept.
+    When the file grows, update() scans only from the last separator on.
+    """
+
+    def __init__(self, filename: str):
+        self.file = open(filename, "rb")
+        self.separator = SEPARATOR.encode()
+        self.starts = array.array("Q")
+        self.ends = array.array("Q")
+        self.map = b""
+        # Where the part after the last separator starts; it may still grow.
+        self.tail = 0
+        self.tail_indexed = False
+        # Bumped whenever the file shrinks and all traces are indexed afresh.
+        self.generation = 0
+        # Held while the map changes, for readers in other threads.
+        self.lock = threading.Lock()
+        self.decode = functools.lru_cache(maxsize=TRACE_CACHE_SIZE)(self.text)
+        self.update()
+
+    def update(self) -> bool:
+        """Index what was appended to the file since; True if anything was."""
+        with self.lock:
+            size = os.fstat(self.file.fileno()).st_size
+            if size == len(self.map):
+                return False
+            if size < len(self.map):
+                # Truncated: start over.
+                del self.starts[:], self.ends[:]
+                self.generation += 1
+                self.tail = 0
+                self.tail_indexed = False
+            if self.map:
+                self.map.close()
+            # An empty file cannot be mapped.
+            self.map = (
+                mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                if size
+                else b""
+            )
+            # The last part is read again as it may have grown into a trace.
+            if self.tail_indexed:
+                self.starts.pop()
+                self.ends.pop()
+            self.decode.cache_clear()
+            self.scan(self.tail)
+            return True
+
+    def scan(self, start: int) -> None:
+        """Record the byte range of every part between separators from start on."""
+        released = start - start % mmap.PAGESIZE
+        while True:
+            if start - released >= SCAN_RELEASE_BYTES:
+                released = self.release(released, start)
+            end = self.map.find(self.separator, start)
+            last = end == -1
+            if last:
+                end = len(self.map)
+            # Parts with nothing but whitespace are not traces.
+            indexed = bool(NON_WHITESPACE_REGEX.search(self.map, start, end))
+            if indexed:
+                self.starts.append(start)
+                self.ends.append(end)
+            if last:
+                self.tail = start
+                self.tail_indexed = indexed
+                return
+            start = end + len(self.separator)
+
+    def release(self, start: int, end: int) -> int:
+        """
+        Let the kernel drop the mapped pages in [start, end) from this
+        process; they stay in the page cache.  Returns where released pages end.
+        """
+        end -= end % mmap.PAGESIZE
+        if hasattr(self.map, "madvise") and end > start:
+            self.map.madvise(mmap.MADV_DONTNEED, start, end - start)
+        return end
+
+    def frame_lines(self, idx: int) -> list[bytes]:
+        """The undecoded frame lines ('#...') of a trace, without indentation."""
+        return FRAME_LINE_REGEX.findall(self.map, self.starts[idx], self.ends[idx])
+
+    def text(self, idx: int) -> str:
+        """Decode a trace, bypassing the cache of decode()."""
+        part = self.map[self.starts[idx] : self.ends[idx]].strip()
+        return f"{SEPARATOR}\n{part.decode('utf-8', 'replace')}"
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, idx: int) -> str:
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self.decode(idx)
+
+    def close(self) -> None:
+        self.decode.cache_clear()
+        with self.lock:
+            if self.map:
+                self.map.close()
+            self.file.close()
+
+
+def load_traces(filename: str) -> TraceIndex:
+    return TraceIndex(filename)
+
+
+def function_name(func: str) -> str:
+    """The function of FRAME_REGEX's func group, without its argument list."""
+    return func.split("(", 1)[0].strip()
+
+
+def frame_signature(line: str) -> str:
+    """
+    What identifies a frame across crashes: its function name and file,
+    without frame number, address, arguments or line number.
+    """
+    m = FRAME_REGEX.match(line)
+    if m:
+        return f"{function_name(m.group('func'))} at {m.group('file')}"
+    return FRAME_NOISE_REGEX.sub("", line).strip()
+
+
+def trace_frames(trace: str) -> list[str]:
+    return [
+        frame_signature(line)
+        for line in trace.splitlines()
+        if line.lstrip().startswith("#")
+    ]
+
+
+@dataclass
+class Cluster:
+    frames: list[str]
+    traces: array.array
+
+
+class TraceClusters:
+    """
+    Traces grouped by the hash of their frame signatures, so copies of the
+    same crash end up in one Cluster.
+
+    Frame lines are matched as bytes straight from the mapped file; only
+    frames not seen byte for byte before are decoded for their signatures.
+    """
+
+    def __init__(self, traces: TraceIndex):
+        self.traces = traces
+        self.clusters = {}
+        self.counted = 0
+        self.generation = traces.generation
+        self.last_digest = None
+        self.signatures = {}
+
+    def update(self) -> None:
+        """Hash the traces added since the last call, in one pass."""
+        if self.generation != self.traces.generation:
+            self.clusters.clear()
+            self.counted = 0
+            self.generation = self.traces.generation
+        if self.counted:
+            # The last trace may have grown since.
+            cluster = self.clusters[self.last_digest]
+            cluster.traces.pop()
+            if not cluster.traces:
+                del self.clusters[self.last_digest]
+            self.counted -= 1
+        released = 0
+        for idx in range(self.counted, len(self.traces)):
+            if self.traces.starts[idx] - released >= SCAN_RELEASE_BYTES:
+                released = self.traces.release(released, self.traces.starts[idx])
+            frames = b"\n".join(self.traces.frame_lines(idx))
+            exact = hashlib.blake2b(frames, digest_size=8).digest()
+            digest = self.signatures.get(exact)
+            if digest is None:
+                signature = "\n".join(
+                    frame_signature(line)
+                    for line in frames.decode("utf-8", "replace").splitlines()
+                )
+                digest = hashlib.blake2b(signature.encode(), digest_size=8).digest()
+                if len(self.signatures) >= SIGNATURE_CACHE_SIZE:
+                    self.signatures.clear()
+                self.signatures[exact] = digest
+            cluster = self.clusters.get(digest)
+            if cluster is None:
+                frames = trace_frames(self.traces.text(idx))
+                cluster = self.clusters[digest] = Cluster(frames, array.array("I"))
+            cluster.traces.append(idx)
+            self.last_digest = digest
+        self.counted = len(self.traces)
+
+    def by_count(self) -> list[Cluster]:
+        """Most frequent first; ties in order of first appearance."""
+        return sorted(
+            self.clusters.values(), key=lambda c: (-len(c.traces), c.traces[0])
+        )
+
+
+class Inotify:
+    """Minimal inotify(7) through libc, enough to notice writes to one file."""
+
+    def __init__(self, filename: str):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(filename), IN_MODIFY) < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {filename}")
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> bool:
+        """Drain pending events; True if there were any."""
+        events = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            events = events or bool(data)
+
+    def wait(self) -> None:
+        """Block until the file is written to."""
+        select.select([self], [], [])
+        self.read()
+
+    def close(self) -> None:
+        os.close(self.fd)
 
 
 def simplify_trace(lines: list[str]) -> list[str]:
@@ -57,6 +341,90 @@ def simplify_trace(lines: list[str]) -> list[str]:
     return simplified
 
 
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+
+def frame_name(line: str) -> str:
+    """A frame's function name without arguments, as flame graphs show it."""
+    m = FRAME_REGEX.match(line)
+    if m:
+        name = function_name(m.group("func"))
+    else:
+        m = FRAME_FUNCTION_REGEX.search(line)
+        name = m.group(1) if m else FRAME_NOISE_REGEX.sub("", line).strip()
+    # ';' separates frames in folded stacks.
+    return name.replace(";", ":") or "??"
+
+
+def frame_record(line: str) -> dict:
+    m = FRAME_REGEX.match(line)
+    if not m:
+        return {"text": line.strip()}
+    return {
+        "frame": int(m.group("frame")),
+        "address": m.group("address"),
+        "function": m.group("func").strip(),
+        "file": m.group("file"),
+        "line": int(m.group("line")) if m.group("line") else None,
+        "column": int(m.group("col")) if m.group("col") else None,
+    }
+
+
+def rendered_traces(traces: TraceIndex, render):
+    """
+    Yield (trace number, render(frame lines)) for every trace in one pass
+    over the mapped file, rendering each distinct set of frame lines once.
+    """
+    rendered = {}
+    released = 0
+    for idx in range(len(traces)):
+        if traces.starts[idx] - released >= SCAN_RELEASE_BYTES:
+            released = traces.release(released, traces.starts[idx])
+        frames = b"\n".join(traces.frame_lines(idx))
+        exact = hashlib.blake2b(frames, digest_size=8).digest()
+        result = rendered.get(exact)
+        if result is None:
+            result = render(frames.decode("utf-8", "replace").splitlines())
+            if len(rendered) >= SIGNATURE_CACHE_SIZE:
+                rendered.clear()
+            rendered[exact] = result
+        yield idx, result
+
+
+def export_folded(traces: TraceIndex, out) -> None:
+    """
+    Write each distinct stack once, root frame first and frames joined by
+    ';', followed by how many traces had it: the input of flamegraph.pl.
+    """
+    counts = {}
+    for _, stack in rendered_traces(
+        traces, lambda lines: ";".join(frame_name(line) for line in reversed(lines))
+    ):
+        if stack:
+            counts[stack] = counts.get(stack, 0) + 1
+    for stack, count in counts.items():
+        out.write(f"{stack} {count}\n")
+
+
+def export_json(traces: TraceIndex, out) -> None:
+    """
+    Write one JSON object per trace, numbered from 1 as the viewer does,
+    with the byte offset its text starts at, right after the separator.
+    """
+    for idx, frames in rendered_traces(
+        traces, lambda lines: json.dumps([frame_record(line) for line in lines])
+    ):
+        out.write(
+            f'{{"trace": {idx + 1}, "offset": {traces.starts[idx]}, '
+            f'"frames": {frames}}}\n'
+        )
+
+
+EXPORTERS = {"folded": export_folded, "json": export_json}
+
+
 # ---------------------------------------------------------------------------
 # Curses Rendering Helper Functions
 # ---------------------------------------------------------------------------
@@ -71,132 +439,79 @@ def get_curses_attr_for_token(ttype, token_colors):
     return token_colors.get(ttype, curses.A_NORMAL)
 
 
-def render_line(window, y, x, line, lexer, token_colors, base_attr=0):
+def code_spans(line):
     """
-    Render a line of text at position (y, x) by tokenizing it using Pygments and applying
-    the corresponding curses color attribute for each token.
+    Split a line of code into (text, attr) spans by tokenizing it using Pygments
+    and looking up the curses color attribute for each token.
     """
-    pos = x
-    for ttype, token in lex(line, lexer):
-        attr = get_curses_attr_for_token(ttype, token_colors)
-        combined_attr = attr | base_attr
-        try:
-            window.addstr(y, pos, token, combined_attr)
-        except curses.error:
-            break  # If we run off the screen.
-        pos += len(token)
+    spans = []
+    for ttype, token in lexer.get_tokens(line):
+        # Pygments ends the line with a newline token; rows are cleared instead.
+        token = token.rstrip("\n")
+        if token:
+            spans.append((token, get_curses_attr_for_token(ttype, token_colors)))
+    return spans
 
 
-def render_stacktrace_line(window, y, x, line, base_attr=0):
+def stacktrace_spans(line):
     """
-    For a stacktrace line (starting with '#'), use a regex to split the line into
-    components and colorize parts:
-      - Frame number and address: default color.
-      - Function signature: blue (color pair 9).
+    For a stacktrace line (starting with '#'), use FRAME_REGEX to split the line
+    into components and colorize parts:
+      - Frame number and address: blue (color pair 9).
+      - Function signature: Pygments tokens.
       - Filename: green (color pair 10).
       - Line and column numbers: yellow (color pair 11).
     """
-    pattern = re.compile(
-        r"""
-        ^\s*                             # Leading whitespace
-        \#(?P<frame>\d+)\s+              # Frame number preceded by #
-        (?P<address>0x[0-9a-f]+)\s+       # Address in hex
-        in\s+                           # Literal "in"
-        (?P<func>[^(]+(?:\([^)]*\))?)\s+  # Function signature (name and optional args)
-        # (?P<func>.*)
-        at\s+                           # Literal "at"
-        (?P<file>[^\s:]+)               # Filename (up to a space or colon)
-        (?:\:(?P<line>\d+))?            # Optional line number prefixed by :
-        (?:\:(?P<col>\d+))?             # Optional column number prefixed by :
-        (.*)$                          # Remainder of the line (e.g. trailing " ....")
-    """,
-        re.VERBOSE,
-    )
-    m = pattern.match(line)
-    pos = x
-    if m:
-        # Print the frame number and address (default style).
-        prefix = f"#{m.group('frame')}  {m.group('address')}"
-        try:
-            window.addstr(y, pos, prefix, curses.color_pair(9) | base_attr)
-        except curses.error:
-            return
-        pos += len(prefix)
-
-        _in = " in "
-        try:
-            window.addstr(y, pos, _in, curses.color_pair(6) | base_attr)
-        except curses.error:
-            return
-        pos += len(_in)
-
-        # Print the function signature using Pygments tokenization.
-        func = m.group("func") or ""
-        for ttype, token in lex(func, lexer):
-            # Determine the attribute for this token from our token_colors mapping.
-            attr = get_curses_attr_for_token(ttype, token_colors)
-            try:
-                window.addstr(y, pos, token, attr | base_attr)
-            except curses.error:
-                break  # If we run off the screen, stop rendering.
-            pos += len(token)
-
-        # Print " at " literal.
-        literal = " at "
-        try:
-            window.addstr(y, pos, literal, base_attr)
-        except curses.error:
-            return
-        pos += len(literal)
-
-        # Print the filename in green (color pair 10).
-        file = m.group("file") or ""
-        try:
-            window.addstr(y, pos, file, curses.color_pair(10) | base_attr)
-        except curses.error:
-            return
-        pos += len(file)
-
-        # Print line number (and column if present) in yellow (color pair 11).
-        if m.group("line"):
-            line_part = f":{m.group('line')}"
-            try:
-                window.addstr(y, pos, line_part, curses.color_pair(11) | base_attr)
-            except curses.error:
-                return
-            pos += len(line_part)
-        if m.group("col"):
-            col_part = f":{m.group('col')}"
-            try:
-                window.addstr(y, pos, col_part, curses.color_pair(11) | base_attr)
-            except curses.error:
-                return
-            pos += len(col_part)
-
-        # Print any remaining part of the line.
-        remainder = m.group(7) or ""
-        try:
-            window.addstr(y, pos, remainder, base_attr)
-        except curses.error:
-            return
-    else:
+    m = FRAME_REGEX.match(line)
+    if not m:
         # Fallback: if our regex doesn't match, simply print the line.
-        try:
-            window.addstr(y, x, line, base_attr)
-        except curses.error:
-            return
+        return [(line, 0)]
 
+    spans = [
+        (f"#{m.group('frame')}  {m.group('address')}", curses.color_pair(9)),
+        (" in ", curses.color_pair(6)),
+    ]
+    spans += code_spans(m.group("func") or "")
+    spans.append((" at ", 0))
+    spans.append((m.group("file") or "", curses.color_pair(10)))
+    if m.group("line"):
+        spans.append((f":{m.group('line')}", curses.color_pair(11)))
+    if m.group("col"):
+        spans.append((f":{m.group('col')}", curses.color_pair(11)))
+    spans.append((m.group("rest") or "", 0))
+    return spans
 
-def render_trace_line(window, y, x, line, lexer, token_colors, base_attr=0):
+
+@functools.lru_cache(maxsize=SPAN_CACHE_SIZE)
+def line_spans(line):
     """
-    Determine if the line is a stacktrace line or a regular code line.
+    The styled spans of a trace line, as a tuple of (text, attr).
     If it starts with '#' (after stripping whitespace) we assume it's a stacktrace
     and use our custom colorizing; otherwise, use the standard Pygments-based rendering.
+    Cached, since the same lines are drawn again on every keypress.
     """
     if line.lstrip().startswith("#"):
-        render_stacktrace_line(window, y, x, line, base_attr)
-    else:
-        render_line(window, y, x, line, lexer, token_colors, base_attr)
+        return tuple(stacktrace_spans(line))
+    return tuple(code_spans(line))
+
+
+def render_trace_line(window, y, x, line, base_attr=0, width=None):
+    """
+    Draw a trace line at position (y, x) from its cached spans, clipped to
+    width columns so it cannot wrap onto the next row.
+    """
+    if width is None:
+        width = window.getmaxyx()[1]
+    pos = x
+    for text, attr in line_spans(line):
+        if pos >= width:
+            break
+        text = text[: width - pos]
+        try:
+            window.addstr(y, pos, text, attr | base_attr)
+        except curses.error:
+            break  # If we run off the screen.
+        pos += len(text)
 
 
 def parse_file_and_line(text: str) -> tuple[str, int] | None:
@@ -231,9 +546,221 @@ def open_file_in_editor(stdscr: curses.window, filename: str, line_number: int)
 # ---------------------------------------------------------------------------
 
 
-def main(stdscr: curses.window, traces: list[str]) -> None:
+def frame_terms(line: str) -> tuple[str, ...]:
+    """The function name and source file of a frame line, lowercased."""
+    m = FRAME_REGEX.match(line)
+    if m:
+        name = function_name(m.group("func"))
+        return (name.lower(), m.group("file").lower())
+    m = FRAME_FUNCTION_REGEX.search(line)
+    return (m.group(1).lower(),) if m else ()
+
+
+class TraceSearch:
+    """
+    An inverted index from function names and source files to the frames
+    that mention them, built by a background thread.
+
+    Postings are arrays of hits, each a trace number shifted by FRAME_BITS
+    plus a frame number, in order.  A query matches every term containing it.
+    When following a file, the last trace is indexed once it is complete.
+    """
+
+    def __init__(self, traces: TraceIndex, follow: bool = False):
+        self.traces = traces
+        self.follow = follow
+        self.postings = {}
+        self.indexed = 0
+        self.generation = traces.generation
+        self.released = 0
+        self.terms = {}
+        # Guards postings and indexed.
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.changed.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def notify(self) -> None:
+        """Tell the indexer the trace index was updated."""
+        self.changed.set()
+
+    def run(self) -> None:
+        while not self.stopped:
+            self.changed.clear()
+            while not self.stopped and self.index_batch():
+                pass
+            self.changed.wait()
+
+    def index_batch(self) -> bool:
+        """Index up to SEARCH_BATCH more traces; False once all are done."""
+        batch = []
+        with self.traces.lock:
+            if self.generation != self.traces.generation:
+                with self.lock:
+                    self.postings = {}
+                    self.indexed = 0
+                    self.generation = self.traces.generation
+                self.released = 0
+            end = len(self.traces)
+            if self.follow and self.traces.tail_indexed:
+                end -= 1
+            first = self.indexed
+            for idx in range(first, min(end, first + SEARCH_BATCH)):
+                batch.append(self.traces.frame_lines(idx))
+            if batch:
+                last = self.traces.starts[first + len(batch) - 1]
+                if last - self.released >= SCAN_RELEASE_BYTES:
+                    self.released = self.traces.release(self.released, last)
+        if not batch:
+            return False
+
+        hits = {}
+        for idx, frame_lines in enumerate(batch, first):
+            for frame, line in enumerate(frame_lines):
+                terms = self.terms.get(line)
+                if terms is None:
+                    terms = frame_terms(line.decode("utf-8", "replace"))
+                    # Crash loops repeat the same lines; keep the cache bounded.
+                    if len(self.terms) >= SIGNATURE_CACHE_SIZE:
+                        self.terms.clear()
+                    self.terms[line] = terms
+                hit = idx << FRAME_BITS | frame
+                for term in terms:
+                    hits.setdefault(term, []).append(hit)
+        with self.lock:
+            for term, term_hits in hits.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = array.array("Q")
+                postings.extend(term_hits)
+            self.indexed = first + len(batch)
+        return True
+
+    def search(self, query: str) -> array.array:
+        """Sorted hits of every term that contains query, ignoring case."""
+        query = query.lower()
+        with self.lock:
+            matching = [
+                postings for term, postings in self.postings.items() if query in term
+            ]
+            if len(matching) == 1:
+                return array.array("Q", matching[0])
+            hits = set().union(*matching)
+        return array.array("Q", sorted(hits))
+
+
+def read_query(stdscr: curses.window, prompt: str) -> str | None:
+    """Read a line on the bottom row; None if the user pressed ESC."""
+    query = ""
+    while True:
+        height, width = stdscr.getmaxyx()
+        try:
+            stdscr.move(height - 1, 0)
+            stdscr.clrtoeol()
+            stdscr.addstr(height - 1, 0, (prompt + query)[: width - 1], curses.A_BOLD)
+        except curses.error:
+            pass
+        stdscr.refresh()
+        key = stdscr.getch()
+        if key in (curses.KEY_ENTER, 10, 13):
+            return query
+        elif key == 27:
+            return None
+        elif key in (curses.KEY_BACKSPACE, 127, 8):
+            query = query[:-1]
+        elif 32 <= key < 127:
+            query += chr(key)
+
+
+def choose_cluster(
+    stdscr: curses.window,
+    traces: TraceIndex,
+    clusters: TraceClusters,
+    watcher: Inotify | None = None,
+) -> Cluster | None:
+    """
+    List the unique crashes, most frequent first, and let the user pick one.
+    Returns the chosen Cluster, or None to go back to all traces.
+    """
+    by_count = clusters.by_count()
+    selected = 0
+    scroll_offset = 0
+
+    while True:
+        stdscr.erase()
+        height, width = stdscr.getmaxyx()
+
+        if selected < scroll_offset:
+            scroll_offset = selected
+        elif selected >= scroll_offset + (height - 1):
+            scroll_offset = selected - (height - 1) + 1
+
+        header = (
+            f"{len(by_count)} unique crashes in {len(traces)} traces "
+            f"(↑/k, ↓/j: select, Enter: step through occurrences, c/ESC: all traces)"
+        )
+        try:
+            stdscr.addstr(0, 0, header[:width], curses.A_BOLD)
+        except curses.error:
+            pass
+        if not by_count:
+            # An empty log, or a followed one before its first trace.
+            try:
+                stdscr.addstr(1, 0, "No stack traces yet."[:width])
+            except curses.error:
+                pass
+        for idx in range(
+            scroll_offset, min(len(by_count), scroll_offset + (height - 1))
+        ):
+            cluster = by_count[idx]
+            line = f"{len(cluster.traces):>8}  " + " ← ".join(cluster.frames)
+            attr = curses.A_REVERSE if idx == selected else 0
+            try:
+                stdscr.addstr(1 + idx - scroll_offset, 0, line[:width], attr)
+            except curses.error:
+                pass
+
+        stdscr.refresh()
+        key = stdscr.getch()
+
+        if watcher is not None and watcher.read() and traces.update():
+            clusters.update()
+            by_count = clusters.by_count()
+            selected = max(0, min(selected, len(by_count) - 1))
+
+        if key in (ord("c"), ord("q"), 27):
+            return None
+        elif key in (curses.KEY_UP, ord("k")):
+            if selected > 0:
+                selected -= 1
+        elif key in (curses.KEY_DOWN, ord("j")):
+            if selected < len(by_count) - 1:
+                selected += 1
+        elif key in (curses.KEY_ENTER, 10, 13):
+            if by_count:
+                return by_count[selected]
+
+
+def main(
+    stdscr: curses.window, traces: TraceIndex, watcher: Inotify | None = None
+) -> None:
     global token_colors, lexer
+    from pygments.lexers.c_cpp import CppLexer
+    from pygments.token import Token
+
     curses.curs_set(0)
+    if watcher is not None:
+        # Wake up now and then to pick up traces appended to the file.
+        stdscr.timeout(FOLLOW_POLL_INTERVAL)
 
     if curses.has_colors():
         curses.start_color()
@@ -272,25 +799,52 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
         token_colors = {}
 
     lexer = CppLexer()
-    current_trace_idx = 0
+    # Spans cached before now were styled with other colors.
+    line_spans.cache_clear()
+    # The traces h/l step through: one crash's occurrences, or None for all.
+    order = None
+    position = 0
+    clusters = None
+    search = TraceSearch(traces, follow=watcher is not None)
+    search.start()
+    # The last query, its hits, and how many traces were indexed for them.
+    query = None
+    hits = array.array("Q")
+    hits_indexed = 0
     selected_frame = 0  # This will be our “frame index”
     frame_scroll_offset = 0
     show_full_trace = False  # Toggle: False → simplified (one line per frame), True → full code snippet
 
+    # What each screen row shows, so only rows that change are redrawn.
+    drawn = {}
+    screen_size = None
+    shown = None
+
     while True:
-        stdscr.clear()
+        current_trace_idx = order[position] if order is not None else position
         height, width = stdscr.getmaxyx()
+        if (height, width) != screen_size:
+            screen_size = (height, width)
+            stdscr.clear()
+            drawn.clear()
 
-        # Get the raw trace lines for the current trace.
-        trace_lines = traces[current_trace_idx].splitlines()
+        # Split the current trace into lines only when it or the mode changes.
+        if shown != (current_trace_idx, show_full_trace):
+            shown = (current_trace_idx, show_full_trace)
+            trace_lines = traces[current_trace_idx].splitlines() if traces else []
+            if show_full_trace:
+                # Compute the line numbers for frame headers (lines starting with "#")
+                frame_indices = [
+                    i
+                    for i, line in enumerate(trace_lines)
+                    if line.lstrip().startswith("#")
+                ]
+            else:
+                simplified_lines = simplify_trace(trace_lines)
 
         if show_full_trace:
             # In full mode, we want to show all the lines.
             lines = trace_lines
-            # Compute the line numbers for frame headers (lines starting with "#")
-            frame_indices = [
-                i for i, line in enumerate(trace_lines) if line.lstrip().startswith("#")
-            ]
             total_frames = len(frame_indices)
             if total_frames == 0:
                 # No header lines found; fall back.
@@ -304,7 +858,7 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
                 highlighted_line = frame_indices[selected_frame]
         else:
             # In simplified mode, we already have one line per frame.
-            lines = simplify_trace(trace_lines)
+            lines = simplified_lines
             total_frames = len(lines)
             highlighted_line = (
                 selected_frame  # Here the list "lines" is one frame per element.
@@ -317,18 +871,28 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
             frame_scroll_offset = highlighted_line - (height - 1) + 1
 
         # Prepare the header.
-        header = (
-            f"Stack trace {current_trace_idx + 1}/{len(traces)} "
-            f"(Frame {selected_frame + 1}/{total_frames}) "
+        header = f"Stack trace {current_trace_idx + 1}/{len(traces)} "
+        if order is not None:
+            header += f"(Occurrence {position + 1}/{len(order)}) "
+        header += f"(Frame {selected_frame + 1}/{total_frames}) "
+        if query:
+            current = current_trace_idx << FRAME_BITS | selected_frame
+            hit = bisect.bisect_left(hits, current)
+            number = hit + 1 if hit < len(hits) and hits[hit] == current else "-"
+            header += f"[/{query}: hit {number}/{len(hits)}"
+            if hits_indexed < len(traces):
+                header += f", {hits_indexed}/{len(traces)} traces indexed"
+            header += "] "
+        header += (
             f"(←/h: prev trace, →/l: next trace, ↑/k: prev frame, ↓/j: next frame, "
-            f"Enter: open file, t: toggle full, q/ESC: quit)"
+            f"Enter: open file, t: toggle full, c: crashes, /: search, n/N: next/prev hit, "
+            f"q/ESC: quit)"
         )
-        try:
-            stdscr.addstr(0, 0, header[:width], curses.A_BOLD)
-        except curses.error:
-            pass
+        if watcher is not None:
+            header = "[following] " + header
+        rows = {0: (header[:width], curses.A_BOLD, False)}
 
-        # Render the visible lines.
+        # The visible lines.
         for idx in range(
             frame_scroll_offset, min(len(lines), frame_scroll_offset + (height - 1))
         ):
@@ -338,23 +902,55 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
                 base_attr = curses.A_REVERSE
             else:
                 base_attr = 0
-            render_trace_line(stdscr, y, 0, lines[idx], lexer, token_colors, base_attr)
+            rows[y] = (lines[idx], base_attr, True)
+
+        # Redraw only the rows whose content or highlight changed.
+        for y in range(height):
+            row = rows.get(y)
+            if drawn.get(y) == row:
+                continue
+            try:
+                stdscr.move(y, 0)
+                stdscr.clrtoeol()
+                if row is not None:
+                    text, attr, styled = row
+                    if styled:
+                        render_trace_line(stdscr, y, 0, text, attr, width)
+                    else:
+                        stdscr.addstr(y, 0, text, attr)
+            except curses.error:
+                pass
+            drawn[y] = row
 
         stdscr.refresh()
         key = stdscr.getch()
 
+        if watcher is not None and watcher.read() and traces.update():
+            # The last trace may have grown, or the file was truncated.
+            shown = None
+            search.notify()
+            if clusters is not None:
+                generation = clusters.generation
+                clusters.update()
+                if generation != clusters.generation:
+                    order = None
+            count = len(order) if order is not None else len(traces)
+            position = max(0, min(position, count - 1))
+
         if key in (ord("q"), 27):
+            search.stop()
             break
         elif key in (curses.KEY_LEFT, ord("h")):
             # Previous stack trace.
-            if current_trace_idx > 0:
-                current_trace_idx -= 1
+            if position > 0:
+                position -= 1
                 selected_frame = 0
                 frame_scroll_offset = 0
         elif key in (curses.KEY_RIGHT, ord("l")):
             # Next stack trace.
-            if current_trace_idx < len(traces) - 1:
-                current_trace_idx += 1
+            count = len(order) if order is not None else len(traces)
+            if position < count - 1:
+                position += 1
                 selected_frame = 0
                 frame_scroll_offset = 0
         elif key in (curses.KEY_UP, ord("k")):
@@ -376,6 +972,7 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
                 if file_line_info:
                     filename, line_number = file_line_info
                     open_file_in_editor(stdscr, filename, line_number)
+                    drawn.clear()
                 else:
                     try:
                         stdscr.addstr(
@@ -386,23 +983,120 @@ def main(stdscr: curses.window, traces: list[str]) -> None:
                         )
                     except curses.error:
                         pass
+                    drawn.pop(height - 1, None)
                     stdscr.getch()
         elif key == ord("t"):
             # Toggle between simplified and full code snippet view.
             show_full_trace = not show_full_trace
             frame_scroll_offset = 0
             selected_frame = 0
+        elif key == ord("c"):
+            # Pick one of the unique crashes and step through its occurrences.
+            if clusters is None:
+                try:
+                    stdscr.addstr(
+                        height - 1,
+                        0,
+                        f"Grouping {len(traces)} traces by frame signature...",
+                        curses.A_BOLD,
+                    )
+                except curses.error:
+                    pass
+                stdscr.refresh()
+                clusters = TraceClusters(traces)
+                clusters.update()
+            cluster = choose_cluster(stdscr, traces, clusters, watcher)
+            if watcher is not None:
+                search.notify()
+            if cluster is None:
+                order = None
+                position = current_trace_idx
+            else:
+                order = cluster.traces
+                position = 0
+            selected_frame = 0
+            frame_scroll_offset = 0
+            stdscr.clear()
+            drawn.clear()
+        elif key in (ord("/"), ord("n"), ord("N")):
+            if key == ord("/"):
+                typed = read_query(stdscr, "/")
+                drawn.pop(height - 1, None)
+                if typed:
+                    query = typed
+                    hits_indexed = -1
+            if not query:
+                continue
+            # Search again while the index is still growing.
+            if hits_indexed != search.indexed:
+                hits_indexed = search.indexed
+                hits = search.search(query)
+            if not hits:
+                continue
+            current = current_trace_idx << FRAME_BITS | selected_frame
+            if key == ord("N"):
+                hit = bisect.bisect_left(hits, current) - 1
+            elif key == ord("n"):
+                hit = bisect.bisect_right(hits, current)
+            else:
+                hit = bisect.bisect_left(hits, current)
+            # Wrap around at either end.
+            hit %= len(hits)
+            trace_idx, frame = hits[hit] >> FRAME_BITS, hits[hit] & (
+                (1 << FRAME_BITS) - 1
+            )
+            if order is not None and trace_idx not in order:
+                order = None
+            position = order.index(trace_idx) if order is not None else trace_idx
+            selected_frame = frame
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python stack_viewer.py <log_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Browse stack traces in a log file")
+    parser.add_argument("log_file")
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="Keep watching the file for new traces, like tail -f",
+    )
+    parser.add_argument(
+        "--export",
+        choices=EXPORTERS,
+        help="Write the traces to stdout as folded stacks for flamegraph.pl "
+        "or as JSON lines, instead of browsing them",
+    )
+    args = parser.parse_args()
+    if args.export and args.follow:
+        parser.error("--export cannot be combined with --follow")
 
-    log_filename = sys.argv[1]
-    traces = load_traces(log_filename)
-    if not traces:
-        print("No stack traces found using the separator.")
-        sys.exit(1)
+    traces = load_traces(args.log_file)
+    if args.export:
+        try:
+            EXPORTERS[args.export](traces, sys.stdout)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader went away, e.g. `| head`; do not complain on exit.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        finally:
+            traces.close()
+        sys.exit(0)
+
+    watcher = Inotify(args.log_file) if args.follow else None
+    try:
+        if not traces:
+            if watcher is None:
+                print("No stack traces found using the separator.")
+                sys.exit(1)
+            print("No stack traces yet; waiting for the file to grow.")
+            while not traces:
+                watcher.wait()
+                traces.update()
 
-    curses.wrapper(main, traces)
+        curses.wrapper(main, traces, watcher)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+        traces.close()
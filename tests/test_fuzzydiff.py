@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+
+import io
+import os
+from pathlib import Path
+import runpy
+import shlex
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1]
+    / "private_dot_config/my-scripts/bin/executable_fuzzydiff.py"
+)
+MODULE = runpy.run_path(str(SCRIPT))
+
+DIFF = b"""\
+diff --git a/src/one.c b/src/one.c
+index 1111111..2222222 100644
+--- a/src/one.c
++++ b/src/one.c
+@@ -1,3 +1,3 @@ int main(void)
+ int x;
+-int y;
++int z;
+@@ -10,2 +10,3 @@ static void helper(void)
+ a
++b
+diff --git a/two.py b/two.py
+index 3333333..4444444 100644
+--- a/two.py
++++ b/two.py
+@@ -5 +5 @@
+-old
++new
+"""
+
+
+class FuzzyDiffTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.temp_dir = temporary_directory.name
+        self.spool_path = os.path.join(self.temp_dir, "hunks")
+        self.spool = open(self.spool_path, "wb")
+        self.addCleanup(self.spool.close)
+
+    def fake_command(self, name: str, script: str) -> None:
+        command = Path(self.temp_dir) / "bin" / name
+        command.parent.mkdir(exist_ok=True)
+        command.write_text(f"#!/bin/sh\n{script}\n")
+        command.chmod(0o755)
+        path = f"{command.parent}{os.pathsep}{os.environ['PATH']}"
+        patcher = mock.patch.dict(os.environ, {"PATH": path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_hunk(self, entry: str) -> bytes:
+        position, length = map(int, entry.split("\t")[-2:])
+        with open(self.spool_path, "rb") as spool:
+            spool.seek(position - 1)
+            return spool.read(length)
+
+
+class ParseDiffTest(FuzzyDiffTestCase):
+    def test_entries_name_file_line_and_header(self):
+        entries = list(MODULE["parse_diff"](DIFF.splitlines(True), self.spool))
+
+        self.assertEqual(
+            [entry.split("\t")[:3] for entry in entries],
+            [
+                ["0", "src/one.c:1", "@@ -1,3 +1,3 @@ int main(void)"],
+                ["1", "src/one.c:10", "@@ -10,2 +10,3 @@ static void helper(void)"],
+                ["2", "two.py:5", "@@ -5 +5 @@"],
+            ],
+        )
+        self.assertEqual(self.read_hunk(entries[2]), b"@@ -5 +5 @@\n-old\n+new")
+        self.assertEqual(
+            self.read_hunk(entries[0]),
+            b"@@ -1,3 +1,3 @@ int main(void)\n int x;\n-int y;\n+int z;",
+        )
+
+    def test_on_hunk_gets_added_and_removed_line_counts(self):
+        counts = []
+
+        def on_hunk(entry, added, removed):
+            counts.append((entry[0], added, removed))
+
+        entries = list(MODULE["parse_diff"](DIFF.splitlines(True), None, on_hunk))
+
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(counts, [("0", 1, 1), ("1", 1, 0), ("2", 1, 1)])
+
+    def test_all_hunks_share_one_spool_file(self):
+        for _ in MODULE["parse_diff"](DIFF.splitlines(True), self.spool):
+            pass
+
+        self.assertEqual(os.listdir(self.temp_dir), ["hunks"])
+
+    def test_unspooled_positions_point_into_the_input(self):
+        entries = list(MODULE["parse_diff"](DIFF.splitlines(True)))
+
+        for entry in entries:
+            position, length = map(int, entry.split("\t")[-2:])
+            hunk = DIFF[position - 1 : position - 1 + length]
+            self.assertTrue(hunk.startswith(b"@@"))
+            self.assertFalse(hunk.endswith(b"\n"))
+        self.assertEqual(
+            entries[1].split("\t")[-1],
+            str(len(b"@@ -10,2 +10,3 @@ static void helper(void)\n a\n+b")),
+        )
+
+    def test_hunks_end_where_their_line_counts_say(self):
+        diff = (
+            b"--- a/x\n+++ b/x\n@@ -1,2 +1,2 @@\n--- not a header\n+++ nor this\n"
+            b" context\n\\ No newline at end of file\n"
+            b"diff --git a/y b/y\n"
+        )
+
+        entries = list(MODULE["parse_diff"](diff.splitlines(True), self.spool))
+
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(
+            self.read_hunk(entries[0]),
+            b"@@ -1,2 +1,2 @@\n--- not a header\n+++ nor this\n context\n"
+            b"\\ No newline at end of file",
+        )
+
+    def test_special_sections(self):
+        diff = b"""\
+diff --git a/new.txt b/new.txt
+new file mode 100644
+--- /dev/null
++++ b/new.txt
+@@ -0,0 +1 @@
++hello
+diff --git a/gone.txt b/gone.txt
+deleted file mode 100644
+--- a/gone.txt
++++ /dev/null
+@@ -1 +0,0 @@
+-bye
+diff --git a/logo.png b/logo.png
+index 1111111..2222222 100644
+Binary files a/logo.png and b/logo.png differ
+diff --git a/old name.c b/new name.c
+similarity index 100%
+rename from old name.c
+rename to new name.c
+diff --git "a/t\303\251st" "b/t\303\251st"
+--- "a/t\303\251st"
++++ "b/t\303\251st"
+@@ -1 +1 @@
+-\xff\xfe
++caf\xe9
+diff --cc merged.c
+index 1111111,2222222..3333333
+--- a/merged.c
++++ b/merged.c
+@@@ -1,1 -1,1 +1,2 @@@
+- ours
+ -theirs
+++both
+++more
+"""
+
+        entries = list(MODULE["parse_diff"](diff.splitlines(True), self.spool))
+
+        self.assertEqual(
+            [entry.split("\t")[1:3] for entry in entries],
+            [
+                ["new.txt:1", "@@ -0,0 +1 @@"],
+                ["gone.txt:0", "@@ -1 +0,0 @@"],
+                ["logo.png:1", "Binary files a/logo.png and b/logo.png differ"],
+                ["new name.c:1", "rename old name.c => new name.c"],
+                ["t\u00e9st:1", "@@ -1 +1 @@"],
+                ["merged.c:1", "@@@ -1,1 -1,1 +1,2 @@@"],
+            ],
+        )
+        self.assertEqual(
+            self.read_hunk(entries[4]), b"@@ -1 +1 @@\n-\xff\xfe\n+caf\xe9"
+        )
+        self.assertTrue(self.read_hunk(entries[5]).endswith(b"++more"))
+
+    def test_hunks_are_yielded_before_the_input_ends(self):
+        consumed = []
+
+        def lines():
+            for line in DIFF.splitlines(True):
+                consumed.append(line)
+                yield line
+
+        entries = MODULE["parse_diff"](lines(), self.spool)
+        next(entries)
+
+        # The first hunk is complete once the second one starts.
+        self.assertLess(len(consumed), len(DIFF.splitlines()))
+
+
+class PreviewCacheTest(FuzzyDiffTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        os.mkdir(self.cache_dir)
+        self.fake_command("delta", 'echo "delta $1"; cat')
+        self.cache = MODULE["PreviewCache"](self.spool_path, self.cache_dir)
+        self.addCleanup(self.cache.stop)
+        self.entries = [
+            self.cache.add(entry)
+            for entry in MODULE["parse_diff"](DIFF.splitlines(True), self.spool)
+        ]
+
+    def preview(self, entry: str, width: int) -> str:
+        """Run the preview command the way fzf would for entry."""
+        fields = entry.split("\t")
+        command = self.cache.preview_command()
+        for placeholder, field in (
+            ("{1}", fields[0]),
+            ("{-3}", fields[-3]),
+            ("{-2}", fields[-2]),
+            ("{-1}", fields[-1]),
+        ):
+            command = command.replace(placeholder, shlex.quote(field))
+        environment = {**os.environ, "FZF_PREVIEW_COLUMNS": str(width)}
+        return subprocess.run(
+            ["sh", "-c", command],
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+    def wait_for_renders(self, count: int) -> list[str]:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            rendered = [name for name in os.listdir(self.cache_dir) if "-" in name]
+            if len(rendered) >= count:
+                return sorted(rendered)
+            time.sleep(0.01)
+        self.fail("hunks were not pre-rendered")
+
+    def test_preview_renders_directly_and_records_the_cursor(self):
+        output = self.preview(self.entries[2], 40)
+
+        self.assertEqual(output, "delta --width=40\n@@ -5 +5 @@\n-old\n+new")
+        self.assertEqual(self.cache.read_cursor(), (2, 40))
+
+    def test_hunks_are_rendered_in_the_background_and_served_from_cache(self):
+        self.preview(self.entries[1], 40)
+        self.cache.start()
+
+        rendered = self.wait_for_renders(len(self.entries))
+
+        digests = [entry.split("\t")[-3] for entry in self.entries]
+        self.assertEqual(rendered, sorted(f"{digest}-40" for digest in digests))
+        self.fake_command("delta", "exit 1")
+        self.assertEqual(
+            self.preview(self.entries[2], 40),
+            "delta --width=40\n@@ -5 +5 @@\n-old\n+new",
+        )
+
+    def test_pre_rendering_is_limited_to_a_window_around_the_cursor(self):
+        with mock.patch.dict(
+            MODULE["PreviewCache"].window.__globals__, {"PRERENDER_WINDOW": 1}
+        ):
+            windows = [self.cache.window(index) for index in range(3)]
+
+        digests = [entry.split("\t")[-3] for entry in self.entries]
+        self.assertEqual(
+            [(first, [digest for digest, _, _ in hunks]) for first, hunks in windows],
+            [(0, digests[:2]), (0, digests), (1, digests[1:])],
+        )
+
+    def test_hunks_outside_the_window_are_rendered_afterwards(self):
+        self.preview(self.entries[0], 40)
+        with mock.patch.dict(
+            MODULE["PreviewCache"].schedule.__globals__, {"PRERENDER_WINDOW": 1}
+        ):
+            self.cache.start()
+            rendered = self.wait_for_renders(len(self.entries))
+
+        digests = [entry.split("\t")[-3] for entry in self.entries]
+        self.assertEqual(rendered, sorted(f"{digest}-40" for digest in digests))
+
+    def test_nothing_is_recorded_without_delta(self):
+        with mock.patch.object(MODULE["shutil"], "which", return_value=None):
+            cache = MODULE["PreviewCache"](self.spool_path, self.temp_dir)
+        self.addCleanup(cache.stop)
+
+        for entry in self.entries:
+            self.assertEqual(cache.add(entry), entry)
+
+        self.assertEqual(cache.count, 0)
+        self.assertEqual(cache.window(0), (0, []))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "records")))
+
+
+class SearchIndexTest(FuzzyDiffTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.index_dir = os.path.join(self.temp_dir, "index")
+        os.mkdir(self.index_dir)
+        self.search_index = MODULE["SearchIndex"](self.spool_path, self.index_dir)
+        for entry in MODULE["parse_diff"](DIFF.splitlines(True), self.spool):
+            self.search_index.add(entry)
+
+    def search(self, query: str) -> list[str]:
+        out = io.BytesIO()
+        MODULE["search"](self.index_dir, self.spool_path, query, out)
+        return [line.split("\t")[0] for line in out.getvalue().decode().splitlines()]
+
+    def test_queries_before_the_first_hunk_find_nothing(self):
+        index_dir = os.path.join(self.temp_dir, "empty")
+        os.mkdir(index_dir)
+        search_index = MODULE["SearchIndex"](self.spool_path, index_dir)
+        self.addCleanup(search_index.finish)
+        out = io.BytesIO()
+
+        MODULE["search"](index_dir, self.spool_path, "int", out)
+
+        self.assertEqual(out.getvalue(), b"")
+
+    def test_queries_match_changed_lines_paths_and_headers(self):
+        for finished in (False, True):
+            if finished:
+                self.search_index.finish()
+            with self.subTest(finished=finished):
+                self.assertEqual(self.search("z"), ["0"])
+                self.assertEqual(self.search("b"), ["1"])
+                self.assertEqual(self.search("HELP"), ["1"])
+                self.assertEqual(self.search("two old"), ["2"])
+                self.assertEqual(self.search("one int"), ["0"])
+                self.assertEqual(self.search("x"), [])
+                self.assertEqual(self.search(""), ["0", "1", "2"])
+
+    def test_search_command_prints_matching_entries(self):
+        self.search_index.finish()
+        command = self.search_index.search_command().replace("{q}", "'ld'")
+
+        output = subprocess.run(
+            command, shell=True, capture_output=True, text=True, check=True
+        ).stdout
+
+        self.assertEqual([line.split("\t")[0] for line in output.splitlines()], ["2"])
+
+
+class FileGroupsTest(FuzzyDiffTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.file_groups = MODULE["FileGroups"](self.temp_dir)
+        entries = MODULE["parse_diff"](
+            DIFF.splitlines(True), self.spool, self.file_groups.count
+        )
+        self.rows = list(self.file_groups.group(entries))
+
+    def shell(self, command: str, row: str) -> str:
+        fields = row.split("\t")
+        for placeholder, index in (("{3}", 2), ("{-5}", -5), ("{-4}", -4)):
+            command = command.replace(placeholder, shlex.quote(fields[index]))
+        return subprocess.run(
+            command, shell=True, capture_output=True, text=True, check=True
+        ).stdout
+
+    def test_one_row_per_file_with_stats(self):
+        self.assertEqual(
+            [row.split("\t")[:3] for row in self.rows],
+            [["0", "src/one.c", "[2 hunks +2 -1]"], ["2", "two.py", "[1 hunks +1 -1]"]],
+        )
+        with open(self.file_groups.files_path) as files:
+            self.assertEqual(files.read().splitlines(), self.rows)
+
+    def test_file_preview_spans_its_hunks(self):
+        self.assertEqual(
+            self.read_hunk(self.rows[0]),
+            b"@@ -1,3 +1,3 @@ int main(void)\n int x;\n-int y;\n+int z;\n"
+            b"@@ -10,2 +10,3 @@ static void helper(void)\n a\n+b",
+        )
+
+    def test_enter_expands_a_file_and_accepts_a_hunk(self):
+        enter = self.file_groups.bindings()[0].removeprefix("enter:transform:")
+
+        action = self.shell(enter, self.rows[0]).strip()
+        self.assertTrue(
+            action.startswith("reload(") and action.endswith(")+clear-query+first")
+        )
+        reload = action.removeprefix("reload(").removesuffix(")+clear-query+first")
+        hunks = self.shell(reload, self.rows[0]).splitlines()
+        self.assertEqual(
+            [hunk.split("\t")[:2] for hunk in hunks],
+            [["0", "src/one.c:1"], ["1", "src/one.c:10"]],
+        )
+
+        self.assertEqual(self.shell(enter, hunks[1]).strip(), "accept")
+
+
+class FuzzySelectTest(FuzzyDiffTestCase):
+    def test_picker_can_answer_before_all_entries_are_written(self):
+        self.fake_command("fzf", "head -n 1")
+        produced = []
+
+        def entries():
+            for number in range(100000):
+                produced.append(number)
+                yield f"{number}\tfile:{number}\t@@\t0\t1\t0"
+
+        preview_cache = MODULE["PreviewCache"](self.spool_path, self.temp_dir)
+        selected = MODULE["fuzzy_select"](entries(), preview_cache)
+
+        self.assertEqual(selected, "0\tfile:0\t@@\t0\t1\t0")
+        self.assertLess(len(produced), 100000)
+
+    def test_search_binds_the_query_to_a_reload(self):
+        self.fake_command(
+            "fzf", 'printf "%s\\n" "$@" > "$(dirname "$0")/args"; tail -n 1'
+        )
+        entries = MODULE["parse_diff"](DIFF.splitlines(True), self.spool)
+        preview_cache = MODULE["PreviewCache"](self.spool_path, self.temp_dir)
+        search_index = MODULE["SearchIndex"](self.spool_path, self.temp_dir)
+
+        selected = MODULE["fuzzy_select"](entries, preview_cache, search_index)
+
+        self.assertTrue(selected.startswith("2\ttwo.py:5\t"))
+        args = Path(self.temp_dir, "bin", "args").read_text().splitlines()
+        self.assertIn("--disabled", args)
+        self.assertIn(f"--bind=change:reload:{search_index.search_command()}", args)
+        # The whole diff was indexed while fzf was running.
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "index")))
+
+    def test_group_feeds_one_row_per_file(self):
+        self.fake_command("fzf", 'wc -l > "$(dirname "$0")/rows"')
+        self.fake_command("delta", "cat")
+        file_groups = MODULE["FileGroups"](self.temp_dir)
+        entries = MODULE["parse_diff"](
+            DIFF.splitlines(True), self.spool, file_groups.count
+        )
+        preview_cache = MODULE["PreviewCache"](self.spool_path, self.temp_dir)
+
+        selected = MODULE["fuzzy_select"](entries, preview_cache, None, file_groups)
+
+        self.assertIsNone(selected)
+        self.assertEqual(Path(self.temp_dir, "bin", "rows").read_text().strip(), "2")
+        # Previews of the hunks are still pre-rendered from their IDs.
+        self.assertEqual(preview_cache.count, 3)
+
+    def select_without_reading(self, followed_path, rows, search_index, file_groups):
+        """
+        Run fuzzy_select with an fzf that, like fzf after a reload, does not
+        read its input; it waits for rows lines in followed_path and picks
+        the last.  Returns the selection and the largest queue size seen.
+        """
+        followed_path = shlex.quote(followed_path)
+        self.fake_command(
+            "fzf",
+            f'until [ "$(cat {followed_path} 2>/dev/null | wc -l)" '
+            f"-ge {rows} ]; do sleep 0.05; done; "
+            f"tail -n 1 {followed_path}",
+        )
+        self.fake_command("delta", "cat")
+
+        def entries():
+            for number in range(rows):
+                yield f"{number}\tfile{number}.c:1\t@@\t{number:016x}\t1\t1"
+
+        preview_cache = MODULE["PreviewCache"](self.spool_path, self.temp_dir)
+        sizes = []
+
+        class RecordingQueue(MODULE["queue"].Queue):
+            def put(self, *args, **kwargs):
+                super().put(*args, **kwargs)
+                sizes.append(self.qsize())
+
+        with mock.patch.object(MODULE["queue"], "Queue", RecordingQueue):
+            selected = MODULE["fuzzy_select"](
+                entries(), preview_cache, search_index, file_groups
+            )
+        return selected, max(sizes)
+
+    def test_group_keeps_writing_rows_while_fzf_is_not_reading(self):
+        rows = 5000
+        file_groups = MODULE["FileGroups"](self.temp_dir)
+
+        selected, largest_queue = self.select_without_reading(
+            file_groups.files_path, rows, None, file_groups
+        )
+
+        self.assertTrue(selected.startswith(f"{rows - 1}\tfile{rows - 1}.c\t"))
+        self.assertLessEqual(largest_queue, 2)
+
+    def test_search_keeps_indexing_while_fzf_is_not_reading(self):
+        rows = 5000
+        self.spool.write(b"x\n")
+        self.spool.flush()
+        search_index = MODULE["SearchIndex"](self.spool_path, self.temp_dir)
+
+        selected, largest_queue = self.select_without_reading(
+            search_index.entries_path, rows, search_index, None
+        )
+
+        self.assertTrue(selected.startswith(f"{rows - 1}\tfile{rows - 1}.c:1\t"))
+        self.assertLessEqual(largest_queue, 2)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "index")))
+
+
+if __name__ == "__main__":
+    unittest.main()
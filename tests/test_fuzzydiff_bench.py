@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import io
+import json
+from pathlib import Path
+import runpy
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1]
+    / "private_dot_config/my-scripts/bin/executable_fuzzydiff_bench.py"
+)
+MODULE = runpy.run_path(str(SCRIPT))
+FUZZYDIFF = runpy.run_path(str(SCRIPT.with_name("executable_fuzzydiff.py")))
+
+
+class FuzzyDiffBenchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.diff = Path(temporary_directory.name) / "bench.diff"
+
+    def generate(self, spec) -> dict:
+        with open(self.diff, "wb") as out:
+            return MODULE["generate_diff"](out, spec)
+
+    def test_parser_finds_every_generated_section(self):
+        spec = MODULE["DiffSpec"](
+            size_mb=1, binary_rate=0.1, rename_rate=0.1, combined_rate=0.1
+        )
+
+        counts = self.generate(spec)
+
+        with open(self.diff, "rb") as f:
+            entries = list(FUZZYDIFF["parse_diff"](f))
+        headers = [entry.split("\t")[2] for entry in entries]
+        self.assertEqual(
+            len(entries), counts["hunks"] + counts["binary"] + counts["renames"]
+        )
+        self.assertEqual(
+            sum(header.startswith("Binary files") for header in headers),
+            counts["binary"],
+        )
+        self.assertEqual(
+            sum(header.startswith("@@@") for header in headers), counts["combined"]
+        )
+        self.assertGreater(self.diff.stat().st_size, 1024 * 1024)
+
+    def test_same_seed_writes_same_diff(self):
+        spec = MODULE["DiffSpec"](size_mb=1)
+        first = io.BytesIO()
+        second = io.BytesIO()
+
+        MODULE["generate_diff"](first, spec)
+        MODULE["generate_diff"](second, spec)
+
+        self.assertEqual(first.getvalue(), second.getvalue())
+
+    def test_measure_reports_json_for_one_case(self):
+        counts = self.generate(MODULE["DiffSpec"](size_mb=1))
+
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT), "measure", "spool", str(self.diff)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        measurement = json.loads(result.stdout)
+
+        self.assertEqual(measurement["case"], "spool")
+        self.assertGreaterEqual(measurement["hunks"], counts["hunks"])
+        self.assertEqual(measurement["bytes"], self.diff.stat().st_size)
+        self.assertGreater(measurement["lines_per_second"], 0)
+        self.assertGreater(measurement["peak_rss_kb"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,963 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from pathlib import Path
+import runpy
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1]
+    / "private_dot_config/my-scripts/bin/executable_git_blame_dir.py"
+)
+MODULE = runpy.run_path(str(SCRIPT))
+
+GIT_ENVIRONMENT = {
+    "GIT_AUTHOR_NAME": "Tester",
+    "GIT_AUTHOR_EMAIL": "tester@example.com",
+    "GIT_COMMITTER_NAME": "Tester",
+    "GIT_COMMITTER_EMAIL": "tester@example.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "HOME": "/nonexistent",
+}
+
+
+class GitRepositoryTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.repo = Path(temporary_directory.name).resolve()
+        self.commit_count = 0
+        self.git("init", "-q", "-b", "main")
+
+    def git(self, *args: str) -> str:
+        environment = {**os.environ, **GIT_ENVIRONMENT}
+        date = (
+            f"2020-01-01T00:{self.commit_count // 60:02d}:{self.commit_count % 60:02d}"
+        )
+        environment["GIT_AUTHOR_DATE"] = date
+        environment["GIT_COMMITTER_DATE"] = date
+        result = subprocess.run(
+            ["git", *args],
+            cwd=self.repo,
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout
+
+    def commit(self, message: str, files: dict[str, str]) -> str:
+        for relative_path, contents in files.items():
+            path = self.repo / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(contents)
+        self.git("add", "-A")
+        self.commit_count += 1
+        self.git("commit", "-q", "-m", message)
+        return self.git("rev-parse", "HEAD").strip()
+
+    def make_history(self) -> None:
+        self.commit("initial", {"a.txt": "a\n", "src/b.txt": "b\n", "src/c.txt": "c\n"})
+        self.commit("touch b", {"src/b.txt": "b2\n"})
+        self.commit("touch a", {"a.txt": "a2\n"})
+        self.git("mv", "src/c.txt", "src/d.txt")
+        self.commit("rename c", {})
+        (self.repo / "untracked.txt").write_text("u\n")
+
+    def make_merge_keeping_side(self) -> None:
+        """
+        src/b.txt changes on both branches and the merge keeps the older side,
+        while a.txt outside src/ changes on main only.
+        """
+        self.git("checkout", "-q", "-b", "side")
+        self.commit("side b", {"src/b.txt": "side\n"})
+        self.git("checkout", "-q", "main")
+        self.commit("main b", {"src/b.txt": "main\n", "a.txt": "main\n"})
+        self.commit_count += 1
+        self.git("merge", "-q", "--no-edit", "-X", "theirs", "side")
+
+    def in_repo(self, function, *args):
+        previous = Path.cwd()
+        os.chdir(self.repo)
+        try:
+            return function(*args)
+        finally:
+            os.chdir(previous)
+
+    def resolve(self, directory: Path, recursive: bool = True):
+        return self.in_repo(
+            MODULE["process_directory"], str(directory), recursive, False, "walk"
+        )
+
+    def resolve_per_file(self, directory: Path, recursive: bool = True):
+        return self.in_repo(
+            MODULE["process_directory"], str(directory), recursive, False, "per-file"
+        )
+
+    def summary(self, files_info) -> list[tuple[str, int, str]]:
+        return sorted(
+            (info.filepath, info.timestamp, info.commit_info) for info in files_info
+        )
+
+
+class GitFilesTest(GitRepositoryTestCase):
+    def test_lists_paths_relative_to_start_without_depth_beyond_request(self):
+        self.make_history()
+        self.commit("unicode", {"src/\u00fcber.txt": "u\n", ".hidden": "h\n"})
+
+        self.assertEqual(
+            list(MODULE["get_git_files"](self.repo, False)),
+            [".hidden", "a.txt", "untracked.txt"],
+        )
+        self.assertEqual(
+            list(MODULE["get_git_files"](self.repo / "src", True)),
+            ["b.txt", "d.txt", "\u00fcber.txt"],
+        )
+
+    def test_directory_prefixes_are_stored_once(self):
+        files = MODULE["GitFiles"](["a/b/c.txt", "a/b/d.txt", "e.txt", "a/f.txt"])
+
+        self.assertEqual(files.dirs, ["a/b", "", "a"])
+        self.assertEqual(list(files), ["a/b/c.txt", "a/b/d.txt", "e.txt", "a/f.txt"])
+        self.assertEqual(len(files), 4)
+
+
+class WalkEngineTest(GitRepositoryTestCase):
+    def test_walk_matches_per_file_results(self):
+        self.make_history()
+
+        for merged in (False, True):
+            if merged:
+                self.make_merge_keeping_side()
+            for directory, recursive in (
+                (self.repo, True),
+                (self.repo, False),
+                (self.repo / "src", True),
+            ):
+                with self.subTest(
+                    merged=merged, directory=directory, recursive=recursive
+                ):
+                    self.assertEqual(
+                        self.summary(self.resolve(directory, recursive)),
+                        self.summary(self.resolve_per_file(directory, recursive)),
+                    )
+
+    def test_walk_assigns_newest_commit_to_each_path(self):
+        self.make_history()
+
+        messages = {info.filepath: info.commit_info for info in self.resolve(self.repo)}
+
+        self.assertEqual(set(messages), {"a.txt", "src/b.txt", "src/d.txt"})
+        self.assertIn("touch a", messages["a.txt"])
+        self.assertIn("touch b", messages["src/b.txt"])
+        self.assertIn("rename c", messages["src/d.txt"])
+
+    def test_walk_reports_paths_relative_to_start_path(self):
+        self.make_history()
+
+        commits = list(MODULE["iter_history"](self.repo / "src"))
+
+        self.assertEqual(
+            [[path for _, path in commit.changes] for commit in commits],
+            [["c.txt", "d.txt"], ["b.txt"], ["b.txt", "c.txt"]],
+        )
+
+    def test_commit_is_yielded_before_git_writes_the_next_one(self):
+        marker = MODULE["COMMIT_MARKER"]
+        block = f"{marker}abc|10|info\0\nM\0a.txt\0M\0b.txt\0".encode()
+
+        class SlowGit:
+            """git that is still walking older history after one commit."""
+
+            def __init__(self, *args, **kwargs):
+                read, self.write = os.pipe()
+                self.stdout = os.fdopen(read, "rb")
+                os.write(self.write, block)
+                # Unblocks the test should it wait for more output.
+                self.timer = threading.Timer(5, self.kill)
+                self.timer.start()
+
+            def poll(self):
+                return None
+
+            def kill(self):
+                self.timer.cancel()
+                if self.write is not None:
+                    os.close(self.write)
+                    self.write = None
+
+            def wait(self):
+                return 0
+
+        with mock.patch.object(MODULE["subprocess"], "Popen", SlowGit):
+            history = MODULE["iter_history"](self.repo)
+            start = time.monotonic()
+            commit = next(history)
+            elapsed = time.monotonic() - start
+            history.close()
+
+        self.assertEqual(commit.changes, [("M", "a.txt"), ("M", "b.txt")])
+        self.assertLess(elapsed, 4)
+
+
+class SkipRenamesTest(GitRepositoryTestCase):
+    def resolve_messages(self, directory: Path, tree: bool = False) -> dict:
+        batches = self.in_repo(
+            lambda: list(
+                MODULE["iter_directory"](
+                    str(directory), True, tree=tree, skip_renames=True
+                )
+            )
+        )
+        return {info.filepath: info.commit_info for batch in batches for info in batch}
+
+    def test_pure_renames_are_followed_to_the_last_content_change(self):
+        self.make_history()
+        self.git("mv", "src/d.txt", "src/e.txt")
+        self.commit("rename d", {})
+        self.git("mv", "src/b.txt", "src/f.txt")
+        self.commit("rename and edit b", {"src/f.txt": "b3\n"})
+
+        messages = self.resolve_messages(self.repo / "src")
+
+        self.assertEqual(set(messages), {"src/e.txt", "src/f.txt"})
+        self.assertIn("initial", messages["src/e.txt"])
+        self.assertIn("rename and edit b", messages["src/f.txt"])
+
+    def test_renames_are_listed_with_their_old_path(self):
+        self.make_history()
+
+        commits = list(MODULE["iter_history"](self.repo / "src", None, True))
+
+        self.assertEqual(commits[0].changes, [("R100", "d.txt")])
+        self.assertEqual(commits[0].renames, {"d.txt": "c.txt"})
+
+    def test_merges_that_rename_and_edit_count_as_changes(self):
+        lines = "".join(f"line {number}\n" for number in range(5))
+        self.commit("base", {"a.txt": lines, "other.txt": "o\n"})
+        self.git("checkout", "-q", "-b", "side")
+        self.git("mv", "a.txt", "b.txt")
+        self.commit("side rename", {})
+        self.git("checkout", "-q", "main")
+        self.commit("modo", {"other.txt": "main\n"})
+        self.commit_count += 1
+        self.git("merge", "-q", "--no-commit", "side")
+        merge = self.commit(
+            "merge", {"b.txt": lines + "merged\n", "other.txt": "merged\n"}
+        )
+
+        commits = list(MODULE["iter_history"](self.repo, None, True))
+        messages = self.resolve_messages(self.repo)
+
+        self.assertEqual(commits[0].sha, merge)
+        self.assertEqual(commits[0].changes, [("RM", "b.txt"), ("MM", "other.txt")])
+        self.assertEqual(commits[0].renames, {})
+        self.assertIn("merge", messages["b.txt"])
+        self.assertIn("merge", messages["other.txt"])
+
+    def test_tree_ignores_moves_inside_a_child(self):
+        self.make_history()
+
+        messages = self.resolve_messages(self.repo, tree=True)
+
+        # "rename c" only moved a file within src/.
+        self.assertIn("touch b", messages["src/"])
+        self.assertIn("touch a", messages["a.txt"])
+
+
+class TreeModeTest(GitRepositoryTestCase):
+    def resolve_tree(self, directory: Path, engine: str = "walk"):
+        return self.in_repo(
+            MODULE["process_directory"],
+            str(directory),
+            False,
+            False,
+            engine,
+            False,
+            True,
+        )
+
+    def test_directories_show_newest_commit_below_them(self):
+        self.make_history()
+        self.commit("deep change", {"src/deep/e.txt": "e\n"})
+
+        messages = {
+            info.filepath: info.commit_info for info in self.resolve_tree(self.repo)
+        }
+
+        # commit() stages everything, so untracked.txt joins "deep change".
+        self.assertEqual(set(messages), {"a.txt", "src/", "untracked.txt"})
+        self.assertIn("touch a", messages["a.txt"])
+        self.assertIn("deep change", messages["src/"])
+
+    def test_tree_rows_match_across_engines(self):
+        self.make_history()
+        self.commit("deep change", {"src/deep/e.txt": "e\n"})
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+
+        for directory in (self.repo, self.repo / "src"):
+            walk = self.summary(self.resolve_tree(directory))
+            for engine in ("graph", "per-file"):
+                with self.subTest(directory=directory, engine=engine):
+                    self.assertEqual(
+                        self.summary(self.resolve_tree(directory, engine)), walk
+                    )
+
+    def test_graph_engine_falls_back_to_the_rollup_walk(self):
+        self.make_history()
+        self.commit("deep change", {"src/deep/e.txt": "e\n"})
+
+        self.assertFalse((self.repo / ".git/objects/info/commit-graph").exists())
+        self.assertEqual(
+            self.summary(self.resolve_tree(self.repo, "graph")),
+            self.summary(self.resolve_tree(self.repo)),
+        )
+
+    def test_walk_stops_once_every_child_is_resolved(self):
+        self.commit("old", {"src/b.txt": "b\n", "a.txt": "a\n"})
+        for number in range(5):
+            self.commit(f"src {number}", {"src/b.txt": f"{number}\n"})
+        self.commit("a", {"a.txt": "a2\n"})
+        visited = []
+        iter_history = MODULE["iter_history"]
+
+        def recording_history(*args):
+            for commit in iter_history(*args):
+                visited.append(commit.sha)
+                yield commit
+
+        with mock.patch.dict(
+            MODULE["iter_files_walk"].__globals__, {"iter_history": recording_history}
+        ):
+            self.resolve_tree(self.repo)
+
+        self.assertEqual(len(visited), 2)
+
+    def test_untracked_files_do_not_keep_the_walk_going(self):
+        self.commit("old", {"src/b.txt": "b\n", "a.txt": "a\n"})
+        for number in range(5):
+            self.commit(f"src {number}", {"src/b.txt": f"{number}\n"})
+        self.commit("a", {"a.txt": "a2\n"})
+        (self.repo / "untracked.txt").write_text("u\n")
+        self.git("add", "-N", "untracked.txt")
+        (self.repo / "ignored.txt").write_text("i\n")
+        visited = []
+        iter_history = MODULE["iter_history"]
+
+        def recording_history(*args):
+            for commit in iter_history(*args):
+                visited.append(commit.sha)
+                yield commit
+
+        with mock.patch.dict(
+            MODULE["iter_files_walk"].__globals__, {"iter_history": recording_history}
+        ):
+            messages = {
+                info.filepath: info.commit_info
+                for info in self.resolve(self.repo, False)
+            }
+
+        self.assertEqual(set(messages), {"a.txt"})
+        self.assertEqual(len(visited), 1)
+
+    def test_limit_ranks_author_dates_later_than_commit_dates(self):
+        for message, path, date in (
+            ("fd", "d.txt", "2020-01-20T00:00:00"),
+            ("fa", "a.txt", "2020-01-11T00:00:00"),
+            ("g", "g.txt", "2020-01-15T00:00:00"),
+        ):
+            self.commit(message, {path: f"{message}\n"})
+            self.git("commit", "-q", "--amend", "--no-edit", f"--date={date}")
+
+        most_recent = self.in_repo(
+            lambda: list(
+                MODULE["iter_most_recent"](MODULE["iter_directory"](str(self.repo)), 1)
+            )
+        )
+
+        self.assertEqual([info.filepath for info in most_recent], ["d.txt"])
+
+
+class PerFileEngineTest(unittest.TestCase):
+    def test_worker_count_leaves_busy_cpus_alone(self):
+        with mock.patch.object(
+            MODULE["os"], "sched_getaffinity", return_value=set(range(8))
+        ), mock.patch.object(MODULE["os"], "getloadavg", return_value=(5.5, 0, 0)):
+            self.assertEqual(MODULE["get_worker_count"](), 3)
+
+    def test_worker_count_is_at_least_one_and_capped(self):
+        with mock.patch.object(
+            MODULE["os"], "sched_getaffinity", return_value=set(range(8))
+        ), mock.patch.object(MODULE["os"], "getloadavg", return_value=(20.0, 0, 0)):
+            self.assertEqual(MODULE["get_worker_count"](), 1)
+        with mock.patch.object(
+            MODULE["os"], "sched_getaffinity", return_value=set(range(256))
+        ), mock.patch.object(MODULE["os"], "getloadavg", return_value=(0.0, 0, 0)):
+            self.assertEqual(MODULE["get_worker_count"](), MODULE["MAX_WORKERS"])
+
+    def test_stopping_early_cancels_queued_files(self):
+        calls = []
+
+        def get_file_info(filepath, repository):
+            calls.append(filepath)
+            return MODULE["FileCommitInfo"](str(filepath), 1, "info")
+
+        files = MODULE["GitFiles"](f"file{i}" for i in range(100))
+        with mock.patch.dict(
+            MODULE["iter_files_per_file"].__globals__,
+            {"get_file_info": get_file_info, "get_worker_count": lambda: 2},
+        ):
+            batches = MODULE["iter_files_per_file"](Path("/repo"), files)
+            next(batches)
+            batches.close()
+
+        self.assertLess(len(calls), len(files))
+
+
+class CacheTest(GitRepositoryTestCase):
+    def resolve_cached(self):
+        return self.in_repo(
+            MODULE["process_directory"], str(self.repo), True, False, "walk", True
+        )
+
+    def read_cache(self) -> dict:
+        return MODULE["read_cache"](MODULE["get_cache_path"](self.repo))
+
+    def test_cache_matches_walk_and_is_stored_in_git_dir(self):
+        self.make_history()
+
+        self.assertEqual(
+            self.summary(self.resolve_cached()), self.summary(self.resolve(self.repo))
+        )
+        cache = self.read_cache()
+        self.assertTrue((self.repo / ".git" / MODULE["CACHE_NAME"]).is_file())
+        self.assertEqual(cache["head"], self.git("rev-parse", "HEAD").strip())
+        self.assertEqual(set(cache["files"]), {"a.txt", "src/b.txt", "src/d.txt"})
+
+    def test_cache_walks_only_new_commits_when_head_moves_forward(self):
+        self.make_history()
+        self.resolve_cached()
+        head = self.commit("touch b again", {"src/b.txt": "b3\n"})
+        self.git("rm", "-q", "a.txt")
+        self.commit("drop a", {})
+
+        build = mock.Mock()
+        with mock.patch.dict(
+            MODULE["load_last_commits"].__globals__, {"build_cache_entries": build}
+        ):
+            files_info = self.resolve_cached()
+        build.assert_not_called()
+
+        self.assertEqual(
+            self.summary(files_info), self.summary(self.resolve(self.repo))
+        )
+        self.assertEqual(self.read_cache()["files"]["src/b.txt"][1], head)
+        self.assertNotIn("a.txt", self.read_cache()["files"])
+
+    def test_cache_is_rebuilt_when_old_head_is_not_an_ancestor(self):
+        self.make_history()
+        self.commit("touch a again", {"a.txt": "a3\n"})
+        self.resolve_cached()
+        self.git("reset", "-q", "--hard", "HEAD~1")
+
+        self.assertEqual(
+            self.summary(self.resolve_cached()), self.summary(self.resolve(self.repo))
+        )
+        self.assertEqual(
+            self.read_cache()["head"], self.git("rev-parse", "HEAD").strip()
+        )
+
+    def test_cache_resolves_merged_paths_again_without_a_rebuild(self):
+        self.commit("initial", {"z.txt": "z\n", "y.txt": "y\n", "x.txt": "x\n"})
+        self.git("branch", "side")
+        self.git("checkout", "-q", "side")
+        self.commit("side Z", {"z.txt": "side\n", "y.txt": "side\n"})
+        self.git("checkout", "-q", "main")
+        main_z = self.commit("main Z", {"z.txt": "main\n"})
+        self.resolve_cached()
+        self.commit_count += 1
+        self.git("merge", "-q", "--no-edit", "-X", "ours", "side")
+
+        build = mock.Mock()
+        with mock.patch.dict(
+            MODULE["load_last_commits"].__globals__, {"build_cache_entries": build}
+        ):
+            files_info = self.resolve_cached()
+        build.assert_not_called()
+
+        self.assertEqual(
+            self.summary(files_info), self.summary(self.resolve(self.repo))
+        )
+        self.assertEqual(self.read_cache()["files"]["z.txt"][1], main_z)
+
+    def test_cache_picks_newer_side_commits_that_a_merge_discarded(self):
+        self.commit("initial", {"z.txt": "z\n", "x.txt": "x\n"})
+        self.git("branch", "side")
+        self.commit("main Z", {"z.txt": "main\n"})
+        self.resolve_cached()
+        self.git("checkout", "-q", "side")
+        side_z = self.commit("side Z", {"z.txt": "side\n"})
+        self.git("checkout", "-q", "main")
+        self.commit_count += 1
+        self.git("merge", "-q", "--no-edit", "-X", "ours", "side")
+
+        files_info = self.resolve_cached()
+
+        self.assertEqual(
+            self.summary(files_info), self.summary(self.resolve_per_file(self.repo))
+        )
+        self.assertEqual(self.read_cache()["files"]["z.txt"][1], side_z)
+
+
+class DaemonTest(GitRepositoryTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        runtime_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(runtime_directory.cleanup)
+        environment = mock.patch.dict(
+            os.environ, {"XDG_RUNTIME_DIR": runtime_directory.name}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def start_daemon(self) -> Path:
+        daemon = subprocess.Popen(
+            ["python3", str(SCRIPT), "--serve", str(self.repo)],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(daemon.wait)
+        self.addCleanup(daemon.terminate)
+        self.assertIn("Serving", daemon.stderr.readline())
+        daemon.stderr.close()
+        return MODULE["get_socket_path"](str(self.repo / ".git"))
+
+    def query(self, directory: Path, recursive: bool = True):
+        return self.in_repo(MODULE["query_daemon"], directory, recursive)
+
+    def test_daemon_answers_like_the_walk(self):
+        self.make_history()
+        socket_path = self.start_daemon()
+
+        self.assertTrue(socket_path.exists())
+        for directory, recursive in (
+            (self.repo, True),
+            (self.repo, False),
+            (self.repo / "src", True),
+        ):
+            with self.subTest(directory=directory, recursive=recursive):
+                self.assertEqual(
+                    self.summary(self.query(directory, recursive)),
+                    self.summary(self.resolve(directory, recursive)),
+                )
+
+    def test_daemon_follows_new_commits(self):
+        self.make_history()
+        self.start_daemon()
+        self.query(self.repo)
+        self.commit("add e", {"src/e.txt": "e\n"})
+
+        self.assertEqual(
+            self.summary(self.query(self.repo)), self.summary(self.resolve(self.repo))
+        )
+
+    def test_daemon_answers_like_the_walk_below_a_merge(self):
+        self.make_history()
+        self.make_merge_keeping_side()
+        self.start_daemon()
+
+        self.assertEqual(
+            self.summary(self.query(self.repo / "src")),
+            self.summary(self.resolve(self.repo / "src")),
+        )
+
+    def test_daemon_of_another_user_is_not_asked(self):
+        self.make_history()
+        self.start_daemon()
+
+        with mock.patch.object(MODULE["os"], "getuid", return_value=os.getuid() + 1):
+            self.assertIsNone(self.query(self.repo))
+
+    def test_no_daemon_means_no_answer(self):
+        self.make_history()
+
+        self.assertIsNone(self.query(self.repo))
+
+    def test_relative_dates_match_git(self):
+        now = 1_700_000_000
+        # Expected strings are git's %cr for the same offsets.
+        for offset, expected in (
+            (-5, "in the future"),
+            (1, "1 second ago"),
+            (89, "89 seconds ago"),
+            (90, "2 minutes ago"),
+            (5369, "89 minutes ago"),
+            (5400, "2 hours ago"),
+            (35 * 3600, "35 hours ago"),
+            (36 * 3600, "2 days ago"),
+            (13 * 86400, "13 days ago"),
+            (14 * 86400, "2 weeks ago"),
+            (70 * 86400, "2 months ago"),
+            (365 * 86400, "1 year ago"),
+            (400 * 86400, "1 year, 1 month ago"),
+            (1000 * 86400, "2 years, 9 months ago"),
+            (1825 * 86400, "5 years ago"),
+        ):
+            with self.subTest(offset=offset):
+                self.assertEqual(
+                    MODULE["format_relative_date"](now - offset, now), expected
+                )
+
+
+class GraphEngineTest(GitRepositoryTestCase):
+    def resolve_graph(self, directory: Path, recursive: bool = True):
+        return self.in_repo(
+            MODULE["process_directory"], str(directory), recursive, False, "graph"
+        )
+
+    def make_merged_history(self) -> None:
+        self.make_history()
+        self.git("checkout", "-q", "-b", "side")
+        self.commit("side b", {"src/b.txt": "side\n"})
+        self.git("checkout", "-q", "main")
+        self.commit("main a", {"a.txt": "main\n"})
+        self.commit_count += 1
+        self.git("merge", "-q", "--no-ff", "-m", "merge side", "side")
+
+    def test_graph_matches_walk_without_running_git_log(self):
+        self.make_merged_history()
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+        walk = mock.Mock(side_effect=AssertionError("fell back to git log"))
+
+        with mock.patch.dict(
+            MODULE["iter_files_graph_or_walk"].__globals__, {"iter_files_walk": walk}
+        ):
+            results = {
+                (directory, recursive): self.summary(
+                    self.resolve_graph(directory, recursive)
+                )
+                for directory, recursive in (
+                    (self.repo, True),
+                    (self.repo, False),
+                    (self.repo / "src", True),
+                )
+            }
+
+        for (directory, recursive), graph_summary in results.items():
+            with self.subTest(directory=directory, recursive=recursive):
+                self.assertEqual(
+                    graph_summary, self.summary(self.resolve(directory, recursive))
+                )
+
+    def test_graph_matches_per_file_below_a_merge(self):
+        self.make_history()
+        self.make_merge_keeping_side()
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+
+        for directory in (self.repo, self.repo / "src"):
+            with self.subTest(directory=directory):
+                self.assertEqual(
+                    self.summary(self.resolve_graph(directory)),
+                    self.summary(self.resolve_per_file(directory)),
+                )
+
+    def test_untracked_files_do_not_keep_the_graph_walk_going(self):
+        self.commit("old", {"src/b.txt": "b\n", "a.txt": "a\n"})
+        for number in range(5):
+            self.commit(f"src {number}", {"src/b.txt": f"{number}\n"})
+        self.commit("a", {"a.txt": "a2\n"})
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+        (self.repo / "untracked.txt").write_text("u\n")
+        (self.repo / "new").mkdir()
+        (self.repo / "new" / "c.txt").write_text("c\n")
+        visited = []
+        open_commit_graph = MODULE["open_commit_graph"]
+
+        def recording_graph(git_root):
+            graph = open_commit_graph(git_root)
+            parents = graph.parents
+
+            def recording_parents(pos):
+                visited.append(pos)
+                return parents(pos)
+
+            graph.parents = recording_parents
+            return graph
+
+        with mock.patch.dict(
+            MODULE["iter_files_graph_or_walk"].__globals__,
+            {"open_commit_graph": recording_graph},
+        ):
+            # src/ last changed one commit below HEAD.
+            for tree, commits in ((False, 1), (True, 2)):
+                with self.subTest(tree=tree):
+                    visited.clear()
+                    messages = {
+                        info.filepath: info.commit_info
+                        for info in self.in_repo(
+                            MODULE["process_directory"],
+                            str(self.repo),
+                            False,
+                            False,
+                            "graph",
+                            False,
+                            tree,
+                        )
+                    }
+                    self.assertNotIn("untracked.txt", messages)
+                    self.assertNotIn("new/", messages)
+                    self.assertEqual(len(visited), commits)
+
+    def test_graph_falls_back_to_walk_without_commit_graph(self):
+        self.make_merged_history()
+
+        self.assertEqual(
+            self.summary(self.resolve_graph(self.repo)),
+            self.summary(self.resolve(self.repo)),
+        )
+
+    def test_graph_falls_back_to_walk_when_head_is_newer_than_graph(self):
+        self.make_merged_history()
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+        self.commit("after graph", {"src/b.txt": "after\n"})
+
+        messages = {
+            info.filepath: info.commit_info for info in self.resolve_graph(self.repo)
+        }
+
+        self.assertIn("after graph", messages["src/b.txt"])
+
+    def test_bloom_filters_contain_every_changed_path(self):
+        self.commit("initial", {"a.txt": "a\n", "dir/\u00fcber.txt": "u\n"})
+        self.commit("touch", {"dir/\u00fcber.txt": "u2\n"})
+        self.git("commit-graph", "write", "--reachable", "--changed-paths")
+        graph = MODULE["open_commit_graph"](self.repo)
+        self.addCleanup(graph.close)
+
+        head = graph.lookup(self.git("rev-parse", "HEAD").strip())
+        bloom_filter = graph.bloom_filter(head)
+
+        for path in ("dir", "dir/\u00fcber.txt"):
+            with self.subTest(path=path):
+                self.assertTrue(
+                    MODULE["bloom_maybe_contains"](bloom_filter, graph.bloom_key(path))
+                )
+
+    def test_murmur3_matches_reference_values(self):
+        murmur3 = MODULE["murmur3_32"]
+
+        self.assertEqual(murmur3(0, b"", False), 0)
+        self.assertEqual(murmur3(0, b"Hello world!", False), 0x627B0C2C)
+        self.assertEqual(
+            murmur3(0, b"The quick brown fox jumps over the lazy dog", False),
+            0x2E4FF723,
+        )
+
+
+class MostRecentTest(unittest.TestCase):
+    def info(self, filepath: str, timestamp: int):
+        return MODULE["FileCommitInfo"](filepath, timestamp, f"commit {timestamp}")
+
+    def test_batches_are_ranked_at_the_end(self):
+        batches = (
+            batch
+            for batch in (
+                [self.info("b", 5), self.info("a", 5)],
+                [self.info("c", 7), self.info("d", 1)],
+                [self.info("e", 2), self.info("f", 1), self.info("g", 9)],
+            )
+        )
+
+        self.assertEqual(
+            [info.filepath for info in MODULE["iter_most_recent"](batches, 3)],
+            ["g", "c", "a"],
+        )
+
+    def test_null_records_keep_columns_apart(self):
+        line = MODULE["format_stream_line"](self.info("dir/a b", 1), True)
+
+        self.assertEqual(line, "dir/a b\tcommit 1\0")
+
+
+class SubmoduleTest(GitRepositoryTestCase):
+    def make_repository(self, path: Path, files: dict[str, str]) -> None:
+        environment = {**os.environ, **GIT_ENVIRONMENT}
+        path.mkdir(parents=True)
+        for relative_path, contents in files.items():
+            (path / relative_path).write_text(contents)
+        for args in (
+            ("init", "-q", "-b", "main"),
+            ("add", "-A"),
+            ("commit", "-q", "-m", f"{path.name} files"),
+        ):
+            subprocess.run(
+                ["git", *args],
+                cwd=path,
+                env=environment,
+                check=True,
+                capture_output=True,
+            )
+
+    def test_nested_repositories_are_listed_with_their_own_history(self):
+        self.make_history()
+        library_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(library_directory.cleanup)
+        library = Path(library_directory.name) / "library"
+        self.make_repository(library, {"lib.c": "l\n"})
+        self.git(
+            "-c",
+            "protocol.file.allow=always",
+            "submodule",
+            "add",
+            "-q",
+            str(library),
+            "src/library",
+        )
+        self.commit("add library", {})
+        self.make_repository(self.repo / "vendor" / "tool", {"tool.py": "t\n"})
+
+        for engine in MODULE["ENGINES"]:
+            with self.subTest(engine=engine):
+                batches = self.in_repo(
+                    lambda: list(
+                        MODULE["iter_directory"](
+                            str(self.repo), True, engine=engine, recurse_submodules=True
+                        )
+                    )
+                )
+                files_info = {
+                    info.filepath: info.commit_info
+                    for batch in batches
+                    for info in batch
+                }
+                self.assertEqual(
+                    sorted(files_info),
+                    [
+                        ".gitmodules",
+                        "a.txt",
+                        "src/b.txt",
+                        "src/d.txt",
+                        "src/library/lib.c",
+                        "untracked.txt",
+                        "vendor/tool/tool.py",
+                    ],
+                )
+                self.assertIn("library files", files_info["src/library/lib.c"])
+                self.assertIn("tool files", files_info["vendor/tool/tool.py"])
+
+
+class OwnershipTest(GitRepositoryTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.commit("initial", {"a.txt": "1\n2\n3\n", "src/b.txt": "1\n2\n"})
+        (self.repo / "src" / "b.txt").write_text("1\nchanged\n")
+        self.git("commit", "-q", "-a", "--author=Other <other@example.com>", "-m", "b")
+
+    def load(self, directory: Path):
+        return self.in_repo(MODULE["load_ownership"], directory)
+
+    def test_lines_are_counted_per_author_and_directory(self):
+        ownership = self.load(self.repo)
+
+        self.assertEqual(
+            ownership, {"a.txt": {"Tester": 3}, "src/b.txt": {"Tester": 1, "Other": 1}}
+        )
+        self.assertEqual(
+            MODULE["aggregate_ownership"](ownership, True),
+            {"": {"Tester": 4, "Other": 1}, "src": {"Tester": 1, "Other": 1}},
+        )
+        self.assertEqual(
+            self.load(self.repo / "src"), {"b.txt": ownership["src/b.txt"]}
+        )
+
+    def test_only_changed_blobs_are_blamed_again(self):
+        self.load(self.repo)
+        self.commit("touch a", {"a.txt": "1\n2\n3\n4\n"})
+
+        blamed = []
+        blame_authors = MODULE["blame_authors"]
+
+        def record(start_path, path):
+            blamed.append(path)
+            return blame_authors(start_path, path)
+
+        with mock.patch.dict(
+            MODULE["iter_blames"].__globals__, {"blame_authors": record}
+        ):
+            ownership = self.load(self.repo)
+
+        self.assertEqual(blamed, ["a.txt"])
+        self.assertEqual(ownership["a.txt"], {"Tester": 4})
+
+
+class ProfileTest(GitRepositoryTestCase):
+    def test_nested_phases_are_charged_once(self):
+        profiler = MODULE["Profiler"]()
+        profiler.enabled = True
+        clock = iter([0.0, 1.0, 3.0, 6.0, 10.0, 15.0, 21.0, 28.0])
+
+        def batches():
+            with profiler.phase("ls-files"):
+                pass
+            yield 1
+
+        with mock.patch.object(MODULE["time"], "perf_counter", lambda: next(clock)):
+            with profiler.phase("render"):
+                self.assertEqual(list(profiler.iterate("resolve", batches())), [1])
+
+        self.assertEqual(
+            profiler.phases,
+            {"render": 1.0 + 5.0 + 7.0, "resolve": 2.0 + 4.0 + 6.0, "ls-files": 3.0},
+        )
+
+    def test_subprocesses_from_threads_are_all_counted(self):
+        profiler = MODULE["Profiler"]()
+        popen = subprocess.Popen
+
+        profiler.enable()
+        try:
+            threads = [
+                threading.Thread(target=subprocess.run, args=(["true"],))
+                for _ in range(16)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            profiler.disable()
+
+        self.assertIs(subprocess.Popen, popen)
+        self.assertEqual(profiler.spawned, 16)
+        self.assertEqual(len(profiler.latencies), 16)
+
+    def test_profile_json_reports_phases_and_subprocesses(self):
+        self.make_history()
+        report_path = self.repo / "profile.json"
+
+        subprocess.run(
+            ["python3", str(SCRIPT), "-r", "--profile-json", str(report_path), "."],
+            cwd=self.repo,
+            capture_output=True,
+            check=True,
+        )
+        report = json.loads(report_path.read_text())
+
+        self.assertEqual(list(report["phases"]), list(MODULE["PROFILE_PHASES"]))
+        self.assertGreater(report["phases"]["resolve"], 0)
+        self.assertGreaterEqual(report["subprocesses"]["count"], 2)
+        self.assertLessEqual(
+            report["subprocesses"]["p99_seconds"],
+            report["subprocesses"]["total_seconds"],
+        )
+        self.assertGreater(report["peak_rss_kb"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import json
+from pathlib import Path
+import runpy
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1]
+    / "private_dot_config/my-scripts/bin/executable_git_blame_dir_bench.py"
+)
+MODULE = runpy.run_path(str(SCRIPT))
+
+
+class GitBlameDirBenchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.repo = Path(temporary_directory.name).resolve() / "repo"
+
+    def git(self, *args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=self.repo, capture_output=True, text=True, check=True
+        ).stdout
+
+    def test_generates_requested_history(self):
+        spec = MODULE["RepoSpec"](files=40, depth=2, commits=25, rename_rate=0.5)
+
+        MODULE["generate_repo"](self.repo, spec)
+
+        self.assertEqual(self.git("rev-list", "--count", "HEAD").strip(), "25")
+        self.assertEqual(len(self.git("ls-files").splitlines()), 40)
+        self.assertEqual(self.git("status", "--porcelain"), "")
+        self.assertTrue((self.repo / ".git/objects/info/commit-graph").is_file())
+        renames = self.git("log", "--diff-filter=R", "-M", "--format=%H")
+        self.assertTrue(renames.strip())
+
+    def test_same_seed_builds_same_repository(self):
+        spec = MODULE["RepoSpec"](files=10, commits=5)
+        MODULE["generate_repo"](self.repo, spec)
+        first = self.git("rev-parse", "HEAD")
+
+        other = self.repo.with_name("other")
+        MODULE["generate_repo"](other, spec)
+
+        self.assertEqual(
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=other,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout,
+            first,
+        )
+
+    def test_measure_reports_json_for_one_case(self):
+        MODULE["generate_repo"](self.repo, MODULE["RepoSpec"](files=30, commits=10))
+
+        result = subprocess.run(
+            [
+                sys.executable,
+                str(SCRIPT),
+                "measure",
+                "process_directory",
+                str(self.repo),
+                "--engine",
+                "walk",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        measurement = json.loads(result.stdout)
+
+        self.assertEqual(measurement["results"], 30)
+        self.assertEqual(measurement["engine"], "walk")
+        self.assertLessEqual(measurement["subprocesses"], 3)
+        self.assertGreater(measurement["peak_rss_kb"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+
+import contextlib
+import curses
+import io
+import json
+from pathlib import Path
+import os
+import runpy
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pygments.lexers.c_cpp import CppLexer
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1]
+    / "private_dot_config/my-scripts/bin/executable_stack-viewer.py"
+)
+MODULE = runpy.run_path(str(SCRIPT))
+SEPARATOR = MODULE["SEPARATOR"]
+
+TRACE = f"""\
+{SEPARATOR}
+#0 0x00007f01 in parse(char const*) at src/parser.cc:42:7
+      41:   int x = 0;
+      42:   return *p;
+#1 0x00007f02 in main at src/main.cc:10
+#2 0x00007f03 in __libc_start_main at libc.so.6
+"""
+
+
+class FakeWindow:
+    def __init__(self, keys, height=10, width=80):
+        self.keys = list(keys)
+        self.height = height
+        self.width = width
+        # Rows cleared before each getch, i.e. redrawn in that frame.
+        self.frames = []
+        self.moved = []
+        self.text = {}
+        self.headers = []
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def clear(self):
+        self.text.clear()
+
+    def erase(self):
+        self.text.clear()
+
+    def move(self, y, x):
+        self.moved.append(y)
+
+    def clrtoeol(self):
+        self.text[self.moved[-1]] = ""
+
+    def addstr(self, y, x, text, attr=0):
+        line = self.text.get(y, "")
+        self.text[y] = line[:x].ljust(x) + text
+
+    def refresh(self):
+        pass
+
+    def timeout(self, delay):
+        self.timeout_ms = delay
+
+    def getch(self):
+        self.headers.append(self.text.get(0, ""))
+        self.frames.append(self.moved)
+        self.moved = []
+        return ord(self.keys.pop(0))
+
+
+class StackViewerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        for name, value in (
+            ("color_pair", lambda number: number << 8),
+            ("has_colors", lambda: False),
+            ("curs_set", lambda visibility: None),
+        ):
+            patcher = mock.patch.object(curses, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(
+            MODULE["code_spans"].__globals__,
+            {"token_colors": {}, "lexer": CppLexer()},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        MODULE["line_spans"].cache_clear()
+
+
+class LineSpansTest(StackViewerTestCase):
+    def test_frame_regex_splits_a_frame_line(self):
+        match = MODULE["FRAME_REGEX"].match(TRACE.splitlines()[1])
+
+        self.assertEqual(match.group("frame"), "0")
+        self.assertEqual(match.group("func"), "parse(char const*)")
+        self.assertEqual(match.group("file"), "src/parser.cc")
+        self.assertEqual((match.group("line"), match.group("col")), ("42", "7"))
+
+    def test_stacktrace_spans_color_file_and_line(self):
+        spans = MODULE["line_spans"](TRACE.splitlines()[1])
+
+        self.assertIn(("src/parser.cc", curses.color_pair(10)), spans)
+        self.assertIn((":42", curses.color_pair(11)), spans)
+        self.assertEqual(spans[0], ("#0  0x00007f01", curses.color_pair(9)))
+        self.assertNotIn("\n", "".join(text for text, _ in spans))
+
+    def test_spans_are_cached_per_line(self):
+        line_spans = MODULE["line_spans"]
+        for line in TRACE.splitlines() * 3:
+            line_spans(line)
+
+        self.assertEqual(line_spans.cache_info().misses, 6)
+        self.assertEqual(line_spans.cache_info().hits, 12)
+
+    def test_lines_are_clipped_to_the_width(self):
+        window = FakeWindow([], width=20)
+
+        MODULE["render_trace_line"](window, 3, 0, TRACE.splitlines()[1], 0, 20)
+
+        self.assertEqual(window.text[3], "#0  0x00007f01 in pa")
+
+
+class TraceIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.log = os.path.join(temporary_directory.name, "app.log")
+
+    def load(self, content: bytes):
+        with open(self.log, "wb") as f:
+            f.write(content)
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        return traces
+
+    def test_splits_like_the_whole_file_would(self):
+        content = (
+            f"starting\n{SEPARATOR}\n#0 0x1 in a at a.c:1\n\n"
+            f"{SEPARATOR}   \n\n{SEPARATOR}\n#0 0x2 in b at b.c:2\nexit\n"
+        )
+
+        traces = self.load(content.encode())
+
+        parts = [part.strip() for part in content.split(SEPARATOR) if part.strip()]
+        self.assertEqual(list(traces), [f"{SEPARATOR}\n{part}" for part in parts])
+        self.assertEqual(len(traces), 3)
+        with self.assertRaises(IndexError):
+            traces[3]
+
+    def test_traces_are_decoded_on_demand(self):
+        traces = self.load(
+            f"{SEPARATOR}\n#0 caf\xe9\n{SEPARATOR}\n#0 ok\n".encode("latin-1")
+        )
+
+        self.assertEqual(traces.decode.cache_info().currsize, 0)
+        self.assertEqual(traces[0], f"{SEPARATOR}\n#0 caf\ufffd")
+        traces[0]
+        self.assertEqual(traces.decode.cache_info().currsize, 1)
+        self.assertEqual(traces.decode.cache_info().hits, 1)
+
+    def test_empty_file_has_no_traces(self):
+        self.assertFalse(self.load(b""))
+
+    def test_update_indexes_appended_traces(self):
+        traces = self.load(f"{SEPARATOR}\n#0 a\n".encode())
+        self.assertEqual(traces[0], f"{SEPARATOR}\n#0 a")
+        self.assertFalse(traces.update())
+
+        # The next separator arrives in two writes.
+        with open(self.log, "ab") as f:
+            f.write(f"#1 b\n{SEPARATOR[:5]}".encode())
+        self.assertTrue(traces.update())
+        self.assertEqual(list(traces), [f"{SEPARATOR}\n#0 a\n#1 b\n{SEPARATOR[:5]}"])
+        with open(self.log, "ab") as f:
+            f.write(f"{SEPARATOR[5:]}\n#0 c\n".encode())
+        self.assertTrue(traces.update())
+
+        self.assertEqual(
+            list(traces), [f"{SEPARATOR}\n#0 a\n#1 b", f"{SEPARATOR}\n#0 c"]
+        )
+
+    def test_inotify_reports_writes(self):
+        traces = self.load(b"")
+        watcher = MODULE["Inotify"](self.log)
+        self.addCleanup(watcher.close)
+        self.assertFalse(watcher.read())
+
+        with open(self.log, "a") as f:
+            f.write(f"{SEPARATOR}\n#0 a\n")
+
+        self.assertTrue(watcher.read())
+        self.assertTrue(traces.update())
+        self.assertEqual(len(traces), 1)
+
+    def test_update_starts_over_after_truncation(self):
+        traces = self.load(f"{SEPARATOR}\n#0 a\n{SEPARATOR}\n#0 b\n".encode())
+        with open(self.log, "wb") as f:
+            f.write(f"{SEPARATOR}\n#0 c\n".encode())
+
+        self.assertTrue(traces.update())
+        self.assertEqual(list(traces), [f"{SEPARATOR}\n#0 c"])
+
+
+OTHER_TRACE = f"""\
+{SEPARATOR}
+#0 0x00007f09 in abort at abort.c:79
+#1 0x00007f0a in main at src/main.cc:12
+"""
+# TRACE again, from another build.
+MOVED_TRACE = TRACE.replace("0x00007f0", "0x5555").replace(":42:7", ":44:7")
+
+
+class TraceClustersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.log = os.path.join(temporary_directory.name, "app.log")
+
+    def write(self, content: str, mode: str = "w") -> None:
+        with open(self.log, mode) as f:
+            f.write(content)
+
+    def test_frame_signature_ignores_addresses_and_lines(self):
+        frame_signature = MODULE["frame_signature"]
+
+        self.assertEqual(
+            frame_signature(TRACE.splitlines()[1]),
+            "parse at src/parser.cc",
+        )
+        self.assertEqual(frame_signature("#12 0xdeadbeef in ?? ()"), "in ?? ()")
+
+    def test_traces_cluster_by_frames(self):
+        self.write(TRACE + OTHER_TRACE + MOVED_TRACE)
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        clusters = MODULE["TraceClusters"](traces)
+
+        clusters.update()
+
+        by_count = clusters.by_count()
+        self.assertEqual([list(c.traces) for c in by_count], [[0, 2], [1]])
+        self.assertEqual(
+            by_count[1].frames, ["abort at abort.c", "main at src/main.cc"]
+        )
+        # Hashing reads traces without filling the display cache.
+        self.assertEqual(traces.decode.cache_info().currsize, 0)
+
+    def test_argument_values_do_not_split_a_cluster(self):
+        self.write(
+            f"{SEPARATOR}\n#0 0x55 in handle (req=0x55, n=5) at server.cc:3\n"
+            f"{SEPARATOR}\n#0 0x66 in handle (req=0x66, n=6) at server.cc:3\n"
+        )
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        clusters = MODULE["TraceClusters"](traces)
+
+        clusters.update()
+
+        self.assertEqual([list(c.traces) for c in clusters.by_count()], [[0, 1]])
+        self.assertEqual(clusters.by_count()[0].frames, ["handle at server.cc"])
+
+    def test_update_rehashes_a_growing_last_trace(self):
+        self.write(TRACE + SEPARATOR + "\n#0 0x1 in abort at abort.c:79\n")
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        clusters = MODULE["TraceClusters"](traces)
+        clusters.update()
+        self.assertEqual(len(clusters.clusters), 2)
+
+        self.write("#1 0x2 in main at src/main.cc:12\n" + MOVED_TRACE, "a")
+        traces.update()
+        clusters.update()
+
+        self.assertEqual([list(c.traces) for c in clusters.by_count()], [[0, 2], [1]])
+        self.assertEqual(clusters.by_count()[1].frames, trace_frames(OTHER_TRACE))
+
+
+def trace_frames(trace: str) -> list[str]:
+    return MODULE["trace_frames"](trace)
+
+
+class FakeWatcher:
+    def __init__(self, log: str, appended: str):
+        self.log = log
+        self.appended = appended
+
+    def read(self):
+        if not self.appended:
+            return False
+        with open(self.log, "a") as f:
+            f.write(self.appended)
+        self.appended = ""
+        return True
+
+
+class SyncTraceSearch(MODULE["TraceSearch"]):
+    """Indexes everything before the viewer starts, so tests see all hits."""
+
+    def start(self):
+        while self.index_batch():
+            pass
+        super().start()
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.log = os.path.join(temporary_directory.name, "app.log")
+        with open(self.log, "w") as f:
+            f.write(TRACE + OTHER_TRACE + MOVED_TRACE + f"{SEPARATOR}\nno frames\n")
+
+    def export(self, name: str) -> str:
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        out = io.StringIO()
+        MODULE["EXPORTERS"][name](traces, out)
+        return out.getvalue()
+
+    def test_frame_name_drops_arguments_and_separators(self):
+        frame_name = MODULE["frame_name"]
+
+        self.assertEqual(frame_name(TRACE.splitlines()[1]), "parse")
+        self.assertEqual(frame_name("#3 0x1 in a;b (x=1)"), "a:b")
+        self.assertEqual(frame_name("#4 0xdeadbeef"), "??")
+
+    def test_folded_stacks_count_identical_call_paths(self):
+        self.assertEqual(
+            self.export("folded"),
+            "__libc_start_main;main;parse 2\nmain;abort 1\n",
+        )
+
+    def test_json_has_one_object_per_trace(self):
+        records = [json.loads(line) for line in self.export("json").splitlines()]
+
+        self.assertEqual([record["trace"] for record in records], [1, 2, 3, 4])
+        self.assertEqual(
+            records[0]["frames"][0],
+            {
+                "frame": 0,
+                "address": "0x00007f01",
+                "function": "parse(char const*)",
+                "file": "src/parser.cc",
+                "line": 42,
+                "column": 7,
+            },
+        )
+        self.assertEqual(records[1]["frames"][1]["function"], "main")
+        self.assertEqual(records[2]["frames"][0]["address"], "0x55551")
+        self.assertEqual(records[3]["frames"], [])
+        with open(self.log, "rb") as f:
+            f.seek(records[1]["offset"])
+            self.assertTrue(f.read().lstrip().startswith(b"#0 0x00007f09 in abort"))
+
+    def test_export_does_not_start_curses(self):
+        stdout = io.StringIO()
+        with (
+            mock.patch("sys.argv", ["stack-viewer.py", "--export", "folded", self.log]),
+            mock.patch.object(curses, "wrapper", side_effect=AssertionError),
+            contextlib.redirect_stdout(stdout),
+            self.assertRaises(SystemExit) as exit,
+        ):
+            runpy.run_path(str(SCRIPT), run_name="__main__")
+
+        self.assertEqual(exit.exception.code, 0)
+        self.assertIn("main;abort 1", stdout.getvalue())
+
+    def test_export_works_without_pygments(self):
+        stdout = io.StringIO()
+        # A None entry makes the import fail as if the package were missing.
+        missing = dict.fromkeys(
+            ("pygments", "pygments.lexers", "pygments.lexers.c_cpp", "pygments.token")
+        )
+        with (
+            mock.patch("sys.argv", ["stack-viewer.py", "--export", "folded", self.log]),
+            mock.patch.dict("sys.modules", missing),
+            contextlib.redirect_stdout(stdout),
+            self.assertRaises(SystemExit) as exit,
+        ):
+            runpy.run_path(str(SCRIPT), run_name="__main__")
+
+        self.assertEqual(exit.exception.code, 0)
+        self.assertIn("main;abort 1", stdout.getvalue())
+
+
+class TraceSearchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        log = os.path.join(temporary_directory.name, "app.log")
+        with open(log, "w") as f:
+            f.write(OTHER_TRACE + TRACE + MOVED_TRACE)
+        self.traces = MODULE["load_traces"](log)
+        self.addCleanup(self.traces.close)
+
+    def hits(self, search, query: str) -> list[tuple[int, int]]:
+        bits = MODULE["FRAME_BITS"]
+        return [(hit >> bits, hit & ((1 << bits) - 1)) for hit in search.search(query)]
+
+    def test_frame_terms(self):
+        frame_terms = MODULE["frame_terms"]
+
+        self.assertEqual(frame_terms(TRACE.splitlines()[1]), ("parse", "src/parser.cc"))
+        self.assertEqual(frame_terms("#5 0x1 in Foo::Bar ()"), ("foo::bar",))
+
+    def test_search_finds_functions_and_files_in_every_trace(self):
+        search = MODULE["TraceSearch"](self.traces)
+        while search.index_batch():
+            pass
+
+        self.assertEqual(search.indexed, 3)
+        self.assertEqual(self.hits(search, "PARSE"), [(1, 0), (2, 0)])
+        self.assertEqual(self.hits(search, "main.cc"), [(0, 1), (1, 1), (2, 1)])
+        self.assertEqual(self.hits(search, "libc_start"), [(1, 2), (2, 2)])
+        self.assertEqual(self.hits(search, "nothing"), [])
+
+    def test_background_thread_indexes_after_notify(self):
+        search = MODULE["TraceSearch"](self.traces, follow=True)
+        search.start()
+        self.addCleanup(search.stop)
+
+        for _ in range(100):
+            if search.indexed == 2:
+                break
+            time.sleep(0.01)
+        # The last trace of a followed file may still grow.
+        self.assertEqual(search.indexed, 2)
+
+
+class RedrawTest(StackViewerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.log = os.path.join(temporary_directory.name, "app.log")
+        patcher = mock.patch.dict(
+            MODULE["main"].__globals__, {"TraceSearch": SyncTraceSearch}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, content: str):
+        with open(self.log, "w") as f:
+            f.write(content)
+        traces = MODULE["load_traces"](self.log)
+        self.addCleanup(traces.close)
+        return traces
+
+    def test_moving_the_selection_redraws_only_changed_rows(self):
+        window = FakeWindow("jjtq")
+
+        MODULE["main"](window, self.load(TRACE))
+
+        # Header and the three frames; empty rows are left alone.
+        self.assertEqual(window.frames[0], [0, 1, 2, 3])
+        # Header and the two frames whose highlight moved.
+        self.assertEqual(window.frames[1], [0, 1, 2])
+        self.assertEqual(window.frames[2], [0, 2, 3])
+        # Toggling the full view changes rows 1 to 6.
+        self.assertEqual(window.frames[3], [0, 1, 2, 3, 4, 5, 6])
+        self.assertIn("src/main.cc:10", window.text[5])
+
+    def test_stepping_through_a_crash_cluster(self):
+        window = FakeWindow("c\nlcchq")
+
+        MODULE["main"](window, self.load(OTHER_TRACE + TRACE + MOVED_TRACE))
+
+        self.assertIn("2 unique crashes in 3 traces", window.headers[1])
+        self.assertIn("Stack trace 2/3 (Occurrence 1/2)", window.headers[2])
+        self.assertIn("Stack trace 3/3 (Occurrence 2/2)", window.headers[3])
+        # Back to all traces, at the one that was shown.
+        self.assertIn("Stack trace 3/3 (Frame", window.headers[5])
+        self.assertIn("Stack trace 2/3 (Frame", window.headers[6])
+
+    def test_search_jumps_between_hits(self):
+        window = FakeWindow("j/parser\nnnNq")
+
+        MODULE["main"](window, self.load(OTHER_TRACE + TRACE + MOVED_TRACE))
+
+        self.assertIn(
+            "Stack trace 2/3 (Frame 1/3) [/parser: hit 1/2]", window.headers[9]
+        )
+        self.assertIn(
+            "Stack trace 3/3 (Frame 1/3) [/parser: hit 2/2]", window.headers[10]
+        )
+        # n wraps around to the first hit, N back to the last.
+        self.assertIn("Stack trace 2/3 (Frame 1/3)", window.headers[11])
+        self.assertIn("Stack trace 3/3 (Frame 1/3)", window.headers[12])
+
+    def test_choosing_from_no_clusters(self):
+        traces = self.load("")
+        clusters = MODULE["TraceClusters"](traces)
+        clusters.update()
+        window = FakeWindow("\njq")
+
+        cluster = MODULE["choose_cluster"](window, traces, clusters)
+
+        self.assertIsNone(cluster)
+        self.assertIn("0 unique crashes in 0 traces", window.headers[0])
+        self.assertEqual(window.text[1], "No stack traces yet.")
+
+    def test_follow_updates_the_trace_count(self):
+        traces = self.load(TRACE)
+        window = FakeWindow("jlq")
+
+        MODULE["main"](window, traces, FakeWatcher(self.log, TRACE))
+
+        self.assertIn("Stack trace 1/1 ", window.headers[0])
+        self.assertIn("Stack trace 1/2 ", window.headers[1])
+        self.assertIn("Stack trace 2/2 ", window.headers[2])
+        self.assertEqual(window.timeout_ms, MODULE["FOLLOW_POLL_INTERVAL"])
+
+
+if __name__ == "__main__":
+    unittest.main()